@@ -0,0 +1,113 @@
+"""Stress benchmark of event cancellation, with a high cancel ratio.
+
+Models a bandwidth-sharing network: `--inflight` completion events are
+pending, and every processed event moves `--moves` random pending ones, like a
+flow start or end changing the rates of the other flows. Compares reschedule()
+with compaction of the tombstones (default threshold), without compaction, and
+without cancellation at all (stale events are popped and ignored).
+Run from the repository root:
+    python benchmarks/bench_cancel.py --inflight 2000 --moves 8 --events 50000
+"""
+
+import argparse
+import contextlib
+import os
+import random
+import sys
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simulation_engine import (  # noqa: E402
+    CompactSimulationEngine,
+    EventHandle,
+    Handler,
+    register_event_type,
+)
+
+COMPLETION: int = register_event_type("BENCH_COMPLETION")
+
+
+class Completions:
+    """Pending completion events, each one processed moves `moves` others."""
+
+    def __init__(
+        self, engine: CompactSimulationEngine, args: argparse.Namespace, mode: str
+    ) -> None:
+        self.engine: CompactSimulationEngine = engine
+        self.rng: random.Random = random.Random(args.seed)
+        self.moves: int = args.moves
+        self.remaining: int = args.events
+        self.mode: str = mode
+        self.handles: List[EventHandle] = []
+        self.versions: List[int] = []
+        self.peak_queue: int = 0
+
+    def event_handlers(self) -> Dict[int, Handler]:
+        return {COMPLETION: self.on_completion}
+
+    def schedule(self, slot: int, timestamp: int) -> EventHandle:
+        if self.mode == "stale":
+            self.versions[slot] += 1
+            return self.engine.post(
+                timestamp, COMPLETION, 0, (slot, self.versions[slot])
+            )
+        return self.engine.post(timestamp, COMPLETION, 0, (slot, 0))
+
+    def on_completion(self, timestamp: int, target_id: int, payload: tuple) -> None:
+        slot, version = payload
+        if self.mode == "stale" and version != self.versions[slot]:
+            return  # stale event
+        self.peak_queue = max(self.peak_queue, len(self.engine.event_queue))
+        if self.remaining == 0:
+            return
+        self.remaining -= 1
+        rng = self.rng
+        self.handles[slot] = self.schedule(slot, timestamp + rng.randrange(1, 10000))
+        for _ in range(self.moves):
+            other = rng.randrange(len(self.handles))
+            if other == slot:
+                continue
+            new_ts = timestamp + rng.randrange(1, 10000)
+            if self.mode == "stale":
+                self.handles[other] = self.schedule(other, new_ts)
+            else:
+                self.handles[other] = self.engine.reschedule(
+                    self.handles[other], new_ts
+                )
+
+
+def bench(args: argparse.Namespace, mode: str) -> None:
+    engine = CompactSimulationEngine()
+    if mode == "no compaction":
+        engine.compact_threshold = sys.maxsize
+    completions = Completions(engine, args, mode)
+    engine.register_object(0, completions)
+    rng = random.Random(args.seed)
+    for slot in range(args.inflight):
+        completions.versions.append(0)
+        completions.handles.append(completions.schedule(slot, rng.randrange(10000)))
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        engine.run()
+        elapsed = time.perf_counter() - start
+    print(
+        f"{mode:>14}: {elapsed:8.3f} s, {args.events / elapsed:10,.0f} completions/s, "
+        f"peak queue {completions.peak_queue:9,}, cancelled {engine.events_cancelled:9,}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--inflight", type=int, default=2000)
+    parser.add_argument("--moves", type=int, default=8)
+    parser.add_argument("--events", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for mode in ("compaction", "no compaction", "stale"):
+        bench(args, mode)
+
+
+if __name__ == "__main__":
+    main()
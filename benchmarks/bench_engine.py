@@ -0,0 +1,78 @@
+"""Events-per-second benchmark of SimulationEngine against CompactSimulationEngine.
+
+Run from the repository root:
+    python benchmarks/bench_engine.py --gpus 512 --instructions 64
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+import time
+from typing import List, Type
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simulation_engine import CompactSimulationEngine, SimulationEngine  # noqa: E402
+from scheduler import make_scheduler  # noqa: E402
+from network import Network  # noqa: E402
+from gpu import GPU  # noqa: E402
+from program import Program  # noqa: E402
+
+
+def make_instructions(num_instructions: int) -> List[str]:
+    """Alternating compute and communication instructions."""
+    lines: List[str] = []
+    for i in range(num_instructions):
+        if i % 2 == 0:
+            lines.append(f"COMPUTE, ALL, , {1000000 * (1 + i % 7)}, EXECUTE")
+        else:
+            lines.append(f"COMMUNICATION, ALL, , {4096 * (1 + i % 5)}, ALL_REDUCE")
+    return lines
+
+
+def bench(
+    engine_cls: Type[SimulationEngine], scheduler: str, num_gpus: int, lines: List[str]
+) -> float:
+    """Runs one simulation and returns the events per second."""
+    engine = engine_cls(make_scheduler(scheduler))
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        network = Network(num_gpus, num_gpus, 25, "RING", engine)
+        engine.register_object(network.object_id, network)
+        program = Program.from_lines(lines)
+        gpus: List[GPU] = []
+        for gpu_id in range(num_gpus):
+            gpu = GPU(gpu_id, program, 200, 512, network, engine)
+            engine.register_object(gpu_id, gpu)
+            gpus.append(gpu)
+        for gpu in gpus:
+            gpu.start_gpu()
+        start = time.perf_counter()
+        engine.run()
+        elapsed = time.perf_counter() - start
+    return engine.events_processed / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--gpus", type=int, default=512)
+    parser.add_argument("--instructions", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--scheduler", default="HEAP", help="HEAP, CALENDAR or WHEEL")
+    args = parser.parse_args()
+
+    lines = make_instructions(args.instructions)
+    results = {}
+    for engine_cls in (SimulationEngine, CompactSimulationEngine):
+        rate = max(
+            bench(engine_cls, args.scheduler, args.gpus, lines)
+            for _ in range(args.repeat)
+        )
+        results[engine_cls.__name__] = rate
+        print(f"{engine_cls.__name__:>24}: {rate:12,.0f} events/s")
+    speedup = results["CompactSimulationEngine"] / results["SimulationEngine"]
+    print(f"{'speedup':>24}: {speedup:12.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Throughput of the flow-level network model with many concurrent flows.
+
+Each GPU sends flows of random sizes to random GPUs of its group (e.g. the
+all-to-all of MoE expert groups), starting at random times.
+Run from the repository root:
+    python benchmarks/bench_flows.py --gpus 1024 --group 8 --flows 8
+"""
+
+import argparse
+import contextlib
+import os
+import random
+import sys
+import time
+from typing import Dict, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simulation_engine import (  # noqa: E402
+    CompactSimulationEngine,
+    Handler,
+    register_event_type,
+)
+from network import Network  # noqa: E402
+
+FLOW_START: int = register_event_type("BENCH_FLOW_START")
+
+
+class FlowSource:
+    """Starts the flows given in the event payloads."""
+
+    def __init__(self, network: Network) -> None:
+        self.network: Network = network
+        self.finished: int = 0
+
+    def event_handlers(self) -> Dict[int, Handler]:
+        return {FLOW_START: self.on_flow_start}
+
+    def on_flow_start(
+        self, timestamp: int, target_id: int, payload: Tuple[int, int, int]
+    ) -> None:
+        src, dst, size_bytes = payload
+        assert self.network.flow_model is not None
+        self.network.flow_model.start_flow(
+            timestamp, src, dst, size_bytes, self.on_flow_done
+        )
+
+    def on_flow_done(self, timestamp: int) -> None:
+        self.finished += 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--gpus", type=int, default=1024)
+    parser.add_argument("--group", type=int, default=8)
+    parser.add_argument("--flows", type=int, default=8, help="flows per GPU")
+    parser.add_argument("--topology", default="FULLY_CONNECTED")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    engine = CompactSimulationEngine()
+    network = Network(
+        args.gpus, args.gpus, 25, args.topology, engine, network_model="FLOW"
+    )
+    engine.register_object(network.object_id, network)
+    source = FlowSource(network)
+    engine.register_object(args.gpus + 1, source)
+    for src in range(args.gpus):
+        base = src - src % args.group
+        for _ in range(args.flows):
+            dst = base + rng.randrange(args.group)
+            size_bytes = rng.randrange(1 << 16, 1 << 22)
+            engine.post(
+                rng.randrange(100000), FLOW_START, args.gpus + 1, (src, dst, size_bytes)
+            )
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        engine.run()
+        elapsed = time.perf_counter() - start
+    model = network.flow_model
+    assert model is not None and source.finished == args.gpus * args.flows
+    print(f"{'flows':>16}: {source.finished:12,}")
+    print(f"{'wall time':>16}: {elapsed:12.3f} s")
+    print(f"{'flows/s':>16}: {source.finished / elapsed:12,.0f}")
+    print(f"{'events/s':>16}: {engine.events_processed / elapsed:12,.0f}")
+    print(f"{'rescheduled':>16}: {model.rescheduled:12,}")
+    print(f"{'simulated time':>16}: {engine.current_time_ns:12,} ns")
+
+
+if __name__ == "__main__":
+    main()
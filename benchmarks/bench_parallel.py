@@ -0,0 +1,58 @@
+"""Speedup of the parallel engine over the sequential compact engine.
+
+Runs the same synthetic SPMD simulation sequentially, then with 2, 4, ... logical
+processes (up to the number of cores, at least 2), checks that the results are
+identical and prints the speedup.
+Run from the repository root:
+    python benchmarks/bench_parallel.py --gpus 256 --instructions 512
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_engine import make_instructions  # noqa: E402
+from main import read_system_config  # noqa: E402
+from parallel_engine import run_parallel, run_sequential  # noqa: E402
+from program import Program  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--gpus", type=int, default=256)
+    parser.add_argument("--instructions", type=int, default=512)
+    parser.add_argument("--max-lps", type=int, default=max(os.cpu_count() or 1, 2))
+    args = parser.parse_args()
+
+    config = read_system_config(os.path.join(REPO_DIR, "system_config.txt"))
+    config["NUM_GPUS"] = str(args.gpus)
+    programs = [Program.from_lines(make_instructions(args.instructions))] * args.gpus
+
+    start = time.perf_counter()
+    expected = run_sequential(programs, config)
+    baseline = time.perf_counter() - start
+    print(
+        f"  sequential: {baseline:8.2f} s, "
+        f"{expected.events_processed / baseline:12,.0f} events/s"
+    )
+    num_lps = 2
+    while num_lps <= args.max_lps:
+        start = time.perf_counter()
+        result = run_parallel(programs, config, num_lps)
+        elapsed = time.perf_counter() - start
+        assert result.finished == expected.finished, "results differ"
+        print(
+            f"{num_lps:>4} LPs:     {elapsed:8.2f} s, "
+            f"{result.events_processed / elapsed:12,.0f} events/s, "
+            f"speedup {baseline / elapsed:5.2f}x ({result.windows} windows)"
+        )
+        num_lps *= 2
+
+
+if __name__ == "__main__":
+    main()
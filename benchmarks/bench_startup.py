@@ -0,0 +1,106 @@
+"""Startup benchmark: time to first event of the simulator, by rank count.
+
+For every rank count and construction mode, "objects" (a GPU object per rank)
+or "arrays" (array-backed GPUs, see gpu_array.py), times build_simulation() on a
+synthetic trace and the start of the GPUs, which posts their first events. The
+time to first event is their sum: the engine can then dispatch its first
+event. Each case runs in its own child process, for its peak memory (maximum
+resident set size); the best of --repeat runs is kept. The results are printed
+as JSON, or written to --output.
+
+Run from the repository root:
+    python benchmarks/bench_startup.py --ranks 1000 10000 100000
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_suite import best_of, peak_rss_bytes  # noqa: E402
+from main import build_simulation  # noqa: E402
+from program import Program  # noqa: E402
+from synthetic_trace import generate_trace, system_config  # noqa: E402
+
+CONSTRUCTION_MODES: List[str] = ["objects", "arrays"]
+
+
+def run_case(case: Dict[str, Any]) -> Dict[str, Any]:
+    """Times the startup of one simulation case, in the current process."""
+    program = Program.from_lines(generate_trace(case["instructions"]))
+    config = system_config(case["ranks"])
+    start = time.perf_counter()
+    engine, gpus = build_simulation(
+        [program] * case["ranks"],
+        config,
+        True,
+        collapse=case["collapse"],
+        array_backed=case["mode"] == "arrays",
+    )
+    build_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for gpu in gpus:
+        gpu.start_gpu()
+    start_s = time.perf_counter() - start
+    return dict(
+        case,
+        name=f"{case['mode']}-r{case['ranks']}-i{case['instructions']}"
+        + ("-collapse" if case["collapse"] else ""),
+        build_s=build_s,
+        start_s=start_s,
+        first_event_s=build_s + start_s,
+        pending_events=engine.pending_events(),
+        peak_rss_bytes=peak_rss_bytes(),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ranks", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--instructions", type=int, default=64)
+    parser.add_argument("--modes", nargs="+", default=CONSTRUCTION_MODES)
+    parser.add_argument(
+        "--collapse", action="store_true", help="with the symmetry collapse"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="JSON file, stdout by default")
+    args = parser.parse_args()
+    for mode in args.modes:
+        if mode not in CONSTRUCTION_MODES:
+            parser.error(f"Unknown construction mode {mode}, {CONSTRUCTION_MODES}")
+
+    results: Dict[str, Any] = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cases": [],
+    }
+    for ranks, mode in itertools.product(args.ranks, args.modes):
+        case = {
+            "ranks": ranks,
+            "instructions": args.instructions,
+            "mode": mode,
+            "collapse": args.collapse,
+        }
+        result = best_of(run_case, case, args.repeat, "first_event_s")
+        results["cases"].append(result)
+        print(
+            f"{result['name']:>32}: build {result['build_s']:7.3f} s, "
+            f"first event at {result['first_event_s']:7.3f} s",
+            file=sys.stderr,
+        )
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
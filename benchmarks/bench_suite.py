@@ -0,0 +1,295 @@
+"""Benchmark suite: throughput, wall time and peak memory of the simulator, as JSON.
+
+Every case generates a synthetic trace (see synthetic_trace.py) for a GPU count,
+instruction count, communication fraction and message size, then times
+initialize_simulation() and the run (start of the GPUs and SimulationEngine.run)
+on an engine mode: "event" (Event objects), "compact" (tuples) or "batched"
+(tuples, with event batching), with a scheduler. Each case runs in its own
+child process, so its peak memory (the maximum resident set size) is not the
+one of the previous cases; the best of --repeat runs is kept. The parallel
+cases time parallel_engine.run_parallel() against the sequential compact engine
+on the largest trace.
+
+The results are printed as JSON, or written to --output. With --baseline, the
+events/s of each case are compared to a previous output, and the exit status
+is 1 if one is slower by more than --tolerance.
+Run from the repository root:
+    python benchmarks/bench_suite.py --output results.json
+    python benchmarks/bench_suite.py --baseline results.json --tolerance 0.2
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import initialize_simulation  # noqa: E402
+from parallel_engine import run_parallel, run_sequential  # noqa: E402
+from program import Program  # noqa: E402
+from synthetic_trace import generate_trace, system_config, write_files  # noqa: E402
+
+SUITE_VERSION: int = 1
+ENGINE_MODES: List[str] = ["event", "compact", "batched"]
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None  # type: ignore[assignment]
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Maximum resident set size of this process, None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def case_name(case: Dict[str, Any]) -> str:
+    return (
+        f"{case['engine']}-{case['scheduler'].lower()}-g{case['gpus']}"
+        f"-i{case['instructions']}-c{case['comm_fraction']}-m{case['message_bytes']}"
+    )
+
+
+def run_case(case: Dict[str, Any]) -> Dict[str, Any]:
+    """Times one simulation case, in the current process."""
+    lines = generate_trace(
+        case["instructions"], case["comm_fraction"], case["message_bytes"]
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        trace_path, config_path = write_files(tmp_dir, case["gpus"], lines)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            engine, gpus = initialize_simulation(
+                trace_path,
+                config_path,
+                compact_events=case["engine"] != "event",
+                scheduler=case["scheduler"],
+                batch_events=case["engine"] == "batched",
+            )
+            init_s = time.perf_counter() - start
+            start = time.perf_counter()
+            for gpu in gpus:
+                gpu.start_gpu()
+            engine.run()
+            run_s = time.perf_counter() - start
+    return dict(
+        case,
+        name=case_name(case),
+        init_s=init_s,
+        run_s=run_s,
+        wall_s=init_s + run_s,
+        events=engine.events_processed,
+        events_per_s=engine.events_processed / run_s if run_s else 0.0,
+        end_time_ns=engine.current_time_ns,
+        peak_rss_bytes=peak_rss_bytes(),
+    )
+
+
+def run_parallel_case(case: Dict[str, Any]) -> Dict[str, Any]:
+    """Times the parallel engine against the sequential compact engine."""
+    program = Program.from_lines(
+        generate_trace(
+            case["instructions"], case["comm_fraction"], case["message_bytes"]
+        )
+    )
+    config = system_config(case["gpus"])
+    programs = [program] * case["gpus"]
+    start = time.perf_counter()
+    expected = run_sequential(programs, config)
+    sequential_s = time.perf_counter() - start
+    start = time.perf_counter()
+    result = run_parallel(programs, config, case["lps"])
+    parallel_s = time.perf_counter() - start
+    if result.finished != expected.finished:
+        raise RuntimeError("The parallel results differ from the sequential ones")
+    return dict(
+        case,
+        name=f"parallel-{case['lps']}lps-g{case['gpus']}-i{case['instructions']}",
+        sequential_s=sequential_s,
+        parallel_s=parallel_s,
+        speedup=sequential_s / parallel_s if parallel_s else 0.0,
+        num_lps=result.num_lps,
+        windows=result.windows,
+        events=result.events_processed,
+        events_per_s=result.events_processed / parallel_s if parallel_s else 0.0,
+        peak_rss_bytes=peak_rss_bytes(),
+    )
+
+
+def _child(
+    conn: Connection, bench: Callable[[Dict[str, Any]], Dict[str, Any]], case: Any
+) -> None:
+    try:
+        conn.send(bench(case))
+    except Exception as error:
+        conn.send(error)
+    finally:
+        conn.close()
+
+
+def in_child(
+    bench: Callable[[Dict[str, Any]], Dict[str, Any]], case: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Runs a benchmark in a new process, for its own peak memory."""
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    parent_conn, child_conn = context.Pipe()
+    process = context.Process(target=_child, args=(child_conn, bench, case))
+    process.start()
+    child_conn.close()
+    try:
+        result = parent_conn.recv()
+    finally:
+        parent_conn.close()
+        process.join()
+    if isinstance(result, Exception):
+        raise result
+    return dict(result)
+
+
+def best_of(
+    bench: Callable[[Dict[str, Any]], Dict[str, Any]],
+    case: Dict[str, Any],
+    repeat: int,
+    key: str,
+) -> Dict[str, Any]:
+    """The run with the smallest `key` time, the peak memory is the largest."""
+    runs = [in_child(bench, case) for _ in range(max(repeat, 1))]
+    best = min(runs, key=lambda run: run[key])
+    peaks = [run["peak_rss_bytes"] for run in runs if run["peak_rss_bytes"]]
+    best["peak_rss_bytes"] = max(peaks) if peaks else None
+    best["repeat"] = len(runs)
+    return best
+
+
+def compare(
+    results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float
+) -> List[str]:
+    """The cases slower than the baseline by more than the tolerance."""
+    previous = {
+        case["name"]: case
+        for case in baseline.get("cases", []) + baseline.get("parallel", [])
+    }
+    regressions = []
+    for case in results["cases"] + results["parallel"]:
+        old = previous.get(case["name"])
+        if old is None or not old["events_per_s"]:
+            continue
+        ratio = case["events_per_s"] / old["events_per_s"]
+        case["baseline_ratio"] = ratio
+        if ratio < 1 - tolerance:
+            regressions.append(
+                f"{case['name']}: {case['events_per_s']:,.0f} events/s, "
+                f"{ratio:.2f}x the baseline {old['events_per_s']:,.0f}"
+            )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--gpus", type=int, nargs="+", default=[64, 512])
+    parser.add_argument("--instructions", type=int, nargs="+", default=[256])
+    parser.add_argument("--comm-fraction", type=float, nargs="+", default=[0.5])
+    parser.add_argument("--message-bytes", type=int, nargs="+", default=[1 << 20])
+    parser.add_argument("--engines", nargs="+", default=ENGINE_MODES)
+    parser.add_argument("--schedulers", nargs="+", default=["HEAP"])
+    parser.add_argument(
+        "--lps",
+        type=int,
+        nargs="*",
+        default=[2],
+        help="LPs of the parallel cases, none to skip them",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="JSON file, stdout by default")
+    parser.add_argument("--baseline", help="JSON output of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    for engine in args.engines:
+        if engine not in ENGINE_MODES:
+            parser.error(f"Unknown engine mode {engine}, {ENGINE_MODES}")
+
+    results: Dict[str, Any] = {
+        "version": SUITE_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "cases": [],
+        "parallel": [],
+    }
+    for (
+        gpus,
+        instructions,
+        comm_fraction,
+        message_bytes,
+        engine,
+        scheduler,
+    ) in itertools.product(
+        args.gpus,
+        args.instructions,
+        args.comm_fraction,
+        args.message_bytes,
+        args.engines,
+        args.schedulers,
+    ):
+        case = {
+            "gpus": gpus,
+            "instructions": instructions,
+            "comm_fraction": comm_fraction,
+            "message_bytes": message_bytes,
+            "engine": engine,
+            "scheduler": scheduler.upper(),
+        }
+        result = best_of(run_case, case, args.repeat, "run_s")
+        results["cases"].append(result)
+        print(
+            f"{result['name']:>48}: {result['events_per_s']:12,.0f} events/s, "
+            f"{result['wall_s']:8.3f} s",
+            file=sys.stderr,
+        )
+    for lps in args.lps:
+        case = {
+            "gpus": max(args.gpus),
+            "instructions": max(args.instructions),
+            "comm_fraction": args.comm_fraction[0],
+            "message_bytes": args.message_bytes[0],
+            "lps": lps,
+        }
+        result = best_of(run_parallel_case, case, args.repeat, "parallel_s")
+        results["parallel"].append(result)
+        print(
+            f"{result['name']:>48}: speedup {result['speedup']:5.2f}x "
+            f"({result['windows']} windows)",
+            file=sys.stderr,
+        )
+
+    regressions: List[str] = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+    for regression in regressions:
+        print(f"regression: {regression}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Scaling of the parameter sweep with the number of worker processes.
+
+Runs the same grid with 1, 2, 4, ... workers (up to the number of cores) on a
+synthetic SPMD trace and prints the speedup over one worker.
+Run from the repository root:
+    python benchmarks/bench_sweep.py --points 32 --instructions 2000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_engine import make_instructions  # noqa: E402
+from sweep import run_sweep  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=32)
+    parser.add_argument("--instructions", type=int, default=2000)
+    parser.add_argument("--gpus", type=int, default=64)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    points = [
+        {"NUM_GPUS": str(args.gpus), "NETWORK_BANDWIDTH": str(10 + i)}
+        for i in range(args.points)
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        trace = os.path.join(tmp, "trace.txt")
+        with open(trace, "w") as file:
+            file.write("\n".join(make_instructions(args.instructions)))
+        config = os.path.join(REPO_DIR, "system_config.txt")
+        baseline = 0.0
+        workers = 1
+        while workers <= args.max_workers:
+            start = time.perf_counter()
+            run_sweep(trace, config, points, workers)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(
+                f"{workers:>4} workers: {elapsed:8.2f} s, "
+                f"speedup {baseline / elapsed:5.2f}x"
+            )
+            workers *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Load time of a text trace against the same trace in the binary format.
+
+Run from the repository root:
+    python benchmarks/bench_trace_load.py --instructions 1000000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from binary_trace import convert_text_trace, load_program  # noqa: E402
+from program import Program, iter_input_lines  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--instructions", type=int, default=1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        text_path = os.path.join(tmp_dir, "trace.txt")
+        binary_path = os.path.join(tmp_dir, "trace.bin")
+        with open(text_path, "w") as file:
+            for i in range(args.instructions):
+                if i % 3 == 2:
+                    file.write(f"COMMUNICATION, ALL, , {4096 << (i % 8)}, ALL_REDUCE\n")
+                else:
+                    file.write(f"COMPUTE, ALL, , {1000000 * (1 + i % 7)}, EXECUTE\n")
+        convert_text_trace(text_path, binary_path)
+
+        start = time.perf_counter()
+        text_program = Program.from_lines(iter_input_lines(text_path))
+        text_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        binary_program = load_program(binary_path)
+        binary_s = time.perf_counter() - start
+
+        assert len(text_program) == len(binary_program) == args.instructions
+        print(f"{'text':>8}: {text_s:10.4f} s")
+        print(f"{'binary':>8}: {binary_s:10.4f} s")
+        del binary_program
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Synthetic SPMD traces for the benchmarks.
+
+A trace has `instructions` lines, a `comm_fraction` of them communications of
+about `message_bytes` bytes (ALL_REDUCE, or a SEND to the next rank for a
+`p2p_fraction` of them) spread evenly through the trace, the others computes of
+about `compute_flops` FLOPs. Sizes vary by up to `jitter` (a fraction) around
+the mean, drawn from a generator seeded with `seed`: the same parameters always
+give the same trace. The GPU count goes in the system config written next to
+it, a copy of the repository's with NUM_GPUS replaced.
+Run from the repository root:
+    python benchmarks/synthetic_trace.py /tmp/bench --gpus 64 --instructions 10000
+"""
+
+import argparse
+import os
+import random
+import sys
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import read_system_config  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def generate_trace(
+    instructions: int,
+    comm_fraction: float = 0.5,
+    message_bytes: int = 1 << 20,
+    compute_flops: int = 100000000,
+    p2p_fraction: float = 0.0,
+    jitter: float = 0.5,
+    seed: int = 0,
+) -> List[str]:
+    """The lines of a synthetic trace."""
+    if not 0 <= comm_fraction <= 1 or not 0 <= p2p_fraction <= 1:
+        raise ValueError("The fractions must be between 0 and 1")
+    rng = random.Random(seed)
+
+    def size(mean: int) -> int:
+        return max(1, round(mean * (1 + jitter * (2 * rng.random() - 1))))
+
+    lines: List[str] = []
+    communications = 0
+    for i in range(instructions):
+        # instruction i is a communication when the count of the first i + 1
+        # reaches the next multiple, so they are evenly spread
+        if int((i + 1) * comm_fraction) > communications:
+            communications += 1
+            if int(communications * p2p_fraction) > int(
+                (communications - 1) * p2p_fraction
+            ):
+                lines.append(f"COMMUNICATION, ALL, , {size(message_bytes)}, SEND")
+            else:
+                lines.append(f"COMMUNICATION, ALL, , {size(message_bytes)}, ALL_REDUCE")
+        else:
+            lines.append(f"COMPUTE, ALL, , {size(compute_flops)}, EXECUTE")
+    return lines
+
+
+def system_config(
+    num_gpus: int, overrides: Optional[Dict[str, str]] = None
+) -> Dict[str, str]:
+    """The repository's system config for num_gpus GPUs."""
+    config = read_system_config(os.path.join(REPO_DIR, "system_config.txt"))
+    config["NUM_GPUS"] = str(num_gpus)
+    config.update(overrides or {})
+    return config
+
+
+def write_files(
+    out_dir: str,
+    num_gpus: int,
+    lines: List[str],
+    overrides: Optional[Dict[str, str]] = None,
+) -> Tuple[str, str]:
+    """Writes trace.txt and system_config.txt, returns their paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    trace_path = os.path.join(out_dir, "trace.txt")
+    config_path = os.path.join(out_dir, "system_config.txt")
+    with open(trace_path, "w") as file:
+        file.write("\n".join(lines) + "\n")
+    with open(config_path, "w") as file:
+        for key, value in system_config(num_gpus, overrides).items():
+            file.write(f"{key}: {value}\n")
+    return trace_path, config_path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("out_dir")
+    parser.add_argument("--gpus", type=int, default=64)
+    parser.add_argument("--instructions", type=int, default=10000)
+    parser.add_argument("--comm-fraction", type=float, default=0.5)
+    parser.add_argument("--message-bytes", type=int, default=1 << 20)
+    parser.add_argument("--compute-flops", type=int, default=100000000)
+    parser.add_argument("--p2p-fraction", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    lines = generate_trace(
+        args.instructions,
+        args.comm_fraction,
+        args.message_bytes,
+        args.compute_flops,
+        args.p2p_fraction,
+        args.jitter,
+        args.seed,
+    )
+    for path in write_files(args.out_dir, args.gpus, lines):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Binary trace format, with a converter from the text format and a zero-copy loader.
+
+Layout (header little endian, columns in native byte order):
+- header: magic, version, number of instructions, of compute and of
+  communication instructions, number of strings, offset of each column
+- string table: operations and endpoints, u32 length + utf-8 bytes each
+- columns, each 8-byte aligned: sizes (i64), type codes (i8), operation,
+  source and destination codes (u32), compute and communication indices (i32)
+
+Each column is a fixed-width array, the loader memory-maps the file and hands
+`memoryview`s of the columns to a MappedProgram, nothing is copied or parsed
+per instruction. Usage:
+    python binary_trace.py gpu_trace.txt gpu_trace.bin
+"""
+
+import argparse
+import mmap
+import struct
+import sys
+from typing import Any, BinaryIO, List, Tuple, Union
+from program import Program, iter_input_lines
+
+BINARY_MAGIC: bytes = b"TSIMBIN1"
+BINARY_VERSION: int = 2
+# magic, version, num_instructions, num_compute, num_comm, num_strings,
+# then the offsets of the 7 columns
+HEADER: struct.Struct = struct.Struct("<8sIQQQI7Q")
+# name and typecode of the columns, in file order
+COLUMNS: List[Tuple[str, str]] = [
+    ("sizes", "q"),
+    ("ins_types", "b"),
+    ("op_codes", "I"),
+    ("src_codes", "I"),
+    ("dst_codes", "I"),
+    ("compute_indices", "i"),
+    ("comm_indices", "i"),
+]
+ALIGNMENT: int = 8
+
+
+def _padding(offset: int) -> int:
+    return -offset % ALIGNMENT
+
+
+def dump_program(program: Program, file: BinaryIO) -> None:
+    """Writes a program in the binary format."""
+    if program.has_dependencies:
+        raise ValueError("The binary format has no dependency columns")
+    strings = b"".join(
+        struct.pack("<I", len(encoded)) + encoded
+        for encoded in (s.encode() for s in program.strings)
+    )
+    offset = HEADER.size + len(strings)
+    offsets: List[int] = []
+    for name, _ in COLUMNS:
+        offset += _padding(offset)
+        offsets.append(offset)
+        offset += memoryview(getattr(program, name)).nbytes
+    file.write(
+        HEADER.pack(
+            BINARY_MAGIC,
+            BINARY_VERSION,
+            len(program),
+            len(program.compute_indices),
+            len(program.comm_indices),
+            len(program.strings),
+            *offsets,
+        )
+    )
+    file.write(strings)
+    position = HEADER.size + len(strings)
+    for (name, typecode), column_offset in zip(COLUMNS, offsets):
+        file.write(bytes(column_offset - position))
+        column = memoryview(getattr(program, name))
+        if column.format != typecode:
+            raise ValueError(f"Column {name} has type {column.format}, not {typecode}")
+        file.write(column)
+        position = column_offset + column.nbytes
+
+
+def save_program(program: Program, path: str) -> None:
+    """Writes a program to a binary trace file."""
+    with open(path, "wb") as file:
+        dump_program(program, file)
+
+
+def convert_text_trace(text_path: str, binary_path: str) -> Program:
+    """Compiles a text trace and writes it in the binary format."""
+    program = Program.from_lines(iter_input_lines(text_path, use_mmap=True))
+    save_program(program, binary_path)
+    return program
+
+
+class MappedProgram(Program):
+    """Program whose columns are memoryviews into a binary trace buffer."""
+
+    def __init__(self, buffer: Union[bytes, bytearray, memoryview, mmap.mmap]) -> None:
+        super().__init__()
+        view = memoryview(buffer)
+        if len(view) < HEADER.size:
+            raise ValueError("Not a binary trace: file too short")
+        magic, version, num_ins, num_compute, num_comm, num_strings, *offsets = (
+            HEADER.unpack_from(view)
+        )
+        if magic != BINARY_MAGIC:
+            raise ValueError("Not a binary trace: wrong magic")
+        if version != BINARY_VERSION:
+            raise ValueError(f"Unsupported binary trace version {version}")
+        position = HEADER.size
+        for _ in range(num_strings):
+            (length,) = struct.unpack_from("<I", view, position)
+            position += 4
+            self._intern(bytes(view[position : position + length]).decode())
+            position += length
+        lengths = [num_ins] * 5 + [num_compute, num_comm]
+        for (name, typecode), offset, length in zip(COLUMNS, offsets, lengths):
+            size = struct.calcsize(typecode) * length
+            if offset + size > len(view):
+                raise ValueError(f"Truncated binary trace, column {name}")
+            column: Any = view[offset : offset + size]
+            setattr(self, name, column.cast(typecode))
+        self.buffer: Any = buffer  # keeps the mapping alive
+
+
+def is_binary_trace(path: str) -> bool:
+    """True if the file starts with the binary trace magic."""
+    with open(path, "rb") as file:
+        return file.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+def load_program(path: str) -> MappedProgram:
+    """Memory-maps a binary trace file, the columns are not copied."""
+    with open(path, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    return MappedProgram(mapped)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Convert a text GPU trace to binary.")
+    parser.add_argument("text_trace")
+    parser.add_argument("binary_trace")
+    args = parser.parse_args()
+    program = convert_text_trace(args.text_trace, args.binary_trace)
+    print(f"Wrote {len(program)} instructions to {args.binary_trace}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
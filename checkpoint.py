@@ -0,0 +1,305 @@
+"""Checkpoint and restore of a running simulation.
+
+A snapshot file is append-only: a magic, then records, each a u64 length and a
+zlib-compressed pickle. The first record describes the simulation (number of
+instructions of each simulated GPU), every checkpoint then appends a record
+with the engine state (time, counters, pending events, collectives waiting for
+ranks) and, for each GPU, its queue positions, running instructions and only
+the instructions finished since the previous record, so a checkpoint costs the
+size of the event queue plus the new results, not of the whole history. The
+file is synced to disk when closed, and with sync=True after every record (a
+disk sync per checkpoint). A record cut short by a crash is ignored on restore,
+and overwritten when the file is appended to.
+
+The simulation to restore into is built from the same trace and system config
+(the programs are inputs, they are not saved), then restore() replays the
+records instead of starting the GPUs:
+    engine, gpus = initialize_simulation(trace, config, compact_events=True)
+    restore("run.ckpt", engine, gpus)
+    run_with_checkpoints(engine, gpus, "run.ckpt", interval_ns=1000000)
+
+References to the registered objects (GPUs, network), the engine, the programs
+and the GPU timestamp arrays in event payloads are saved by name and resolved
+against the new simulation. Streaming programs and the flow network model are
+not supported: their state holds open files and callbacks. Neither are traces
+with dependencies or GPUs with several streams.
+"""
+
+import io
+import os
+import pickle
+import struct
+import zlib
+from array import array
+from collections import deque
+from typing import Any, BinaryIO, Dict, Iterator, List, Sequence, Tuple
+from gpu import GPU
+from program import StreamingProgram
+from simulation_engine import SimulationEngine
+
+CHECKPOINT_MAGIC: bytes = b"TSIMCKP1"
+RECORD_HEADER: struct.Struct = struct.Struct("<Q")
+
+
+def _simulated(gpus: Sequence[GPU]) -> List[GPU]:
+    """The GPUs holding state, ReplicaGPUs only point to their representative."""
+    for gpu in gpus:
+        if isinstance(gpu.program, StreamingProgram):
+            raise ValueError("Checkpoints of a StreamingProgram are not supported")
+        # the running instructions are the last one started on each queue
+        if gpu.in_degrees is not None or gpu.compute_streams + gpu.comm_channels > 2:
+            raise ValueError(
+                "Checkpoints of dependencies or several streams are not supported"
+            )
+    return [gpu for gpu in gpus if gpu.representative is gpu]
+
+
+def _references(engine: SimulationEngine, simulated: List[GPU]) -> Dict[int, Any]:
+    """Persistent names of the objects shared with the simulation, by id(). The
+    GPUs are the ones pickled, GPUViews are created when read.
+    """
+    names: Dict[int, Any] = {id(engine): ("engine",)}
+    for obj_id, obj in engine.objects.items():
+        names[id(obj)] = ("object", obj_id)
+        if getattr(obj, "flow_model", None) is not None:
+            raise ValueError("Checkpoints of the FLOW network model are not supported")
+    for gpu in simulated:
+        names.setdefault(id(gpu.program), ("program", gpu.gpu_id))
+        names[id(gpu.start_times)] = ("start_times", gpu.gpu_id)
+        names[id(gpu.end_times)] = ("end_times", gpu.gpu_id)
+    return names
+
+
+def _resolve(
+    name: Tuple[Any, ...], engine: SimulationEngine, gpus: Dict[int, GPU]
+) -> Any:
+    kind = name[0]
+    if kind == "engine":
+        return engine
+    if kind == "object":
+        return engine.objects[name[1]]
+    gpu = gpus[name[1]]
+    if kind == "program":
+        return gpu.program
+    if kind == "start_times":
+        return gpu.start_times
+    if kind == "end_times":
+        return gpu.end_times
+    raise ValueError(f"Unknown reference {name} in the checkpoint")
+
+
+def _dump(record: Dict[str, Any], names: Dict[int, Any]) -> bytes:
+    data = io.BytesIO()
+    pickler = pickle.Pickler(data, protocol=pickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = lambda obj: names.get(id(obj))  # type: ignore
+    pickler.dump(record)
+    return zlib.compress(data.getbuffer(), 1)
+
+
+def _read_records(file: BinaryIO) -> Iterator[bytes]:
+    """The decompressed records, up to the end of the last complete one."""
+    if file.read(len(CHECKPOINT_MAGIC)) != CHECKPOINT_MAGIC:
+        raise ValueError("Not a checkpoint file")
+    while True:
+        header = file.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        (length,) = RECORD_HEADER.unpack(header)
+        data = file.read(length)
+        if len(data) < length:
+            return  # cut short while writing
+        try:
+            record = zlib.decompress(data)
+        except zlib.error:
+            if file.read(1):
+                raise ValueError("Corrupted record in the checkpoint") from None
+            return  # written in part before a crash
+        yield record
+
+
+def _records_end(path: str) -> int:
+    """Offset of the end of the last complete record of a snapshot file."""
+    with open(path, "rb") as file:
+        end = len(CHECKPOINT_MAGIC)
+        for _ in _read_records(file):
+            end = file.tell()
+    return end
+
+
+class Checkpointer:
+    """Appends the state of a simulation to a snapshot file at each save()."""
+
+    def __init__(
+        self,
+        path: str,
+        engine: SimulationEngine,
+        gpus: Sequence[GPU],
+        append: bool = False,
+        sync: bool = False,
+    ) -> None:
+        self.engine: SimulationEngine = engine
+        # sync every record to disk, not only at close()
+        self.sync: bool = sync
+        self.gpus: List[GPU] = _simulated(gpus)
+        self._names: Dict[int, Any] = _references(engine, self.gpus)
+        # finished instructions of each GPU already in the file
+        self._saved: Dict[int, int] = {
+            gpu.gpu_id: len(gpu.finished_instructions) for gpu in self.gpus
+        }
+        self.checkpoints: int = 0
+        self.bytes_written: int = 0
+        if append and os.path.exists(path):
+            end = _records_end(path)
+            self.file: BinaryIO = open(path, "r+b")
+            self.file.truncate(end)
+            self.file.seek(end)
+        else:
+            self.file = open(path, "wb")
+            self.file.write(CHECKPOINT_MAGIC)
+            self._append(
+                {
+                    "kind": "header",
+                    "instructions": {gpu.gpu_id: len(gpu.program) for gpu in self.gpus},
+                }
+            )
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        data = _dump(record, self._names)
+        self.file.write(RECORD_HEADER.pack(len(data)))
+        self.file.write(data)
+        self.file.flush()
+        if self.sync:
+            os.fsync(self.file.fileno())
+        self.bytes_written += RECORD_HEADER.size + len(data)
+
+    def save(self) -> None:
+        """Appends the current state: engine, pending events and new results."""
+        engine = self.engine
+        gpu_states: Dict[int, Any] = {}
+        for gpu in self.gpus:
+            finished = gpu.finished_instructions.indices
+            assert not isinstance(finished, deque)  # not a StreamingProgram
+            new = [
+                (index, gpu.start_times[index], gpu.end_times[index])
+                for index in finished[self._saved[gpu.gpu_id] :]
+            ]
+            self._saved[gpu.gpu_id] = len(finished)
+            # the last instruction started on each queue may still be running
+            running = [
+                (index, gpu.start_times[index])
+                for queue in (gpu.compute_queue, gpu.comm_queue)
+                if queue.pc > 0
+                for index in (queue.indices[queue.pc - 1],)
+            ]
+            gpu_states[gpu.gpu_id] = (
+                gpu.compute_queue.pc,
+                gpu.comm_queue.pc,
+                new,
+                running,
+                gpu.running_compute,
+                gpu.running_comm,
+            )
+        self._append(
+            {
+                "kind": "state",
+                "time_ns": engine.current_time_ns,
+                "events_processed": engine.events_processed,
+                "events_cancelled": engine.events_cancelled,
+                "seq": engine._seq,
+                "queue": engine.live_events(),
+                # the collectives waiting for ranks, see network.py
+                "objects": {
+                    obj_id: obj.save_state()
+                    for obj_id, obj in engine.objects.items()
+                    if hasattr(obj, "save_state")
+                },
+                "gpus": gpu_states,
+            }
+        )
+        self.checkpoints += 1
+
+    def close(self) -> None:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+
+def restore(path: str, engine: SimulationEngine, gpus: Sequence[GPU]) -> int:
+    """Loads the last state of a snapshot file into a new simulation, built
+    like the saved one and not started. Returns the number of checkpoints read.
+    """
+    simulated = {gpu.gpu_id: gpu for gpu in _simulated(gpus)}
+    if engine.event_queue:
+        raise ValueError("Restore into a simulation that is not started")
+    last: Dict[str, Any] = {}
+    checkpoints = 0
+    with open(path, "rb") as file:
+        for data in _read_records(file):
+            unpickler = pickle.Unpickler(io.BytesIO(data))
+            unpickler.persistent_load = lambda name: _resolve(  # type: ignore
+                name, engine, simulated
+            )
+            record = unpickler.load()
+            if record["kind"] == "header":
+                instructions = {
+                    gpu_id: len(gpu.program) for gpu_id, gpu in simulated.items()
+                }
+                if record["instructions"] != instructions:
+                    raise ValueError("The checkpoint is of another simulation")
+                continue
+            for gpu_id, (_, _, new, running, _, _) in record["gpus"].items():
+                gpu = simulated[gpu_id]
+                for index, start_ns, end_ns in new:
+                    gpu.start_times[index] = start_ns
+                    gpu.end_times[index] = end_ns
+                    gpu.finished_instructions.indices.append(index)
+                for index, start_ns in running:
+                    gpu.start_times[index] = start_ns
+            last = record
+            checkpoints += 1
+    if not last:
+        return 0
+
+    for gpu_id, state in last["gpus"].items():
+        gpu = simulated[gpu_id]
+        gpu.compute_queue.pc, gpu.comm_queue.pc = state[0], state[1]
+        gpu.running_compute, gpu.running_comm = state[4], state[5]
+    engine.current_time_ns = last["time_ns"]
+    engine.events_processed = last["events_processed"]
+    engine.events_cancelled = last["events_cancelled"]
+    engine._seq = last["seq"]
+    for obj_id, state in last["objects"].items():
+        engine.objects[obj_id].load_state(state)
+    for item in last["queue"]:
+        engine.event_queue.push(engine._handle_time(item), item)
+    return checkpoints
+
+
+def run_with_checkpoints(
+    engine: SimulationEngine,
+    gpus: Sequence[GPU],
+    path: str,
+    interval_ns: int,
+    append: bool = False,
+    sync: bool = False,
+) -> Checkpointer:
+    """Runs the simulation to completion, appending a checkpoint to the file
+    every interval_ns of simulated time. With append, a restored simulation
+    continues its snapshot file. With sync, every checkpoint is synced to disk.
+    """
+    if interval_ns <= 0:
+        raise ValueError("The checkpoint interval must be positive")
+    checkpointer = Checkpointer(path, engine, gpus, append, sync)
+    try:
+        checkpoint_ns = (engine.current_time_ns // interval_ns + 1) * interval_ns
+        while True:
+            next_ns = engine.run_until(checkpoint_ns)
+            if next_ns is None:
+                break
+            checkpointer.save()
+            # no empty checkpoints when nothing happens for several intervals
+            checkpoint_ns = (next_ns // interval_ns + 1) * interval_ns
+        engine.run()  # nothing left, closes the tracer
+    finally:
+        checkpointer.close()
+    return checkpointer
@@ -0,0 +1,273 @@
+"""Collective communication algorithms of the Network.
+
+A collective is decomposed along the topology into phases run one after the
+other, e.g. a ring all-reduce is a reduce-scatter then an all-gather. In each
+step of a phase, every GPU sends `bytes` to `fan` peers at once through its
+port, split in chunks of COMMUNICATION_CHUNK_SIZE bytes. A chunk transfer takes
+latency + fan * chunk / bandwidth ns, counted in picoseconds (rounded up): the
+times of the chunks are added in picoseconds from the start of the phase, and
+rounded up to nanoseconds for the events.
+
+- RING: ALL_REDUCE = REDUCE_SCATTER + ALL_GATHER, each p - 1 steps of size / p
+  bytes to the next GPU. BROADCAST is a chain of p - 1 hops of the whole buffer.
+- TREE (binary): BROADCAST and REDUCE are floor(log2 p) levels of the whole
+  buffer, a node sending to (or receiving from) its 2 children.
+  ALL_REDUCE = REDUCE + BROADCAST. ALL_GATHER and REDUCE_SCATTER are modelled
+  as a gather (like REDUCE) then a scatter (like BROADCAST) of the whole buffer.
+- FULLY_CONNECTED: direct algorithms, one step where each GPU sends to all the
+  p - 1 others (size / p bytes each, the whole buffer for BROADCAST).
+Other operations are point-to-point transfers of the whole buffer.
+
+The steps of a ring phase use the same links, so the links are busy with one
+step after the other. The steps of a chain or tree phase use different links
+and the chunks are pipelined: chunk j of step s starts once it arrived from
+step s - 1 and the link of step s is free.
+
+CollectiveRun simulates every chunk transfer with an event (detailed mode), or
+as flows to the peers of the GPU with the flow model (see flow_model.py). For
+a homogeneous collective, phase_time() gives the same timing in closed form
+(analytic mode), with t_j the time of chunk j in picoseconds:
+- ring phases: ceil(steps * sum(t_j) / 1000) ns
+- pipelined phases: ceil((sum(t_j) + (steps - 1) * max(t_j)) / 1000) ns
+"""
+
+import math
+from collections import deque
+from typing import Any, Deque, List, NamedTuple, Optional, Tuple
+
+COLLECTIVE_MODES: List[str] = ["ANALYTIC", "DETAILED"]
+COLLECTIVES: List[str] = ["ALL_REDUCE", "ALL_GATHER", "REDUCE_SCATTER", "BROADCAST"]
+
+
+class Phase(NamedTuple):
+    steps: int
+    bytes: int  # sent by each GPU to each peer in every step
+    fan: int  # number of peers sharing the port in a step
+    shared_links: bool  # True if all the steps use the same links (ring)
+
+
+def collective_phases(
+    operation: str, topology: str, num_gpus: int, size_bytes: int
+) -> List[Phase]:
+    """Decomposes a collective of `size_bytes` (the whole buffer) into phases."""
+    operation = operation.upper()
+    topology = topology.upper()
+    p = num_gpus
+    shard = math.ceil(size_bytes / p)
+    if operation not in COLLECTIVES:
+        return [Phase(1, size_bytes, 1, False)]
+    if topology == "RING":
+        if operation == "BROADCAST":
+            return [Phase(p - 1, size_bytes, 1, False)]
+        ring = Phase(p - 1, shard, 1, True)
+        return [ring, ring] if operation == "ALL_REDUCE" else [ring]
+    if topology == "TREE":
+        tree = Phase(p.bit_length() - 1, size_bytes, min(2, p - 1), False)
+        return [tree] if operation == "BROADCAST" else [tree, tree]
+    if topology == "FULLY_CONNECTED":
+        if operation == "BROADCAST":
+            return [Phase(1, size_bytes, p - 1, False)]
+        direct = Phase(1, shard, p - 1, False)
+        return [direct, direct] if operation == "ALL_REDUCE" else [direct]
+    raise ValueError(f"Unknown topology {topology}")
+
+
+def chunk_sizes(phase: Phase, chunk_size_bytes: int) -> Tuple[int, int, int]:
+    """(number of chunks, size of a full chunk, size of the last chunk) of a step.
+    A chunk size of 0 sends each step as one chunk.
+    """
+    if chunk_size_bytes <= 0 or phase.bytes <= chunk_size_bytes:
+        num_chunks, full = 1, phase.bytes
+    else:
+        num_chunks, full = math.ceil(phase.bytes / chunk_size_bytes), chunk_size_bytes
+    return num_chunks, full, phase.bytes - (num_chunks - 1) * full
+
+
+def chunk_times(
+    phase: Phase, chunk_size_bytes: int, bandwidth_GBps: float, latency_ns: int
+) -> Tuple[int, int, int]:
+    """(number of chunks, time of a full chunk, time of the last chunk) of a step,
+    the times in picoseconds.
+    """
+    num_chunks, full, last = chunk_sizes(phase, chunk_size_bytes)
+
+    def duration(chunk: int) -> int:
+        return math.ceil(1000 * latency_ns + 1000 * phase.fan * chunk / bandwidth_GBps)
+
+    return num_chunks, duration(full), duration(last)
+
+
+def ps_to_ns(time_ps: int) -> int:
+    """A time in picoseconds, rounded up to nanoseconds."""
+    return -(-time_ps // 1000)
+
+
+def phase_time(
+    phase: Phase, chunk_size_bytes: int, bandwidth_GBps: float, latency_ns: int
+) -> int:
+    """Closed-form duration of a phase, equal to the detailed simulation."""
+    if phase.steps <= 0 or phase.bytes <= 0:
+        return 0
+    num_chunks, full, last = chunk_times(
+        phase, chunk_size_bytes, bandwidth_GBps, latency_ns
+    )
+    total = (num_chunks - 1) * full + last
+    if phase.shared_links:
+        return ps_to_ns(phase.steps * total)
+    return ps_to_ns(total + (phase.steps - 1) * max(full, last))
+
+
+def collective_time(
+    phases: List[Phase], chunk_size_bytes: int, bandwidth_GBps: float, latency_ns: int
+) -> int:
+    return sum(
+        phase_time(phase, chunk_size_bytes, bandwidth_GBps, latency_ns)
+        for phase in phases
+    )
+
+
+def phase_peers(topology: str, num_gpus: int, src_gpu: int, phase: Phase) -> List[int]:
+    """The GPUs `src_gpu` sends to in a step of the phase: the next GPU on the
+    ring, its children on the tree (its parent for a leaf) or all the others
+    for the direct algorithms.
+    """
+    p = num_gpus
+    if topology.upper() == "TREE":
+        children = [c for c in (2 * src_gpu + 1, 2 * src_gpu + 2) if c < p]
+        if children:
+            return children
+        return [(src_gpu - 1) // 2] if src_gpu else []
+    if phase.fan == p - 1 and p > 2:
+        return [gpu for gpu in range(p) if gpu != src_gpu]
+    return [(src_gpu + 1) % p]
+
+
+class CollectiveRun:
+    """Detailed simulation of the collective of one GPU, one event per chunk
+    transfer. The network delivers the chunk events to on_chunk_done().
+    """
+
+    def __init__(
+        self,
+        network: Any,
+        src_gpu: int,
+        phases: List[Phase],
+        reply: Any,
+        bandwidth_GBps: Optional[float] = None,
+        group: Optional[range] = None,
+    ) -> None:
+        self.network: Any = network
+        self.src_gpu: int = src_gpu
+        # ranks of the collective, all the GPUs by default
+        self.group: range = range(network.num_gpus) if group is None else group
+        # of the transfer, the network's nominal bandwidth by default
+        self.bandwidth_GBps: float = (
+            network.bandwidth_GBps if bandwidth_GBps is None else bandwidth_GBps
+        )
+        self.phases: List[Phase] = phases
+        self.reply: Any = reply  # handed back to the GPU at the end
+        self.phase_index: int = -1
+        self.phase: Phase = Phase(0, 0, 1, False)
+        self.num_chunks: int = 0
+        self.full_bytes: int = 0
+        self.last_bytes: int = 0
+        # chunk times in picoseconds, see chunk_times()
+        self.full_time: int = 0
+        self.last_time: int = 0
+        self.phase_start_ns: int = 0
+        # per step of the current phase: chunks sent and chunks arrived
+        self.sent: List[int] = []
+        self.arrived: List[int] = []
+        # per step, in picoseconds from the start of the phase: the end of the
+        # chunk in flight, the end of the last one (the link is free), and the
+        # arrivals from the previous step of the chunks not sent yet (pipelined)
+        self.in_flight_ps: List[int] = []
+        self.free_ps: List[int] = []
+        self.ready_ps: List[Deque[int]] = []
+
+    def start(self, timestamp: int) -> None:
+        self._next_phase(timestamp)
+
+    def _next_phase(self, timestamp: int) -> None:
+        self.phase_index += 1
+        while self.phase_index < len(self.phases) and (
+            self.phases[self.phase_index].steps <= 0
+            or self.phases[self.phase_index].bytes <= 0
+        ):
+            self.phase_index += 1
+        if self.phase_index == len(self.phases):
+            self.network.finish_comm(timestamp, self.src_gpu, self.reply)
+            return
+        self.phase = self.phases[self.phase_index]
+        self.num_chunks, self.full_time, self.last_time = chunk_times(
+            self.phase,
+            self.network.chunk_size_bytes,
+            self.bandwidth_GBps,
+            self.network.latency_ns,
+        )
+        _, self.full_bytes, self.last_bytes = chunk_sizes(
+            self.phase, self.network.chunk_size_bytes
+        )
+        self.phase_start_ns = timestamp
+        steps = self.phase.steps
+        self.sent = [0] * steps
+        self.arrived = [0] * steps
+        self.in_flight_ps = [0] * steps
+        self.free_ps = [0] * steps
+        self.ready_ps = [deque() for _ in range(steps)]
+        self._send(timestamp, 0)
+
+    def _send(self, timestamp: int, step: int) -> None:
+        chunk = self.sent[step]
+        self.sent[step] = chunk + 1
+        if self.phase.shared_links:
+            # after the last chunk of the previous step
+            start_ps = self.free_ps[step - 1] if chunk == 0 and step else 0
+            start_ps = max(start_ps, self.free_ps[step])
+        elif step:
+            start_ps = max(self.ready_ps[step].popleft(), self.free_ps[step])
+        else:
+            start_ps = self.free_ps[step]
+        last = chunk == self.num_chunks - 1
+        end_ps = start_ps + (self.last_time if last else self.full_time)
+        self.in_flight_ps[step] = end_ps
+        self.network.send_chunk(
+            timestamp,
+            self,
+            step,
+            self.last_bytes if last else self.full_bytes,
+            self.phase_start_ns + ps_to_ns(end_ps) - timestamp,
+        )
+
+    def on_chunk_done(self, timestamp: int, step: int) -> None:
+        """A chunk of `step` arrived, starts the transfers it unblocks."""
+        self.arrived[step] += 1
+        if self.network.flow_model is None:
+            arrival_ps = self.in_flight_ps[step]
+        else:
+            # the flows end at the times of the events
+            arrival_ps = 1000 * (timestamp - self.phase_start_ns)
+        self.free_ps[step] = arrival_ps
+        last_step = self.phase.steps - 1
+        if not self.phase.shared_links and step < last_step:
+            self.ready_ps[step + 1].append(arrival_ps)
+        if self.phase.shared_links:
+            # one link for all the steps: the chunks of a step, then the next step
+            if self.sent[step] < self.num_chunks:
+                self._send(timestamp, step)
+            elif step < last_step:
+                self._send(timestamp, step + 1)
+            else:
+                self._next_phase(timestamp)
+            return
+        if self.sent[step] < self.num_chunks and (
+            step == 0 or self.arrived[step - 1] > self.sent[step]
+        ):
+            self._send(timestamp, step)
+        if step < last_step:
+            following = step + 1
+            link_free = self.sent[following] == self.arrived[following]
+            if link_free and self.sent[following] < self.arrived[step]:
+                self._send(timestamp, following)
+        elif self.arrived[step] == self.num_chunks:
+            self._next_phase(timestamp)
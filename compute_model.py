@@ -0,0 +1,188 @@
+"""Cost models of the compute instructions.
+
+The duration of a compute instruction depends on its operation and its size in
+FLOPs, on a GPU type:
+- FlatModel: FLOPs at the peak rate, ceil(FLOPs / (TFLOPS * 1e3)) ns.
+- RooflineModel: the kernel moves FLOPs / intensity bytes from HBM, where the
+  arithmetic intensity (FLOPs per byte) depends on the operation; it's bound by
+  the slower of the compute and the memory transfer.
+- ProfileModel: measured kernel durations per operation, interpolated linearly
+  in the FLOPs between the profiled sizes; other operations use a fallback model.
+
+The models are called through a ComputeCache, a bounded LRU memo keyed by
+(operation, FLOPs, GPU type) shared by the GPUs of a simulation, so the many
+identical kernels of a trace are computed once.
+
+System config keys, all optional:
+    COMPUTE_MODEL: FLAT, ROOFLINE or PROFILE (FLAT by default)
+    HBM_BANDWIDTH: GB/s, for ROOFLINE (and the PROFILE fallback)
+    ARITHMETIC_INTENSITY: FLOPs per byte, "64" or per operation "64, MATMUL=256"
+    COMPUTE_PROFILE: CSV file with the columns operation, flops, duration_ns
+    COMPUTE_CACHE_SIZE: entries of the cache (4096 by default)
+"""
+
+import bisect
+import csv
+import math
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+COMPUTE_MODELS: List[str] = ["FLAT", "ROOFLINE", "PROFILE"]
+
+
+class ComputeModel(ABC):
+    """Interface of a compute cost model, for one GPU type."""
+
+    def __init__(self, gpu_type: str = "default") -> None:
+        self.gpu_type: str = gpu_type
+
+    @abstractmethod
+    def duration_ns(self, operation: str, flops: int) -> int:
+        """Duration of a compute instruction."""
+
+
+class FlatModel(ComputeModel):
+    def __init__(self, tflops: int, gpu_type: str = "default") -> None:
+        super().__init__(gpu_type)
+        self.tflops: int = tflops
+
+    def duration_ns(self, operation: str, flops: int) -> int:
+        # FLOPs / (TFLOPS * 1e12) s, in integers so there is no rounding error
+        return -(-flops // (self.tflops * 1000))
+
+
+class RooflineModel(ComputeModel):
+    def __init__(
+        self,
+        tflops: int,
+        hbm_GBps: float,
+        intensity: float,
+        intensities: Optional[Dict[str, float]] = None,
+        gpu_type: str = "default",
+    ) -> None:
+        super().__init__(gpu_type)
+        self.tflops: int = tflops
+        self.hbm_GBps: float = hbm_GBps  # bytes per ns
+        self.intensity: float = intensity  # FLOPs per byte, by default
+        self.intensities: Dict[str, float] = dict(intensities or {})
+
+    def duration_ns(self, operation: str, flops: int) -> int:
+        compute_ns = flops / (self.tflops * 1e3)
+        bytes_moved = flops / self.intensities.get(operation, self.intensity)
+        return math.ceil(max(compute_ns, bytes_moved / self.hbm_GBps))
+
+
+class ProfileModel(ComputeModel):
+    def __init__(
+        self,
+        profiles: Dict[str, List[Tuple[int, int]]],
+        fallback: ComputeModel,
+        gpu_type: str = "default",
+    ) -> None:
+        super().__init__(gpu_type)
+        # (flops, duration_ns) of the measured kernels, sorted by flops
+        self.profiles: Dict[str, List[Tuple[int, int]]] = {
+            operation: sorted(points) for operation, points in profiles.items()
+        }
+        self.fallback: ComputeModel = fallback
+
+    @classmethod
+    def from_csv(
+        cls, path: str, fallback: ComputeModel, gpu_type: str = "default"
+    ) -> "ProfileModel":
+        """Reads the profiles from a CSV file: operation, flops, duration_ns."""
+        profiles: Dict[str, List[Tuple[int, int]]] = {}
+        with open(path, newline="") as file:
+            for row in csv.DictReader(file):
+                profiles.setdefault(row["operation"].strip(), []).append(
+                    (int(row["flops"]), int(row["duration_ns"]))
+                )
+        return cls(profiles, fallback, gpu_type)
+
+    def duration_ns(self, operation: str, flops: int) -> int:
+        points = self.profiles.get(operation)
+        if not points:
+            return self.fallback.duration_ns(operation, flops)
+        i = bisect.bisect_left(points, (flops, -1))
+        if i < len(points) and points[i][0] == flops:
+            return points[i][1]
+        if i == 0 or i == len(points):
+            # outside the profiled sizes: proportional to the nearest one
+            size, duration = points[min(i, len(points) - 1)]
+            return math.ceil(duration * flops / size) if size else duration
+        (x0, y0), (x1, y1) = points[i - 1], points[i]
+        return math.ceil(y0 + (y1 - y0) * (flops - x0) / (x1 - x0))
+
+
+class ComputeCache:
+    """Bounded LRU memo of the compute durations, by (operation, FLOPs, GPU type)."""
+
+    def __init__(self, maxsize: int = 4096) -> None:
+        self.maxsize: int = maxsize
+        self._durations: "OrderedDict[Tuple[str, int, str], int]" = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __len__(self) -> int:
+        return len(self._durations)
+
+    def duration_ns(self, model: ComputeModel, operation: str, flops: int) -> int:
+        key = (operation, flops, model.gpu_type)
+        durations = self._durations
+        duration = durations.get(key)
+        if duration is not None:
+            durations.move_to_end(key)
+            self.hits += 1
+            return duration
+        self.misses += 1
+        duration = model.duration_ns(operation, flops)
+        durations[key] = duration
+        if len(durations) > self.maxsize:
+            durations.popitem(last=False)  # least recently used
+        return duration
+
+
+def parse_intensities(text: str) -> Tuple[float, Dict[str, float]]:
+    """Parses "64, MATMUL=256": the default intensity and per-operation ones."""
+    default = 1.0
+    intensities: Dict[str, float] = {}
+    for item in text.split(","):
+        item = item.strip()
+        if "=" in item:
+            operation, value = item.split("=", 1)
+            intensities[operation.strip()] = float(value)
+        elif item:
+            default = float(item)
+    return default, intensities
+
+
+def make_compute_model(
+    config_dict: Dict[str, str], tflops: int, gpu_type: str = "default"
+) -> ComputeModel:
+    """The compute model of a system config, for GPUs of the given TFLOPS."""
+    name = config_dict.get("COMPUTE_MODEL", "FLAT").upper()
+    if name not in COMPUTE_MODELS:
+        raise ValueError(f"Unknown compute model {name}")
+    if name == "FLAT":
+        return FlatModel(tflops, gpu_type)
+    model: ComputeModel = FlatModel(tflops, gpu_type)
+    if "HBM_BANDWIDTH" in config_dict:
+        intensity, intensities = parse_intensities(
+            config_dict.get("ARITHMETIC_INTENSITY", "1")
+        )
+        model = RooflineModel(
+            tflops,
+            float(config_dict["HBM_BANDWIDTH"]),
+            intensity,
+            intensities,
+            gpu_type,
+        )
+    elif name == "ROOFLINE":
+        raise ValueError("The ROOFLINE compute model needs HBM_BANDWIDTH")
+    if name == "ROOFLINE":
+        return model
+    # PROFILE, the roofline (or flat) model for the operations not profiled
+    if "COMPUTE_PROFILE" not in config_dict:
+        raise ValueError("The PROFILE compute model needs COMPUTE_PROFILE")
+    return ProfileModel.from_csv(config_dict["COMPUTE_PROFILE"], model, gpu_type)
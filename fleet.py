@@ -0,0 +1,115 @@
+"""Heterogeneous GPU fleets: GPU classes and the assignment of ranks to them.
+
+A GPU class overrides the per-GPU keys of the system config, the ranks not
+assigned to a class are of the class "default", given by the keys themselves:
+    GPU_CLASS_H100: COMPUTE_CAPABILITY=989, HBM_BANDWIDTH=3350, NETWORK_BANDWIDTH=50
+    GPU_CLASS_A100: COMPUTE_CAPABILITY=312, HBM_BANDWIDTH=2039
+    GPU_ASSIGNMENT: H100=0-5, A100=6-7
+COMPUTE_CAPABILITY is in TFLOPS, HBM_BANDWIDTH (used by the roofline compute
+model) and NETWORK_BANDWIDTH (of the links of the GPU) in GB/s.
+
+The parameters are stored in arrays indexed by gpu_id, read by the GPUs and the
+network, and each class has one compute model (see compute_model.py), whose GPU
+type is the class name.
+"""
+
+from array import array
+from typing import Dict, List, NamedTuple, Optional
+from compute_model import ComputeModel, make_compute_model
+from rank_trace import parse_ranks
+
+CLASS_PREFIX: str = "GPU_CLASS_"
+# keys of the system config a GPU class can override
+CLASS_KEYS: List[str] = ["COMPUTE_CAPABILITY", "HBM_BANDWIDTH", "NETWORK_BANDWIDTH"]
+
+
+class GPUClass(NamedTuple):
+    name: str
+    compute_tflops: int
+    hbm_GBps: Optional[float]  # None if not given
+    bandwidth_GBps: float
+
+
+def parse_class(text: str) -> Dict[str, str]:
+    """Parses "COMPUTE_CAPABILITY=989, NETWORK_BANDWIDTH=50"."""
+    fields: Dict[str, str] = {}
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        key, sep, value = item.partition("=")
+        key = key.strip().upper()
+        if not sep or key not in CLASS_KEYS:
+            raise ValueError(f"Wrong GPU class field {item.strip()}")
+        fields[key] = value.strip()
+    return fields
+
+
+class Fleet:
+    def __init__(self, config_dict: Dict[str, str], num_gpus: int) -> None:
+        # the class configs: the system config with the overrides of the class
+        configs: Dict[str, Dict[str, str]] = {"default": dict(config_dict)}
+        for key, value in config_dict.items():
+            if key.startswith(CLASS_PREFIX):
+                name = key[len(CLASS_PREFIX) :]
+                configs[name] = dict(config_dict, **parse_class(value))
+        self.classes: List[GPUClass] = []
+        # one compute model per class, used by all its GPUs
+        self.compute_models: List[ComputeModel] = []
+        for name, class_config in configs.items():
+            hbm = class_config.get("HBM_BANDWIDTH")
+            self.classes.append(
+                GPUClass(
+                    name,
+                    int(class_config["COMPUTE_CAPABILITY"]),
+                    float(hbm) if hbm else None,
+                    float(class_config["NETWORK_BANDWIDTH"]),
+                )
+            )
+            self.compute_models.append(
+                make_compute_model(
+                    class_config, int(class_config["COMPUTE_CAPABILITY"]), name
+                )
+            )
+
+        # per-rank parameters, indexed by gpu_id
+        self.class_ids: array = array("H", bytes(2 * num_gpus))
+        names = list(configs)
+        assigned = [False] * num_gpus
+        for item in config_dict.get("GPU_ASSIGNMENT", "").split(","):
+            if not item.strip():
+                continue
+            name, sep, ranks_text = item.partition("=")
+            name = name.strip()
+            if not sep or name not in configs:
+                raise ValueError(f"Wrong GPU assignment {item.strip()}")
+            ranks = parse_ranks(ranks_text) or range(num_gpus)
+            for rank in ranks:
+                if not 0 <= rank < num_gpus:
+                    raise ValueError(f"GPU {rank} assigned, there are {num_gpus}")
+                if assigned[rank]:
+                    raise ValueError(f"GPU {rank} assigned to two classes")
+                assigned[rank] = True
+                self.class_ids[rank] = names.index(name)
+        self.compute_tflops: array = array(
+            "q", (self.classes[c].compute_tflops for c in self.class_ids)
+        )
+        self.hbm_GBps: array = array(
+            "d", (self.classes[c].hbm_GBps or 0.0 for c in self.class_ids)
+        )
+        self.bandwidth_GBps: array = array(
+            "d", (self.classes[c].bandwidth_GBps for c in self.class_ids)
+        )
+
+    def __len__(self) -> int:
+        return len(self.class_ids)
+
+    def gpu_class(self, gpu_id: int) -> GPUClass:
+        return self.classes[int(self.class_ids[gpu_id])]
+
+    def compute_model(self, gpu_id: int) -> ComputeModel:
+        return self.compute_models[int(self.class_ids[gpu_id])]
+
+    @property
+    def uniform_bandwidth(self) -> bool:
+        """True if all the GPUs have the same link bandwidth."""
+        return len(set(self.bandwidth_GBps)) <= 1
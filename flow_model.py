@@ -0,0 +1,234 @@
+"""Flow-level network model with max-min fair bandwidth sharing.
+
+Every GPU has an egress and an ingress port, and the topology adds its links:
+the two directions of each ring link (RING) or tree edge (TREE); with
+FULLY_CONNECTED the GPUs are directly connected and only the ports are shared.
+The links have the configured bandwidth, or with per-GPU bandwidths the ports
+of a GPU have its bandwidth and a link between two GPUs the smaller one. A
+transfer is a flow along the route between two GPUs, and the flows sharing a
+link get max-min fair rates.
+
+When a flow starts or finishes, the rates are recomputed (progressive filling)
+only for the flows connected to the changed links through shared links, the
+other flows keep their rates. The completion event of a flow whose rate changed
+is rescheduled, the engine cancels the old one lazily (a tombstone in the queue).
+"""
+
+import heapq
+import math
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+from simulation_engine import EventHandle, SimulationEngine, register_event_type
+
+FLOW_DONE: int = register_event_type("FLOW_DONE")
+NETWORK_MODELS: List[str] = ["IDEAL", "FLOW"]
+# rounding errors of the shared rates, ignored when rounding a completion time
+# up to a nanosecond
+ROUNDING_NS: float = 1e-6
+
+
+class Flow:
+    __slots__ = ("links", "remaining", "rate", "updated_ns", "handle", "on_done")
+
+    def __init__(
+        self, links: List[int], size_bytes: int, on_done: Callable[[int], None]
+    ) -> None:
+        self.links: List[int] = links
+        self.remaining: float = float(size_bytes)  # bytes left at updated_ns
+        self.rate: float = 0.0  # bytes per ns
+        self.updated_ns: int = 0
+        self.handle: Optional[EventHandle] = None  # of the completion event
+        self.on_done: Callable[[int], None] = on_done  # called with the end time
+
+
+class FlowModel:
+    def __init__(
+        self,
+        engine: SimulationEngine,
+        target_id: int,
+        num_gpus: int,
+        bandwidth_GBps: int,
+        topology: str,
+        bandwidths: Optional[Sequence[float]] = None,
+    ) -> None:
+        self.engine: SimulationEngine = engine
+        self.target_id: int = target_id  # object receiving the FLOW_DONE events
+        self.num_gpus: int = num_gpus
+        self.topology: str = topology.upper()
+        # link ids: egress ports [0, p), ingress ports [p, 2p), then the
+        # topology links: [2p, 3p) forward and [3p, 4p) backward
+        num_links = 2 * num_gpus
+        if self.topology in ("RING", "TREE"):
+            num_links = 4 * num_gpus
+        elif self.topology != "FULLY_CONNECTED":
+            raise ValueError(f"Unknown topology {topology}")
+        self.capacity: List[float] = [float(bandwidth_GBps)] * num_links
+        if bandwidths is not None:
+            self._set_capacities(bandwidths)
+        # flows of each link, dicts rather than sets so the order is deterministic
+        self.link_flows: List[Dict[Flow, None]] = [{} for _ in range(num_links)]
+        self._routes: Dict[Tuple[int, int], List[int]] = {}
+        self.active_flows: int = 0
+        self.rescheduled: int = 0  # completion events moved by a rate change
+
+    def drop_flows(self) -> None:
+        """Removes the flows in progress, their completion events are dropped."""
+        for flows in self.link_flows:
+            flows.clear()
+        self.active_flows = 0
+
+    def _set_capacities(self, bandwidths: Sequence[float]) -> None:
+        """Per-GPU bandwidths: the ports of a GPU have its bandwidth, a link
+        between two GPUs the smaller of theirs.
+        """
+        p = self.num_gpus
+        for gpu in range(p):
+            self.capacity[gpu] = self.capacity[p + gpu] = float(bandwidths[gpu])
+        if self.topology == "RING":
+            for gpu in range(p):
+                # forward link gpu -> gpu + 1, backward link gpu -> gpu - 1
+                self.capacity[2 * p + gpu] = min(
+                    bandwidths[gpu], bandwidths[(gpu + 1) % p]
+                )
+                self.capacity[3 * p + gpu] = min(
+                    bandwidths[gpu], bandwidths[(gpu - 1) % p]
+                )
+        elif self.topology == "TREE":
+            for gpu in range(p):
+                # the edge between gpu and its parent, in both directions
+                parent = (gpu - 1) // 2 if gpu else 0
+                edge = min(bandwidths[gpu], bandwidths[parent])
+                self.capacity[2 * p + gpu] = self.capacity[3 * p + gpu] = edge
+
+    def route(self, src: int, dst: int) -> List[int]:
+        """The links from GPU src to GPU dst."""
+        key = (src, dst)
+        links = self._routes.get(key)
+        if links is None:
+            links = [src] + self._topology_links(src, dst) + [self.num_gpus + dst]
+            self._routes[key] = links
+        return links
+
+    def _topology_links(self, src: int, dst: int) -> List[int]:
+        p = self.num_gpus
+        forward, backward = 2 * p, 3 * p
+        if self.topology == "RING":
+            # shortest direction, link forward + i goes from i to i + 1
+            hops = (dst - src) % p
+            if hops <= p - hops:
+                return [forward + (src + i) % p for i in range(hops)]
+            return [backward + (src - i) % p for i in range(p - hops)]
+        if self.topology == "TREE":
+            # up to the common ancestor, then down; forward + c is the edge
+            # from c to its parent, backward + c the edge from the parent to c
+            up: List[int] = []
+            down: List[int] = []
+            a, b = src, dst
+            while a != b:
+                if a > b:
+                    up.append(forward + a)
+                    a = (a - 1) // 2
+                else:
+                    down.append(backward + b)
+                    b = (b - 1) // 2
+            return up + down[::-1]
+        return []
+
+    def start_flow(
+        self,
+        timestamp: int,
+        src: int,
+        dst: int,
+        size_bytes: int,
+        on_done: Callable[[int], None],
+    ) -> Flow:
+        """Starts a transfer, on_done(end time) is called when it's finished."""
+        flow = Flow(self.route(src, dst), size_bytes, on_done)
+        flow.updated_ns = timestamp
+        if size_bytes <= 0:
+            on_done(timestamp)
+            return flow
+        for link in flow.links:
+            self.link_flows[link][flow] = None
+        self.active_flows += 1
+        self._update_rates(timestamp, flow.links)
+        return flow
+
+    def on_flow_done(self, timestamp: int, target_id: int, flow: Flow) -> None:
+        """Handler of FLOW_DONE, the payload is the flow."""
+        flow.handle = None
+        for link in flow.links:
+            del self.link_flows[link][flow]
+        self.active_flows -= 1
+        flow.remaining = 0.0
+        self._update_rates(timestamp, flow.links)
+        flow.on_done(timestamp)
+
+    def _component(self, links: List[int]) -> Dict[Flow, None]:
+        """The flows connected to the links through shared links."""
+        flows: Dict[Flow, None] = {}
+        seen: Set[int] = set(links)
+        pending = list(links)
+        while pending:
+            for flow in self.link_flows[pending.pop()]:
+                if flow not in flows:
+                    flows[flow] = None
+                    for link in flow.links:
+                        if link not in seen:
+                            seen.add(link)
+                            pending.append(link)
+        return flows
+
+    def _update_rates(self, timestamp: int, changed_links: List[int]) -> None:
+        """Recomputes the max-min fair rates of the flows affected by the links."""
+        flows = self._component(changed_links)
+        if not flows:
+            return
+        # progressive filling: the most constrained link fixes the rate of its
+        # flows, then its capacity is removed from the other links they use
+        residual: Dict[int, float] = {}
+        unfixed: Dict[int, int] = {}
+        for flow in flows:
+            for link in flow.links:
+                residual[link] = self.capacity[link]
+                unfixed[link] = unfixed.get(link, 0) + 1
+        rates: Dict[Flow, float] = {}
+        heap = [(residual[link] / count, link) for link, count in unfixed.items()]
+        heapq.heapify(heap)
+        while heap:
+            share, link = heapq.heappop(heap)
+            count = unfixed[link]
+            if count == 0 or share != residual[link] / count:
+                continue  # outdated entry
+            for flow in self.link_flows[link]:
+                if flow in rates:
+                    continue
+                rates[flow] = share
+                for other in flow.links:
+                    residual[other] = max(residual[other] - share, 0.0)
+                    unfixed[other] -= 1
+                    if other != link and unfixed[other]:
+                        heapq.heappush(heap, (residual[other] / unfixed[other], other))
+            unfixed[link] = 0
+        for flow, rate in rates.items():
+            if rate != flow.rate:
+                self._set_rate(timestamp, flow, rate)
+
+    def _set_rate(self, timestamp: int, flow: Flow, rate: float) -> None:
+        """Changes the rate of a flow and schedules its new completion event."""
+        flow.remaining = max(
+            flow.remaining - flow.rate * (timestamp - flow.updated_ns), 0.0
+        )
+        flow.updated_ns = timestamp
+        flow.rate = rate
+        if rate <= 0:
+            # no progress and no completion event until it gets bandwidth again
+            if flow.handle is not None:
+                self.engine.cancel(flow.handle)
+                flow.handle = None
+            return
+        end_ns = timestamp + math.ceil(flow.remaining / rate - ROUNDING_NS)
+        if flow.handle is None:
+            flow.handle = self.engine.post(end_ns, FLOW_DONE, self.target_id, flow)
+        else:
+            flow.handle = self.engine.reschedule(flow.handle, end_ns)
+            self.rescheduled += 1
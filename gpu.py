@@ -1,11 +1,31 @@
-from typing import List, Deque
-from simulation_engine import Event, SimulationEngine
-from network import Network
-from collections import deque
-import math
+from array import array
+from typing import Dict, Iterator, List, Optional, Union
+from compute_model import ComputeCache, ComputeModel, FlatModel
+from simulation_engine import Event, Handler, SimulationEngine, register_event_type
+from network import COMM_DONE, COMM_START, Network
+from program import (
+    DependencyGraph,
+    INS_COMMUNICATION,
+    INS_COMPUTE,
+    INS_TYPE_NAMES,
+    IndexLog,
+    Program,
+    TimeArray,
+    parse_instruction,
+)
+from trace_recorder import TraceKind, TraceLevel
+
+COMPUTE_DONE: int = register_event_type("COMPUTE_DONE")
 
 
 class Instruction:
+    """View of one instruction of a Program.
+    The fields are read from the (shared) program, the start and end times from
+    the timestamp arrays of the GPU running it.
+    """
+
+    __slots__ = ("program", "index", "start_times", "end_times")
+
     def __init__(
         self,
         event_type: str,
@@ -14,13 +34,85 @@ class Instruction:
         size: int,
         operation: str,
     ) -> None:
-        self.ins_type: str = event_type  # rename it ins_type to avoid confusion of simulation event's type
-        self.source: str = source
-        self.destination: str = destination
-        self.size: int = size  # for compute it's FLOPS, for comm it's Bytes
-        self.operation: str = operation
-        self.start_time_ns: int = 0
-        self.end_time_ns: int = 0
+        # a standalone instruction, stored in its own one-instruction program
+        program = Program()
+        program.append(event_type, source, destination, size, operation)
+        self._bind(program, 0, array("q", [0]), array("q", [0]))
+
+    @classmethod
+    def view(
+        cls,
+        program: Program,
+        index: int,
+        start_times: TimeArray,
+        end_times: TimeArray,
+    ) -> "Instruction":
+        """Instruction `index` of the program, with times stored in the arrays."""
+        ins = cls.__new__(cls)
+        ins._bind(program, index, start_times, end_times)
+        return ins
+
+    def _bind(
+        self,
+        program: Program,
+        index: int,
+        start_times: TimeArray,
+        end_times: TimeArray,
+    ) -> None:
+        self.program: Program = program
+        self.index: int = index  # position in the trace
+        self.start_times: TimeArray = start_times
+        self.end_times: TimeArray = end_times
+
+    @property
+    def ins_type(self) -> str:
+        # named ins_type to avoid confusion of simulation event's type
+        return INS_TYPE_NAMES[int(self.program.ins_types[self.index])]
+
+    @property
+    def source(self) -> str:
+        return self.program.source(self.index)
+
+    @property
+    def destination(self) -> str:
+        return self.program.destination(self.index)
+
+    @property
+    def size(self) -> int:
+        # for compute it's FLOPS, for comm it's Bytes
+        return int(self.program.sizes[self.index])
+
+    @property
+    def operation(self) -> str:
+        return self.program.operation(self.index)
+
+    @property
+    def start_time_ns(self) -> int:
+        return int(self.start_times[self.index])
+
+    @start_time_ns.setter
+    def start_time_ns(self, value: int) -> None:
+        self.start_times[self.index] = value
+
+    @property
+    def end_time_ns(self) -> int:
+        return int(self.end_times[self.index])
+
+    @end_time_ns.setter
+    def end_time_ns(self, value: int) -> None:
+        self.end_times[self.index] = value
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Instruction):
+            return NotImplemented
+        return (
+            self.program is other.program
+            and self.index == other.index
+            and self.start_times is other.start_times
+        )
+
+    def __hash__(self) -> int:
+        return hash((id(self.program), self.index, id(self.start_times)))
 
     def __str__(self) -> str:
         s = "<Ins_type: " + self.ins_type
@@ -31,46 +123,161 @@ class Instruction:
         return s
 
 
+class InstructionQueue:
+    """FIFO of the instructions of one type of a GPU.
+    It's a program counter into the program's index array of that type.
+    """
+
+    def __init__(self, gpu: "GPU", ins_type: int) -> None:
+        self.gpu: GPU = gpu
+        self.indices: array = (
+            gpu.program.compute_indices
+            if ins_type == INS_COMPUTE
+            else gpu.program.comm_indices
+        )
+        self.ins_type: int = ins_type
+        self.pc: int = 0
+        gpu.program.register_cursor(self, ins_type)
+
+    def __len__(self) -> int:
+        """Number of queued instructions (loaded ones for a StreamingProgram)."""
+        return len(self.indices) - self.pc
+
+    def __getitem__(self, i: int) -> Instruction:
+        if not 0 <= i < len(self):
+            raise IndexError("InstructionQueue index out of range")
+        return self.gpu.instruction(self.indices[self.pc + i])
+
+    def next_index(self) -> int:
+        """Pops the next instruction index, -1 when the queue is empty."""
+        pc = self.pc
+        while pc == len(self.indices):
+            if not self.gpu.program.load_more(self.ins_type):
+                return -1
+        self.pc = pc + 1
+        return int(self.indices[pc])
+
+    def popleft(self) -> Instruction:
+        index = self.next_index()
+        if index < 0:
+            raise IndexError("pop from an empty InstructionQueue")
+        return self.gpu.instruction(index)
+
+
+class ReadyQueue(InstructionQueue):
+    """FIFO of the instructions of one type whose predecessors all finished,
+    for programs with dependencies. `indices` grows as instructions become
+    ready, the roots of the dependency graph first.
+    """
+
+    def __init__(self, gpu: "GPU", ins_type: int, roots: array) -> None:
+        self.gpu = gpu
+        self.indices = array("i", roots)
+        self.ins_type = ins_type
+        self.pc = 0
+
+    def next_index(self) -> int:
+        """Pops the next ready instruction index, -1 when none is ready."""
+        pc = self.pc
+        if pc == len(self.indices):
+            return -1
+        self.pc = pc + 1
+        return int(self.indices[pc])
+
+
+class InstructionList:
+    """The finished instructions of a GPU, in finish order."""
+
+    def __init__(self, gpu: "GPU", indices: Optional[IndexLog] = None) -> None:
+        self.gpu: GPU = gpu
+        # the last ones only for a StreamingProgram
+        if indices is None:
+            indices = gpu.program.new_finished_log()
+        self.indices: IndexLog = indices
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, i: int) -> Instruction:
+        return self.gpu.instruction(self.indices[i])
+
+    def __iter__(self) -> Iterator[Instruction]:
+        for index in self.indices:
+            yield self.gpu.instruction(index)
+
+    def append(self, ins: Instruction) -> None:
+        self.indices.append(ins.index)
+
+
 class GPU:
     def __init__(
         self,
         gpu_id: int,
-        instructions: List[str],
+        instructions: Union[Program, List[str]],
         compute_tflops: int,
         chunk_size_bytes: int,
         network: Network,
         engine: SimulationEngine,
+        compute_model: Optional[ComputeModel] = None,
+        compute_cache: Optional[ComputeCache] = None,
+        compute_streams: int = 1,
+        comm_channels: int = 1,
     ):
         self.gpu_id: int = gpu_id
         self.compute_tflops: int = compute_tflops
+        # duration of the compute instructions, the cache is shared by the GPUs
+        if compute_model is None:
+            compute_model = FlatModel(compute_tflops)
+        self.compute_model: ComputeModel = compute_model
+        if compute_cache is None:
+            compute_cache = ComputeCache()
+        self.compute_cache: ComputeCache = compute_cache
         self.chunk_size_bytes: int = chunk_size_bytes
         self.network: Network = network
         self.engine: SimulationEngine = engine
+        # the program is compiled once and shared when all GPUs run the same trace
+        if not isinstance(instructions, Program):
+            instructions = Program.from_lines(instructions)
+        self.program: Program = instructions
+        # start and end time of every instruction of the program on this GPU
+        self.start_times: TimeArray = self.program.new_times()
+        self.end_times: TimeArray = self.program.new_times(self.start_times)
         # separate compute and communication events into different queues
         # since they can run in parallel
-        self.compute_queue: Deque[Instruction] = deque()
-        self.comm_queue: Deque[Instruction] = deque()
-        for instruction in instructions:
-            ins: Instruction = self.parse_instruction(instruction)
-            if ins.ins_type.lower() == "compute":
-                self.compute_queue.append(ins)
-            elif ins.ins_type.lower() == "communication":
-                self.comm_queue.append(ins)
-            else:
-                raise ValueError(f"Unknown event type {ins.ins_type}")
+        self.compute_queue: InstructionQueue
+        self.comm_queue: InstructionQueue
+        # remaining predecessors of each instruction, with dependencies only
+        self.dependency_graph: Optional[DependencyGraph] = None
+        self.in_degrees: Optional[array] = None
+        if self.program.has_dependencies:
+            graph = self.dependency_graph = self.program.dependency_graph()
+            self.in_degrees = array("i", graph.in_degrees)
+            self.compute_queue = ReadyQueue(self, INS_COMPUTE, graph.roots[INS_COMPUTE])
+            self.comm_queue = ReadyQueue(
+                self, INS_COMMUNICATION, graph.roots[INS_COMMUNICATION]
+            )
+        else:
+            self.compute_queue = InstructionQueue(self, INS_COMPUTE)
+            self.comm_queue = InstructionQueue(self, INS_COMMUNICATION)
+        # instructions of each type running at the same time, and running now
+        if compute_streams < 1 or comm_channels < 1:
+            raise ValueError("A GPU needs at least one compute stream and comm channel")
+        self.compute_streams: int = compute_streams
+        self.comm_channels: int = comm_channels
+        self.running_compute: int = 0
+        self.running_comm: int = 0
         # store the finished instructions, output as results
-        self.finished_instructions: List[Instruction] = []
+        self.finished_instructions: InstructionList = InstructionList(self)
+        # the simulated GPU giving the results of this one, see ReplicaGPU
+        self.representative: GPU = self
 
     def parse_instruction(self, ins: str) -> Instruction:
         """Convert the instruction text to object."""
-        ins_list: List[str] = [
-            s.replace(" ", "") if s.strip() else "" for s in ins.split(",")
-        ]
-        if len(ins_list) != 5:
-            raise AssertionError(f"Wrong trace format at {ins_list}")
-        return Instruction(
-            ins_list[0], ins_list[1], ins_list[2], int(ins_list[3]), ins_list[4]
-        )
+        return Instruction(*parse_instruction(ins))
+
+    def instruction(self, index: int) -> Instruction:
+        """The instruction at `index` of the program, with this GPU's times."""
+        return Instruction.view(self.program, index, self.start_times, self.end_times)
 
     def handle_event(self, event: Event) -> None:
         """Decides how to handle an event based on its type."""
@@ -83,53 +290,111 @@ class GPU:
                 f"Unknown event type {event.event_type} for GPU {self.gpu_id}"
             )
 
+    def event_handlers(self) -> Dict[int, Handler]:
+        """Handlers of compact events, used by CompactSimulationEngine."""
+        return {
+            COMPUTE_DONE: self.on_compute_done,
+            COMM_DONE: self.on_comm_done,
+        }
+
     def start_gpu(self) -> None:
         """Start executing both compute and comm instructions"""
         self.run_next_compute()
         self.run_next_comm()
 
     def run_next_compute(self) -> None:
-        """Processes the next compute instruction in the queue."""
-        if not self.compute_queue:
-            return
+        """Processes the next compute instructions in the queue, while a compute
+        stream is free.
+        """
+        while self.running_compute < self.compute_streams:
+            index: int = self.compute_queue.next_index()
+            if index < 0:
+                return
+            self.running_compute += 1
+            self.issue_compute(index)
 
-        ins: Instruction = self.compute_queue.popleft()
-        ins.start_time_ns = self.engine.current_time_ns
-        tflops: int = ins.size
-        compute_dur_ns: int = math.ceil((tflops / self.compute_tflops) * 1e-3)
+    def issue_compute(self, index: int) -> None:
+        """Starts compute instruction `index` on a free stream."""
+        now: int = self.engine.current_time_ns
+        self.start_times[index] = now
+        compute_dur_ns: int = self.compute_cache.duration_ns(
+            self.compute_model, self.program.operation(index), self.program.sizes[index]
+        )
+        tracer = self.engine.tracer
+        if tracer.level >= TraceLevel.EVENTS:
+            tracer.record(self.gpu_id, TraceKind.COMPUTE_START, now, index)
+        if self.engine.compact_events:
+            self.engine.post(now + compute_dur_ns, COMPUTE_DONE, self.gpu_id, index)
+            return
         compute_done_event: Event = Event(
-            timestamp=self.engine.current_time_ns + compute_dur_ns,
+            timestamp=now + compute_dur_ns,
             event_type="COMPUTE_DONE",
             target_id=self.gpu_id,
-            args={"ins": ins},
+            args={"ins": self.instruction(index)},
         )
-        print(f"GPU {self.gpu_id} started computing at {self.engine.current_time_ns}")
         self.engine.schedule_event(compute_done_event)
 
     def compute_done(self, event: Event) -> None:
         """Handles computation completion and starts the next instruction."""
-        print(f"GPU {self.gpu_id} finished computing at {event.timestamp}")
+        self.on_compute_done(event.timestamp, self.gpu_id, event.args["ins"].index)
+
+    def on_compute_done(self, timestamp: int, target_id: int, index: int) -> None:
+        """Compact form of compute_done(), the payload is the instruction index."""
+        tracer = self.engine.tracer
+        if tracer.level >= TraceLevel.EVENTS:
+            tracer.record(self.gpu_id, TraceKind.COMPUTE_END, timestamp, index)
 
-        # retrieve the instruction, log finished time and store it
-        finished_ins: Instruction = event.args["ins"]
-        finished_ins.end_time_ns = event.timestamp
-        self.finished_instructions.append(finished_ins)
+        # log finished time of the instruction and store it
+        self.end_times[index] = timestamp
+        self.finished_instructions.indices.append(index)
+        self.running_compute -= 1
+        if self.in_degrees is not None:
+            self.release_successors(index)
         self.run_next_compute()
 
     def run_next_comm(self) -> None:
-        """Processes the next communication instruction in the queue.
+        """Processes the next communication instructions in the queue, while a
+        comm channel is free.
         There will be an event COMM_START that handled by the network object
         """
-        if not self.comm_queue:
-            return
+        while self.running_comm < self.comm_channels:
+            index: int = self.comm_queue.next_index()
+            if index < 0:
+                return
+            self.running_comm += 1
+            self.issue_comm(index)
 
-        ins: Instruction = self.comm_queue.popleft()
-        ins.start_time_ns = self.engine.current_time_ns
+    def issue_comm(self, index: int) -> None:
+        """Sends communication instruction `index` on a free channel."""
+        now: int = self.engine.current_time_ns
+        self.start_times[index] = now
+        size_bytes: int = self.program.sizes[index]
+        tracer = self.engine.tracer
+        if tracer.level >= TraceLevel.EVENTS:
+            tracer.record(self.gpu_id, TraceKind.COMM_START, now, index)
+        if self.engine.compact_events:
+            self.engine.post(
+                now,
+                COMM_START,
+                self.network.object_id,
+                (
+                    self.gpu_id,
+                    index,
+                    size_bytes,
+                    self.program.operation(index),
+                    self.program.destination(index),
+                ),
+            )
+            return
         comm_start_event: Event = Event(
-            timestamp=self.engine.current_time_ns,
+            timestamp=now,
             event_type="COMM_START",
             target_id=self.network.object_id,
-            args={"size_bytes": ins.size, "src_gpu": self.gpu_id, "ins": ins},
+            args={
+                "size_bytes": size_bytes,
+                "src_gpu": self.gpu_id,
+                "ins": self.instruction(index),
+            },
         )
         self.engine.schedule_event(comm_start_event)
 
@@ -138,9 +403,73 @@ class GPU:
         This event is scheduled by the network object, after ALL of the transmission
         by this GPU is finished (all of the data to all of its destinations)
         """
+        self.on_comm_done(event.timestamp, self.gpu_id, event.args["ins"].index)
 
-        print(f"GPU {self.gpu_id} finished comm at {event.timestamp}")
-        finished_ins: Instruction = event.args["ins"]
-        finished_ins.end_time_ns = event.timestamp
-        self.finished_instructions.append(finished_ins)
+    def on_comm_done(self, timestamp: int, target_id: int, index: int) -> None:
+        """Compact form of communication_done(), the payload is the instruction index."""
+        tracer = self.engine.tracer
+        if tracer.level >= TraceLevel.EVENTS:
+            tracer.record(self.gpu_id, TraceKind.COMM_END, timestamp, index)
+        self.end_times[index] = timestamp
+        self.finished_instructions.indices.append(index)
+        self.running_comm -= 1
+        if self.in_degrees is not None:
+            self.release_successors(index)
         self.run_next_comm()
+
+    def release_successors(self, index: int) -> None:
+        """Decrements the in-degrees of the successors of a finished instruction,
+        those left without predecessors become ready and are issued if a stream
+        of their type is free. Costs the out-degree of the instruction.
+        """
+        graph = self.dependency_graph
+        in_degrees = self.in_degrees
+        assert graph is not None and in_degrees is not None
+        successors = graph.successors
+        types = self.program.ins_types
+        released = [False, False]
+        for edge in range(graph.succ_offsets[index], graph.succ_offsets[index + 1]):
+            successor = successors[edge]
+            in_degrees[successor] -= 1
+            if not in_degrees[successor]:
+                ins_type = types[successor]
+                queue = (
+                    self.compute_queue if ins_type == INS_COMPUTE else self.comm_queue
+                )
+                queue.indices.append(successor)
+                released[ins_type] = True
+        # the queue of the finished type is run by the caller
+        if released[INS_COMPUTE] and types[index] != INS_COMPUTE:
+            self.run_next_compute()
+        if released[INS_COMMUNICATION] and types[index] != INS_COMMUNICATION:
+            self.run_next_comm()
+
+
+class ReplicaGPU(GPU):
+    """GPU identical to a simulated one (symmetry collapse).
+    It's not simulated: its program, timestamps and finished instructions are
+    the ones of its representative.
+    """
+
+    def __init__(self, gpu_id: int, representative: GPU) -> None:
+        self.gpu_id = gpu_id
+        self.representative = representative
+        self.compute_tflops = representative.compute_tflops
+        self.compute_model = representative.compute_model
+        self.compute_cache = representative.compute_cache
+        self.chunk_size_bytes = representative.chunk_size_bytes
+        self.network = representative.network
+        self.engine = representative.engine
+        self.program = representative.program
+        self.start_times = representative.start_times
+        self.end_times = representative.end_times
+        self.compute_queue = representative.compute_queue
+        self.comm_queue = representative.comm_queue
+        self.dependency_graph = representative.dependency_graph
+        self.in_degrees = representative.in_degrees
+        self.compute_streams = representative.compute_streams
+        self.comm_channels = representative.comm_channels
+        self.finished_instructions = representative.finished_instructions
+
+    def start_gpu(self) -> None:
+        """Nothing to run, the representative runs for this GPU."""
@@ -0,0 +1,378 @@
+"""Array-backed GPUs, for a fast construction of large systems.
+
+A GPUArray simulates the GPUs running one Program with the same parameters
+(a class of identical GPUs, see build_simulation()). Their state is held in
+preallocated arrays indexed by the slot of each GPU: the positions in its
+compute and communication queues, its running instructions of each type, the
+start and end times of its instructions (arrays of num_slots * len(program)
+items) and its log of finished instructions. The GPUArray is registered once
+in the engine for all its GPUs, their events are dispatched to its handlers
+with the GPU id as target, so building N GPUs costs a few array allocations
+rather than N GPU objects with their queues and arrays.
+
+The GPUs are seen through GPUViews: lightweight GPU objects whose attributes
+read and write the arrays, created when indexed in a GPUViews sequence. Their
+queues, finished instruction lists and time arrays (memoryview slices) are only
+created when inspected.
+
+Requires the CompactSimulationEngine. Programs with dependencies and
+StreamingPrograms run on GPU objects.
+"""
+
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union, overload
+from compute_model import ComputeCache, ComputeModel, FlatModel
+from gpu import COMPUTE_DONE, GPU, InstructionList, InstructionQueue
+from network import COMM_DONE, COMM_START, Network
+from program import (
+    INS_COMMUNICATION,
+    INS_COMPUTE,
+    LogSlice,
+    Program,
+    StreamingProgram,
+    TimeArray,
+)
+from simulation_engine import CompactSimulationEngine, Handler
+from trace_recorder import TraceKind, TraceLevel
+
+
+def supports_arrays(program: Program) -> bool:
+    """True if the GPUs running the program can be array-backed."""
+    return not isinstance(program, StreamingProgram) and not program.has_dependencies
+
+
+class GPUArray:
+    def __init__(
+        self,
+        gpu_ids: Sequence[int],
+        program: Program,
+        compute_tflops: int,
+        chunk_size_bytes: int,
+        network: Network,
+        engine: CompactSimulationEngine,
+        compute_model: Optional[ComputeModel] = None,
+        compute_cache: Optional[ComputeCache] = None,
+        compute_streams: int = 1,
+        comm_channels: int = 1,
+        collapse: bool = False,
+    ) -> None:
+        if not supports_arrays(program):
+            raise ValueError("Array-backed GPUs need a Program without dependencies")
+        if compute_streams < 1 or comm_channels < 1:
+            raise ValueError("A GPU needs at least one compute stream and comm channel")
+        if not gpu_ids:
+            raise ValueError("A GPUArray needs at least one GPU")
+        self.compute_tflops: int = compute_tflops
+        if compute_model is None:
+            compute_model = FlatModel(compute_tflops)
+        self.compute_model: ComputeModel = compute_model
+        if compute_cache is None:
+            compute_cache = ComputeCache()
+        self.compute_cache: ComputeCache = compute_cache
+        self.chunk_size_bytes: int = chunk_size_bytes
+        self.network: Network = network
+        self.engine: CompactSimulationEngine = engine
+        self.program: Program = program
+        self.compute_streams: int = compute_streams
+        self.comm_channels: int = comm_channels
+        # no dependencies, see supports_arrays()
+        self.dependency_graph: None = None
+        self.in_degrees: None = None
+
+        # the simulated GPUs, with collapse the first one stands for the others
+        # (symmetry collapse, see ReplicaGPU)
+        self.gpu_ids: array = array("i", gpu_ids[:1] if collapse else gpu_ids)
+        # slot of each GPU id of the class
+        self.slot_of: Dict[int, int] = (
+            dict.fromkeys(gpu_ids, 0)
+            if collapse
+            else {gpu_id: slot for slot, gpu_id in enumerate(gpu_ids)}
+        )
+        num_slots = len(self.gpu_ids)
+        self.length: int = len(program)
+        # queue positions and running instructions of each type
+        self.compute_pc: array = array("i", bytes(4 * num_slots))
+        self.comm_pc: array = array("i", bytes(4 * num_slots))
+        self.running_compute: array = array("i", bytes(4 * num_slots))
+        self.running_comm: array = array("i", bytes(4 * num_slots))
+        # instruction i of slot s at s * length + i
+        self.start_times: array = array("q", bytes(8 * num_slots * self.length))
+        self.end_times: array = array("q", bytes(8 * num_slots * self.length))
+        # finished instructions of slot s in finish order, from s * length
+        self.finished: array = array("i", bytes(4 * num_slots * self.length))
+        self.finished_counts: array = array("i", bytes(4 * num_slots))
+
+    def __len__(self) -> int:
+        """Number of simulated GPUs."""
+        return len(self.gpu_ids)
+
+    def view(self, gpu_id: int) -> "GPUView":
+        """The GPU of an id, a ReplicaGPU-like view of its slot with collapse."""
+        slot = self.slot_of.get(gpu_id)
+        if slot is None:
+            raise KeyError(f"GPU {gpu_id} is not in this GPUArray")
+        return GPUView(self, slot, gpu_id)
+
+    def views(self, gpu_ids: Optional[Sequence[int]] = None) -> "GPUViews":
+        """The GPUs of some ids, the simulated ones by default."""
+        if gpu_ids is None:
+            gpu_ids = self.gpu_ids
+        return GPUViews(gpu_ids, [self] * len(gpu_ids))
+
+    def event_handlers(self) -> Dict[int, Handler]:
+        """Handlers of compact events of all the GPUs, the target is the GPU id."""
+        return {
+            COMPUTE_DONE: self.on_compute_done,
+            COMM_DONE: self.on_comm_done,
+        }
+
+    def start_gpu(self, slot: int) -> None:
+        """Starts executing both compute and comm instructions of a GPU."""
+        self.run_next_compute(slot)
+        self.run_next_comm(slot)
+
+    def run_next_compute(self, slot: int) -> None:
+        """Issues the next compute instructions of a GPU, while a compute stream
+        is free.
+        """
+        indices = self.program.compute_indices
+        pcs = self.compute_pc
+        running = self.running_compute
+        while running[slot] < self.compute_streams:
+            pc = pcs[slot]
+            if pc == len(indices):
+                return
+            pcs[slot] = pc + 1
+            running[slot] += 1
+            self.issue_compute(slot, indices[pc])
+
+    def issue_compute(self, slot: int, index: int) -> None:
+        """Starts compute instruction `index` of a GPU on a free stream."""
+        gpu_id = self.gpu_ids[slot]
+        now = self.engine.current_time_ns
+        self.start_times[slot * self.length + index] = now
+        program = self.program
+        compute_dur_ns = self.compute_cache.duration_ns(
+            self.compute_model, program.operation(index), program.sizes[index]
+        )
+        tracer = self.engine.tracer
+        if tracer.level >= TraceLevel.EVENTS:
+            tracer.record(gpu_id, TraceKind.COMPUTE_START, now, index)
+        self.engine.post(now + compute_dur_ns, COMPUTE_DONE, gpu_id, index)
+
+    def on_compute_done(self, timestamp: int, gpu_id: int, index: int) -> None:
+        """Handler of COMPUTE_DONE, the payload is the instruction index."""
+        tracer = self.engine.tracer
+        if tracer.level >= TraceLevel.EVENTS:
+            tracer.record(gpu_id, TraceKind.COMPUTE_END, timestamp, index)
+        slot = self.slot_of[gpu_id]
+        offset = slot * self.length
+        self.end_times[offset + index] = timestamp
+        count = self.finished_counts[slot]
+        self.finished[offset + count] = index
+        self.finished_counts[slot] = count + 1
+        self.running_compute[slot] -= 1
+        self.run_next_compute(slot)
+
+    def run_next_comm(self, slot: int) -> None:
+        """Issues the next communication instructions of a GPU, while a comm
+        channel is free.
+        """
+        indices = self.program.comm_indices
+        pcs = self.comm_pc
+        running = self.running_comm
+        while running[slot] < self.comm_channels:
+            pc = pcs[slot]
+            if pc == len(indices):
+                return
+            pcs[slot] = pc + 1
+            running[slot] += 1
+            self.issue_comm(slot, indices[pc])
+
+    def issue_comm(self, slot: int, index: int) -> None:
+        """Sends communication instruction `index` of a GPU on a free channel."""
+        gpu_id = self.gpu_ids[slot]
+        now = self.engine.current_time_ns
+        self.start_times[slot * self.length + index] = now
+        program = self.program
+        tracer = self.engine.tracer
+        if tracer.level >= TraceLevel.EVENTS:
+            tracer.record(gpu_id, TraceKind.COMM_START, now, index)
+        self.engine.post(
+            now,
+            COMM_START,
+            self.network.object_id,
+            (
+                gpu_id,
+                index,
+                program.sizes[index],
+                program.operation(index),
+                program.destination(index),
+            ),
+        )
+
+    def on_comm_done(self, timestamp: int, gpu_id: int, index: int) -> None:
+        """Handler of COMM_DONE, the payload is the instruction index."""
+        tracer = self.engine.tracer
+        if tracer.level >= TraceLevel.EVENTS:
+            tracer.record(gpu_id, TraceKind.COMM_END, timestamp, index)
+        slot = self.slot_of[gpu_id]
+        offset = slot * self.length
+        self.end_times[offset + index] = timestamp
+        count = self.finished_counts[slot]
+        self.finished[offset + count] = index
+        self.finished_counts[slot] = count + 1
+        self.running_comm[slot] -= 1
+        self.run_next_comm(slot)
+
+
+class QueueView(InstructionQueue):
+    """Instruction queue of a GPUView, its position is in the GPUArray."""
+
+    def __init__(self, gpu: "GPUView", ins_type: int, pcs: array) -> None:
+        self.gpu = gpu
+        self.indices = (
+            gpu.program.compute_indices
+            if ins_type == INS_COMPUTE
+            else gpu.program.comm_indices
+        )
+        self.ins_type = ins_type
+        self.pcs: array = pcs
+        self.slot: int = gpu.slot
+
+    @property
+    def pc(self) -> int:
+        return int(self.pcs[self.slot])
+
+    @pc.setter
+    def pc(self, value: int) -> None:
+        self.pcs[self.slot] = value
+
+
+def _shared(name: str) -> Any:
+    """Read-only attribute of a GPUView, the one of its GPUArray."""
+    return property(lambda view: getattr(view.gpu_array, name))
+
+
+class GPUView(GPU):
+    """GPU `gpu_id`, simulated in slot `slot` of a GPUArray.
+    Only the GPU id and slot are stored, the other attributes are the ones of
+    the GPUArray or views of its arrays, created when first read. With collapse,
+    the GPUs sharing a slot other than its first one are replicas.
+    """
+
+    compute_tflops = _shared("compute_tflops")
+    compute_model = _shared("compute_model")
+    compute_cache = _shared("compute_cache")
+    chunk_size_bytes = _shared("chunk_size_bytes")
+    network = _shared("network")
+    engine = _shared("engine")
+    program = _shared("program")
+    compute_streams = _shared("compute_streams")
+    comm_channels = _shared("comm_channels")
+    dependency_graph = _shared("dependency_graph")
+    in_degrees = _shared("in_degrees")
+
+    def __init__(self, gpu_array: GPUArray, slot: int, gpu_id: int) -> None:
+        self.gpu_array: GPUArray = gpu_array
+        self.slot: int = slot
+        self.gpu_id = gpu_id
+
+    @property
+    def representative(self) -> GPU:  # type: ignore[override]
+        gpu_array = self.gpu_array
+        if gpu_array.gpu_ids[self.slot] == self.gpu_id:
+            return self
+        return GPUView(gpu_array, self.slot, gpu_array.gpu_ids[self.slot])
+
+    def _times(self, times: array) -> memoryview:
+        length = self.gpu_array.length
+        return memoryview(times)[self.slot * length : (self.slot + 1) * length]
+
+    @property
+    def start_times(self) -> TimeArray:  # type: ignore[override]
+        # kept, the checkpoints name the time arrays by id()
+        if "_start_times" not in self.__dict__:
+            self._start_times = self._times(self.gpu_array.start_times)
+        return self._start_times
+
+    @property
+    def end_times(self) -> TimeArray:  # type: ignore[override]
+        if "_end_times" not in self.__dict__:
+            self._end_times = self._times(self.gpu_array.end_times)
+        return self._end_times
+
+    @property
+    def compute_queue(self) -> InstructionQueue:  # type: ignore[override]
+        return QueueView(self, INS_COMPUTE, self.gpu_array.compute_pc)
+
+    @property
+    def comm_queue(self) -> InstructionQueue:  # type: ignore[override]
+        return QueueView(self, INS_COMMUNICATION, self.gpu_array.comm_pc)
+
+    @property
+    def running_compute(self) -> int:
+        return int(self.gpu_array.running_compute[self.slot])
+
+    @running_compute.setter
+    def running_compute(self, value: int) -> None:
+        self.gpu_array.running_compute[self.slot] = value
+
+    @property
+    def running_comm(self) -> int:
+        return int(self.gpu_array.running_comm[self.slot])
+
+    @running_comm.setter
+    def running_comm(self, value: int) -> None:
+        self.gpu_array.running_comm[self.slot] = value
+
+    @property
+    def finished_instructions(self) -> InstructionList:  # type: ignore[override]
+        gpu_array = self.gpu_array
+        return InstructionList(
+            self,
+            LogSlice(
+                gpu_array.finished,
+                gpu_array.finished_counts,
+                self.slot,
+                gpu_array.length,
+            ),
+        )
+
+    def start_gpu(self) -> None:
+        """Starts the GPU, nothing to run for a replica."""
+        if self.gpu_array.gpu_ids[self.slot] == self.gpu_id:
+            self.gpu_array.start_gpu(self.slot)
+
+
+class GPUViews(Sequence[GPU]):
+    """GPUs of some ids: GPU objects, or the GPUArrays simulating them, seen
+    through a new GPUView each time they are indexed.
+    """
+
+    def __init__(
+        self, gpu_ids: Sequence[int], gpus: Sequence[Union[GPU, GPUArray]]
+    ) -> None:
+        self.gpu_ids: Sequence[int] = gpu_ids
+        self.gpus: Sequence[Union[GPU, GPUArray]] = gpus
+
+    def __len__(self) -> int:
+        return len(self.gpus)
+
+    @overload
+    def __getitem__(self, index: int) -> GPU: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "GPUViews": ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[GPU, "GPUViews"]:
+        if isinstance(index, slice):
+            return GPUViews(self.gpu_ids[index], self.gpus[index])
+        gpu = self.gpus[index]
+        if isinstance(gpu, GPUArray):
+            return gpu.view(self.gpu_ids[index])
+        return gpu
+
+    def __iter__(self) -> Iterator[GPU]:
+        for gpu_id, gpu in zip(self.gpu_ids, self.gpus):
+            yield gpu.view(gpu_id) if isinstance(gpu, GPUArray) else gpu
@@ -1,7 +1,21 @@
-from typing import List, Tuple
-from simulation_engine import SimulationEngine
-from gpu import GPU
+import argparse
+import json
+import os
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from simulation_engine import CompactSimulationEngine, SimulationEngine
+from gpu import GPU, ReplicaGPU
+from gpu_array import GPUArray, GPUViews, supports_arrays
 from network import Network
+from binary_trace import is_binary_trace, load_program
+from checkpoint import restore, run_with_checkpoints
+from compute_model import ComputeCache
+from fleet import Fleet
+from profiler import Profiler
+from program import Program, StreamingProgram, iter_input_lines
+from rank_trace import load_rank_programs
+from scheduler import make_scheduler
+from steady_state import run_steady_state
+from trace_recorder import TraceLevel, TraceRecorder
 
 
 def read_input_files(file_path: str) -> List[str]:
@@ -12,33 +26,11 @@ def read_input_files(file_path: str) -> List[str]:
     - Empty lines are ignored.
     - Lines with '#' elsewhere keep only the part before '#'.
     """
-    valid_lines: List[str] = []
-    with open(file_path, "r") as file:
-        for line in file:
-            # Remove leading/trailing whitespace
-            line = line.strip()
-            if not line:
-                continue
+    return list(iter_input_lines(file_path))
 
-            if line.startswith("#"):
-                continue
 
-            if "#" in line:
-                line = line.split("#", 1)[0].strip()
-
-            if line:
-                valid_lines.append(line)
-
-    return valid_lines
-
-
-def initialize_simulation(
-    trace_file: str, system_config_file: str
-) -> Tuple[SimulationEngine, List[GPU]]:
-    """Initializes the simulation engine, GPUs, and network."""
-
-    # read gpu trace file and produce instructions for each GPU
-    instruction_lines = read_input_files(trace_file)
+def read_system_config(system_config_file: str) -> Dict[str, str]:
+    """Reads the `KEY: value` lines of the system config file."""
     system_config_lines = read_input_files(system_config_file)
     config_dict = {}
     for line in system_config_lines:
@@ -49,46 +41,323 @@ def initialize_simulation(
             config_dict[key] = value
         else:
             raise ValueError(f"system_config.txt has an error line: {line}")
+    return config_dict
+
+
+def initialize_simulation(
+    trace_file: str,
+    system_config_file: str,
+    compact_events: bool = False,
+    scheduler: str = "HEAP",
+    streaming: bool = False,
+    per_rank: bool = False,
+    collapse: bool = False,
+    batch_events: bool = False,
+    array_backed: bool = False,
+) -> Tuple[SimulationEngine, Sequence[GPU]]:
+    """Initializes the simulation engine, GPUs, and network.
+    With compact_events, the CompactSimulationEngine is used (faster for large runs),
+    with batch_events it coalesces the events of a type at the same time.
+    The scheduler is the event queue backend: HEAP, CALENDAR or WHEEL.
+    With streaming, the trace is read lazily while the GPUs run (StreamingProgram).
+    A binary trace (see binary_trace.py) is memory-mapped instead of parsed.
+    With per_rank, or if trace_file is a directory, each GPU runs its own slice
+    of a rank-tagged trace (see rank_trace.py).
+    With collapse, identical GPUs are simulated once, and with array_backed
+    their state is held in arrays, see build_simulation().
+    """
+
+    config_dict = read_system_config(system_config_file)
+    num_gpus = int(config_dict["NUM_GPUS"])
+
+    # read gpu trace file and compile it once, all GPUs share the program (SPMD)
+    programs: List[Program]
+    if per_rank or os.path.isdir(trace_file):
+        programs = load_rank_programs(trace_file, num_gpus)
+    elif streaming:
+        programs = [StreamingProgram.from_file(trace_file)] * num_gpus
+    elif is_binary_trace(trace_file):
+        programs = [load_program(trace_file)] * num_gpus
+    else:
+        programs = [Program.from_lines(read_input_files(trace_file))] * num_gpus
 
+    return build_simulation(
+        programs,
+        config_dict,
+        compact_events,
+        scheduler,
+        collapse,
+        batch_events=batch_events,
+        array_backed=array_backed,
+    )
+
+
+def build_simulation(
+    programs: List[Program],
+    config_dict: Dict[str, str],
+    compact_events: bool = False,
+    scheduler: str = "HEAP",
+    collapse: bool = False,
+    gpu_ids: Optional[Sequence[int]] = None,
+    engine: Optional[SimulationEngine] = None,
+    batch_events: bool = False,
+    array_backed: bool = False,
+) -> Tuple[SimulationEngine, Sequence[GPU]]:
+    """Creates the engine, network and GPUs of a system config, GPU i runs
+    programs[i] (the same Program for all GPUs in SPMD).
+
+    gpu_ids selects the GPUs to create (all of them by default), and an engine
+    can be given instead of the one made from compact_events, scheduler and
+    batch_events; the parallel engine uses them to build a partition (see
+    parallel_engine.py).
+
+    With collapse (symmetry collapse), GPUs running the same Program with the
+    same parameters form an equivalence class: only its first GPU is simulated,
+    the others are ReplicaGPUs reporting its results. It falls back to the full
+    simulation when the GPUs interact through the network (NETWORK_MODEL: FLOW)
+    or their link bandwidths differ.
+
+    With array_backed (and the CompactSimulationEngine), each equivalence class
+    is simulated by a GPUArray, holding the state of its GPUs in arrays, and
+    the GPUs are GPUViews of it (see gpu_array.py): building large systems
+    costs a few allocations per class instead of objects per GPU. Programs with
+    dependencies and StreamingPrograms keep GPU objects.
+    """
     num_gpus = int(config_dict["NUM_GPUS"])
     bandwidth_gbps = int(config_dict["NETWORK_BANDWIDTH"])
     topology = config_dict["TOPOLOGY"]
-    compute_tflops = int(config_dict["COMPUTE_CAPABILITY"])
     chunk_size_bytes = int(config_dict["COMMUNICATION_CHUNK_SIZE"])
+    # optional keys
+    latency_ns = int(config_dict.get("LINK_LATENCY", "0"))
+    collective_mode = config_dict.get("COLLECTIVE_MODE", "ANALYTIC")
+    network_model = config_dict.get("NETWORK_MODEL", "IDEAL")
+    if len(programs) != num_gpus:
+        raise ValueError(f"{len(programs)} programs for {num_gpus} GPUs")
+    # per-rank parameters of the GPU classes, see fleet.py
+    fleet = Fleet(config_dict, num_gpus)
 
     # Initialize the simulation engine
-    engine: SimulationEngine = SimulationEngine()
+    if engine is None:
+        event_queue = make_scheduler(scheduler)
+        engine = (
+            CompactSimulationEngine(event_queue, batch_events)
+            if compact_events
+            else SimulationEngine(event_queue)
+        )
 
     # Create and register network
-    network: Network = Network(num_gpus, num_gpus, bandwidth_gbps, topology, engine)
+    network: Network = Network(
+        num_gpus,
+        num_gpus,
+        bandwidth_gbps,
+        topology,
+        engine,
+        chunk_size_bytes,
+        latency_ns,
+        collective_mode,
+        network_model,
+        fleet.bandwidth_GBps,
+    )
     engine.register_object(network.object_id, network)
 
+    # durations of the compute instructions, see compute_model.py
+    compute_cache = ComputeCache(int(config_dict.get("COMPUTE_CACHE_SIZE", "4096")))
+    # instructions of each type a GPU runs at the same time
+    compute_streams = int(config_dict.get("COMPUTE_STREAMS", "1"))
+    comm_channels = int(config_dict.get("COMM_CHANNELS", "1"))
+
     # Create and register GPUs
-    gpus: List[GPU] = []
-    for gpu_id in range(0, num_gpus):
+    # with different link bandwidths, transfer times depend on the peers
+    collapse = collapse and network.flow_model is None and fleet.uniform_bandwidth
+    if gpu_ids is None:
+        gpu_ids = range(0, num_gpus)
+    class_ids = fleet.class_ids
+    # GPUArray of each array-backed GPU id, see gpu_array.py
+    arrays: Dict[int, GPUArray] = {}
+    if array_backed and isinstance(engine, CompactSimulationEngine):
+        supported: Dict[int, bool] = {}
+        classes: Dict[Tuple[int, int, int], List[int]] = {}
+        for gpu_id in gpu_ids:
+            program = programs[gpu_id]
+            program_id = id(program)
+            if program_id not in supported:
+                supported[program_id] = supports_arrays(program)
+            if supported[program_id]:
+                key = (program_id, class_ids[gpu_id], chunk_size_bytes)
+                classes.setdefault(key, []).append(gpu_id)
+        for class_gpu_ids in classes.values():
+            first = class_gpu_ids[0]
+            gpu_array = GPUArray(
+                class_gpu_ids,
+                programs[first],
+                fleet.compute_tflops[first],
+                chunk_size_bytes,
+                network,
+                engine,
+                fleet.compute_model(first),
+                compute_cache,
+                compute_streams,
+                comm_channels,
+                collapse,
+            )
+            engine.register_objects(gpu_array.gpu_ids, gpu_array)
+            arrays.update(dict.fromkeys(class_gpu_ids, gpu_array))
+            if collapse:
+                for gpu_id in class_gpu_ids[1:]:
+                    network.representatives[gpu_id] = first
+    representatives: Dict[Tuple[int, int, int], GPU] = {}
+    # their GPUViews are created when the GPUs are read
+    gpus: List[Union[GPU, GPUArray]] = []
+    for gpu_id in gpu_ids:
+        backing = arrays.get(gpu_id)
+        if backing is not None:
+            gpus.append(backing)
+            continue
+        key = (id(programs[gpu_id]), class_ids[gpu_id], chunk_size_bytes)
+        if collapse and key in representatives:
+            gpus.append(ReplicaGPU(gpu_id, representatives[key]))
+            # it arrives at the collectives for its replicas
+            network.representatives[gpu_id] = representatives[key].gpu_id
+            continue
         gpu: GPU = GPU(
-            gpu_id, instruction_lines, compute_tflops, chunk_size_bytes, network, engine
+            gpu_id,
+            programs[gpu_id],
+            fleet.compute_tflops[gpu_id],
+            chunk_size_bytes,
+            network,
+            engine,
+            fleet.compute_model(gpu_id),
+            compute_cache,
+            compute_streams,
+            comm_channels,
         )
         engine.register_object(gpu_id, gpu)
         gpus.append(gpu)
+        representatives[key] = gpu
 
-    return engine, gpus
+    return engine, GPUViews(gpu_ids, gpus)
 
 
 def main() -> None:
     """Main function to run the simulation."""
+    parser = argparse.ArgumentParser(description="Run the simulation.")
+    parser.add_argument("--trace", help="record the events to this binary file")
+    parser.add_argument("--trace-level", choices=["events", "debug"], default="events")
+    parser.add_argument(
+        "--stream", action="store_true", help="read the GPU trace lazily while running"
+    )
+    parser.add_argument(
+        "--per-rank",
+        action="store_true",
+        help="the GPU trace is tagged by rank in the Source column",
+    )
+    parser.add_argument(
+        "--collapse",
+        action="store_true",
+        help="simulate one GPU per class of identical GPUs (symmetry collapse)",
+    )
+    parser.add_argument(
+        "--array-backed",
+        action="store_true",
+        help="hold the state of the GPUs in arrays, for a fast startup of large systems",
+    )
+    parser.add_argument("--checkpoint", help="append snapshots to this file")
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=int,
+        default=1000000,
+        help="simulated ns between snapshots",
+    )
+    parser.add_argument(
+        "--checkpoint-sync",
+        action="store_true",
+        help="sync every snapshot to disk (slower, survives an OS crash)",
+    )
+    parser.add_argument("--resume", help="resume from the last snapshot of this file")
+    parser.add_argument(
+        "--steady-state",
+        action="store_true",
+        help="extrapolate the iterations once they repeat",
+    )
+    parser.add_argument(
+        "--results",
+        help="write the finished instructions to this CSV (or .parquet) file "
+        "and print a summary, requires numpy",
+    )
+    parser.add_argument(
+        "--batch-events",
+        action="store_true",
+        help="coalesce the events of a type at the same time (SPMD runs)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="time the event handlers and print a profile report",
+    )
+    parser.add_argument(
+        "--profile-interval",
+        type=int,
+        default=1000000,
+        help="simulated ns between samples of the event queue",
+    )
+    args = parser.parse_args()
+    if args.steady_state and args.checkpoint:
+        parser.error("--steady-state can't be combined with --checkpoint")
+    if args.results and args.stream:
+        parser.error("--results needs all the instructions, it can't use --stream")
     system_config_file = "system_config.txt"
     trace_file = "gpu_trace.txt"
 
     # Read input and initialize simulation
-    engine, gpus = initialize_simulation(trace_file, system_config_file)
+    engine, gpus = initialize_simulation(
+        trace_file,
+        system_config_file,
+        compact_events=True,
+        streaming=args.stream,
+        per_rank=args.per_rank,
+        collapse=args.collapse,
+        batch_events=args.batch_events,
+        array_backed=args.array_backed,
+    )
+
+    if args.trace:
+        engine.tracer = TraceRecorder(TraceLevel[args.trace_level.upper()], args.trace)
+
+    profiler: Optional[Profiler] = None
+    if args.profile:
+        profiler = Profiler(args.profile_interval).attach(engine)
 
-    # Start initial instructions for all GPUs
-    for gpu in gpus:
-        gpu.start_gpu()
+    if args.resume:
+        restore(args.resume, engine, gpus)
+    else:
+        # Start initial instructions for all GPUs
+        for gpu in gpus:
+            gpu.start_gpu()
 
     # Run the simulation
-    engine.run()
+    if args.checkpoint:
+        run_with_checkpoints(
+            engine,
+            gpus,
+            args.checkpoint,
+            args.checkpoint_interval,
+            append=args.checkpoint == args.resume,
+            sync=args.checkpoint_sync,
+        )
+    elif args.steady_state:
+        print(run_steady_state(engine, gpus))
+    else:
+        engine.run()
+    engine.tracer.close()
+    if profiler is not None:
+        print(profiler.report())
+
+    if args.results:
+        from results import Results
+
+        results = Results.from_gpus(gpus)
+        results.export(args.results)
+        print(json.dumps(results.summary(), indent=2))
 
 
 if __name__ == "__main__":
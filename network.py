@@ -1,5 +1,75 @@
-from simulation_engine import Event, SimulationEngine
-import math
+"""The network connecting the GPUs.
+
+Communications are sent when the GPU issues them. A collective is a rendezvous
+of the ranks of its group (the ranks in its Destination field, `0-3`, or every
+GPU when it's empty): it starts when the last rank of the group issued it, and
+ends for all of them at the same time. The collectives of a group are matched
+in issue order, the k-th one issued by each rank is the same collective, and
+each one keeps an arrival counter so no scan of the GPUs is needed. With the
+symmetry collapse, a simulated GPU arrives for all the ranks it represents.
+
+Point-to-point transfers don't wait for the destination.
+
+With event batching (see CompactSimulationEngine), the COMM_START events of a
+time come in one batch: consecutive arrivals at the same collective are
+counted at once, with one notification of the other LPs.
+"""
+
+from array import array
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from collectives import (
+    COLLECTIVE_MODES,
+    COLLECTIVES,
+    CollectiveRun,
+    Phase,
+    collective_phases,
+    collective_time,
+    phase_peers,
+)
+from flow_model import FLOW_DONE, NETWORK_MODELS, FlowModel
+from program import Program
+from rank_trace import parse_ranks
+from simulation_engine import (
+    BatchHandler,
+    Event,
+    Handler,
+    SimulationEngine,
+    register_event_type,
+)
+from trace_recorder import TraceKind, TraceLevel
+
+COMM_START: int = register_event_type("COMM_START")
+COMM_DONE: int = register_event_type("COMM_DONE")
+# a chunk transfer of a collective finished, in the detailed collective mode
+CHUNK_DONE: int = register_event_type("CHUNK_DONE")
+# a rank arrived at a collective, sent to the network segments of the other
+# LPs by the parallel engine (see parallel_engine.py)
+COLLECTIVE_ARRIVE: int = register_event_type("COLLECTIVE_ARRIVE")
+
+# a collective: (first rank, end of the ranks of its group, number in the group)
+CollectiveKey = Tuple[int, int, int]
+
+
+class Rendezvous:
+    """A collective waiting for the ranks of its group."""
+
+    __slots__ = ("operation", "size_bytes", "arrived", "start_ns", "waiting")
+
+    def __init__(self, operation: str, size_bytes: int) -> None:
+        self.operation: str = operation
+        self.size_bytes: int = size_bytes
+        self.arrived: int = 0  # ranks, weighted by the GPUs they represent
+        self.start_ns: int = 0  # time of the last arrival
+        # (src_gpu, reply) of the simulated GPUs waiting here
+        self.waiting: List[Tuple[int, Any]] = []
+
+    def __getstate__(self) -> Tuple[Any, ...]:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state: Tuple[Any, ...]) -> None:
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
 
 
 class Network:
@@ -10,37 +80,486 @@ class Network:
         bandwidth_GBps: int,
         topology: str,
         engine: SimulationEngine,
+        chunk_size_bytes: int = 0,
+        latency_ns: int = 0,
+        collective_mode: str = "ANALYTIC",
+        network_model: str = "IDEAL",
+        bandwidths: Optional[Sequence[float]] = None,
     ) -> None:
-        print(f"get object id = {object_id}")
         self.object_id: int = object_id
         self.num_gpus: int = num_gpus
-        self.bandwidth_GBps: int = bandwidth_GBps  # Assume GPUs have the same bandwidth
+        self.bandwidth_GBps: int = bandwidth_GBps  # nominal, of every GPU by default
+        # link bandwidth of each GPU, indexed by gpu_id (see fleet.py)
+        self.bandwidths: array = array(
+            "d", [bandwidth_GBps] * num_gpus if bandwidths is None else bandwidths
+        )
         self.topology: str = topology
         self.engine: SimulationEngine = engine
+        # collectives are sent in chunks of this size, 0 for no chunking
+        self.chunk_size_bytes: int = chunk_size_bytes
+        self.latency_ns: int = latency_ns  # per chunk transfer
+        # ANALYTIC: closed-form collective times, DETAILED: an event per chunk
+        self.collective_mode: str = collective_mode.upper()
+        if self.collective_mode not in COLLECTIVE_MODES:
+            raise ValueError(f"Unknown collective mode {collective_mode}")
+        # closed-form times, keyed by (operation, size_bytes, bandwidth, ranks)
+        self._collective_times: Dict[Tuple[str, int, float, int], int] = {}
+        # IDEAL: every GPU always gets the full bandwidth, FLOW: the transfers
+        # are flows sharing the links, with max-min fair rates
+        self.network_model: str = network_model.upper()
+        if self.network_model not in NETWORK_MODELS:
+            raise ValueError(f"Unknown network model {network_model}")
+        self.flow_model: Optional[FlowModel] = None
+        if self.network_model == "FLOW":
+            self.flow_model = FlowModel(
+                engine, object_id, num_gpus, bandwidth_GBps, topology, bandwidths
+            )
+        # the simulated GPU of each rank, set by the symmetry collapse
+        self.representatives: array = array("i", range(num_gpus))
+        self._groups: Dict[str, range] = {}  # by Destination field
+        # per group: the slowest bandwidth and the ranks each GPU arrives for
+        self._group_bandwidths: Dict[range, float] = {}
+        self._group_weights: Dict[range, Dict[int, int]] = {}
+        # collectives issued by each rank of a group
+        self._issued: Dict[range, array] = {}
+        self._rendezvous: Dict[CollectiveKey, Rendezvous] = {}
+        # parallel engine: the object ids of the network segments of the other
+        # LPs, notified of the arrivals notify_delay_ns later (the lookahead)
+        self.peer_targets: List[int] = []
+        self.notify_delay_ns: int = 0
 
     def handle_event(self, event: Event) -> None:
         """Processes network-related events."""
         if event.event_type == "COMM_START":
             self.handle_comm_start(event)
+        elif event.event_type == "CHUNK_DONE":
+            self.on_chunk_done(event.timestamp, self.object_id, event.args["payload"])
+        elif event.event_type == "FLOW_DONE" and self.flow_model is not None:
+            self.flow_model.on_flow_done(
+                event.timestamp, self.object_id, event.args["payload"]
+            )
         else:
             raise ValueError(f"Unknown event type {event.event_type} for Network")
 
+    def event_handlers(self) -> Dict[int, Handler]:
+        """Handlers of compact events, used by CompactSimulationEngine."""
+        handlers: Dict[int, Handler] = {
+            COMM_START: self.on_comm_start,
+            CHUNK_DONE: self.on_chunk_done,
+            COLLECTIVE_ARRIVE: self.on_collective_arrive,
+        }
+        if self.flow_model is not None:
+            handlers[FLOW_DONE] = self.flow_model.on_flow_done
+        return handlers
+
+    def batch_handlers(self) -> Dict[int, BatchHandler]:
+        """Handlers of batches of compact events, see CompactSimulationEngine."""
+        return {COMM_START: self.on_comm_start_batch}
+
     def handle_comm_start(self, event: Event) -> None:
         """Handles the start of a communication event."""
-        src_gpu: int = event.args["src_gpu"]
-        size_bytes: float = event.args["size_bytes"]
-        transfer_time_ns: int = math.ceil((size_bytes / self.bandwidth_GBps))
+        ins = event.args["ins"]
+        self.start_comm(
+            event.timestamp,
+            event.args["src_gpu"],
+            ins.index,
+            event.args["size_bytes"],
+            ins.operation,
+            ins.destination,
+            ins,
+        )
 
-        print(
-            f"Network: GPU {src_gpu} starts sending {size_bytes} data to all other GPUs"
+    def on_comm_start(
+        self,
+        timestamp: int,
+        target_id: int,
+        payload: Tuple[int, int, int, str, str],
+    ) -> None:
+        """Compact form of handle_comm_start(), the payload is
+        (src_gpu, instruction index, size_bytes, operation, destination).
+        """
+        src_gpu, index, size_bytes, operation, destination = payload
+        self.start_comm(
+            timestamp, src_gpu, index, size_bytes, operation, destination, index
+        )
+
+    def on_comm_start_batch(
+        self,
+        timestamp: int,
+        target_ids: List[int],
+        payloads: List[Tuple[int, int, int, str, str]],
+    ) -> None:
+        """Batch form of on_comm_start(), the same as calling it for each payload
+        in order, but the consecutive arrivals at a collective join it at once.
+        """
+        tracer = self.engine.tracer
+        debug = tracer.level >= TraceLevel.DEBUG
+        pending: Optional[Tuple[CollectiveKey, str, int]] = None
+        weight = 0
+        waiters: List[Tuple[int, Any]] = []
+        for src_gpu, index, size_bytes, operation, destination in payloads:
+            if operation.upper() in COLLECTIVES:
+                if debug:
+                    tracer.record(src_gpu, TraceKind.NETWORK_SEND, timestamp, index)
+                key, rank_weight = self.arrival(src_gpu, destination)
+                if pending is not None and pending[0] != key:
+                    self.notify_peers(pending[0], weight, timestamp, *pending[1:])
+                    self.join(*pending, weight, timestamp, waiters)
+                    weight, waiters = 0, []
+                pending = (key, operation, size_bytes)
+                weight += rank_weight
+                waiters.append((src_gpu, index))
+                continue
+            if pending is not None:
+                self.notify_peers(pending[0], weight, timestamp, *pending[1:])
+                self.join(*pending, weight, timestamp, waiters)
+                pending, weight, waiters = None, 0, []
+            self.start_comm(
+                timestamp, src_gpu, index, size_bytes, operation, destination, index
+            )
+        if pending is not None:
+            self.notify_peers(pending[0], weight, timestamp, *pending[1:])
+            self.join(*pending, weight, timestamp, waiters)
+
+    def start_comm(
+        self,
+        timestamp: int,
+        src_gpu: int,
+        index: int,
+        size_bytes: int,
+        operation: str,
+        destination: str,
+        reply: Any,
+    ) -> None:
+        """Starts the transfer of the instruction `index` of the source GPU.
+        Collectives wait for the ranks of their group, then are decomposed
+        along the topology, see collectives.py.
+        Other operations go to the destination GPU (the next one if it's not
+        a rank), only the flow model uses it.
+        `reply` is handed back to the GPU when it's done, see finish_comm().
+        """
+        tracer = self.engine.tracer
+        if tracer.level >= TraceLevel.DEBUG:
+            tracer.record(src_gpu, TraceKind.NETWORK_SEND, timestamp, index)
+
+        if operation.upper() in COLLECTIVES:
+            self.arrive(timestamp, src_gpu, size_bytes, operation, destination, reply)
+            return
+        if self.flow_model is not None:
+
+            def done(end_ns: int) -> None:
+                self.finish_comm(end_ns, src_gpu, reply)
+
+            self.flow_model.start_flow(
+                timestamp,
+                src_gpu,
+                self.destination_gpu(src_gpu, destination),
+                size_bytes,
+                done,
+            )
+            return
+        # the slower end of the transfer
+        bandwidths = self.bandwidths
+        bandwidth = min(
+            bandwidths[src_gpu],
+            bandwidths[self.destination_gpu(src_gpu, destination)],
+        )
+        if self.collective_mode == "DETAILED":
+            CollectiveRun(
+                self, src_gpu, self.phases(operation, size_bytes), reply, bandwidth
+            ).start(timestamp)
+            return
+        transfer_time_ns = self.transfer_time_ns(
+            operation, size_bytes, self.all_gpus, bandwidth
         )
+        self.finish_comm(timestamp + transfer_time_ns, src_gpu, reply)
+
+    @property
+    def all_gpus(self) -> range:
+        return range(self.num_gpus)
+
+    def transfer_time_ns(
+        self, operation: str, size_bytes: int, group: range, bandwidth: float
+    ) -> int:
+        """Closed-form time of a communication among the ranks of `group`."""
+        key = (operation, size_bytes, bandwidth, len(group))
+        transfer_time_ns = self._collective_times.get(key)
+        if transfer_time_ns is None:
+            transfer_time_ns = collective_time(
+                self.phases(operation, size_bytes, len(group)),
+                self.chunk_size_bytes,
+                bandwidth,
+                self.latency_ns,
+            )
+            self._collective_times[key] = transfer_time_ns
+        return transfer_time_ns
+
+    def group(self, destination: str) -> range:
+        """Ranks of the group of a collective, from its Destination field."""
+        group = self._groups.get(destination)
+        if group is None:
+            group = parse_ranks(destination) or self.all_gpus
+            if not group or group.start < 0 or group.stop > self.num_gpus:
+                raise ValueError(f"Wrong group {destination} of a collective")
+            self._groups[destination] = group
+            # a collective runs at the pace of the slowest GPU of the group
+            self._group_bandwidths[group] = min(self.bandwidths[gpu] for gpu in group)
+        return group
+
+    def arrival_weight(self, group: range, src_gpu: int) -> int:
+        """Ranks of the group the simulated GPU arrives for."""
+        weights = self._group_weights.get(group)
+        if weights is None:
+            representatives = self.representatives
+            weights = Counter(representatives[gpu] for gpu in group)
+            self._group_weights[group] = weights
+        if src_gpu not in group:
+            raise ValueError(
+                f"GPU {src_gpu} is not in the group {group} of its collective"
+            )
+        return weights[src_gpu]
 
-        # Schedule the end of transmission event for the destination GPU
-        # Pass the instruction back to the source GPU
+    def arrive(
+        self,
+        timestamp: int,
+        src_gpu: int,
+        size_bytes: int,
+        operation: str,
+        destination: str,
+        reply: Any,
+    ) -> None:
+        """A GPU issued a collective, it waits for the other ranks of its group."""
+        key, weight = self.arrival(src_gpu, destination)
+        self.notify_peers(key, weight, timestamp, operation, size_bytes)
+        self.join(key, operation, size_bytes, weight, timestamp, [(src_gpu, reply)])
+
+    def arrival(self, src_gpu: int, destination: str) -> Tuple[CollectiveKey, int]:
+        """The collective a GPU issues next to the group of destination, and the
+        number of ranks it arrives for.
+        """
+        group = self.group(destination)
+        issued = self._issued.get(group)
+        if issued is None:
+            issued = self._issued[group] = array("q", bytes(8 * len(group)))
+        number = issued[src_gpu - group.start]
+        issued[src_gpu - group.start] = number + 1
+        key = (group.start, group.stop, number)
+        return key, self.arrival_weight(group, src_gpu)
+
+    def notify_peers(
+        self,
+        key: CollectiveKey,
+        weight: int,
+        timestamp: int,
+        operation: str,
+        size_bytes: int,
+    ) -> None:
+        """Sends arrivals to the other LPs, with the parallel engine."""
+        for target in self.peer_targets:
+            self.engine.post(
+                timestamp + self.notify_delay_ns,
+                COLLECTIVE_ARRIVE,
+                target,
+                (key, weight, timestamp, operation, size_bytes),
+            )
+
+    def on_collective_arrive(
+        self,
+        timestamp: int,
+        target_id: int,
+        payload: Tuple[CollectiveKey, int, int, str, int],
+    ) -> None:
+        """Arrival of ranks simulated by another LP, the payload is (collective,
+        weight, arrival time, operation, size_bytes).
+        """
+        key, weight, arrival_ns, operation, size_bytes = payload
+        self.join(key, operation, size_bytes, weight, arrival_ns, [])
+
+    def join(
+        self,
+        key: CollectiveKey,
+        operation: str,
+        size_bytes: int,
+        weight: int,
+        arrival_ns: int,
+        waiters: List[Tuple[int, Any]],
+    ) -> None:
+        """Counts the arrival of `weight` ranks, the GPUs waiting for the end are
+        (src_gpu, reply) pairs. The collective starts with the last arrival.
+        """
+        rendezvous = self._rendezvous.get(key)
+        if rendezvous is None:
+            rendezvous = self._rendezvous[key] = Rendezvous(operation, size_bytes)
+        rendezvous.arrived += weight
+        rendezvous.start_ns = max(rendezvous.start_ns, arrival_ns)
+        rendezvous.waiting.extend(waiters)
+        group = range(key[0], key[1])
+        if rendezvous.arrived == len(group):
+            del self._rendezvous[key]
+            self.run_collective(rendezvous, group)
+
+    def run_collective(self, rendezvous: Rendezvous, group: range) -> None:
+        """Runs a collective all the ranks of its group arrived at."""
+        operation = rendezvous.operation
+        size_bytes = rendezvous.size_bytes
+        start_ns = rendezvous.start_ns
+        bandwidth = self._group_bandwidths[group]
+        if self.collective_mode == "DETAILED" or self.flow_model is not None:
+            phases = self.phases(operation, size_bytes, len(group))
+            for src_gpu, reply in rendezvous.waiting:
+                CollectiveRun(self, src_gpu, phases, reply, bandwidth, group).start(
+                    start_ns
+                )
+            return
+        end_ns = start_ns + self.transfer_time_ns(
+            operation, size_bytes, group, bandwidth
+        )
+        # caused by the last arrival, even when another LP reports it later
+        for src_gpu, reply in rendezvous.waiting:
+            self.finish_comm(end_ns, src_gpu, reply, start_ns)
+
+    def drop_transfers(self) -> None:
+        """Forgets the collectives waiting for ranks and the flows in progress,
+        when their events are dropped (see steady_state.py).
+        """
+        self._rendezvous.clear()
+        if self.flow_model is not None:
+            self.flow_model.drop_flows()
+
+    def pending_collectives(self) -> int:
+        """Collectives some ranks of the group have not issued yet."""
+        return len(self._rendezvous)
+
+    def save_state(self) -> Dict[str, Any]:
+        """The rendezvous state, for checkpoints (see checkpoint.py)."""
+        return {
+            "issued": {
+                (group.start, group.stop): issued
+                for group, issued in self._issued.items()
+            },
+            "rendezvous": self._rendezvous,
+        }
+
+    def load_state(self, state: Dict[str, Any]) -> None:
+        self._issued = {
+            range(start, stop): issued
+            for (start, stop), issued in state["issued"].items()
+        }
+        self._rendezvous = state["rendezvous"]
+
+    def destination_gpu(self, src_gpu: int, destination: str) -> int:
+        """GPU of the Destination field, the next GPU if it's not a rank."""
+        return (int(destination) if destination.isdigit() else src_gpu + 1) % (
+            self.num_gpus
+        )
+
+    def lookahead_ns(self, programs: Sequence[Program] = ()) -> Optional[int]:
+        """Smallest delay between an event of a GPU and its effect on another GPU
+        running one of the programs, the lookahead of the parallel engine (see
+        parallel_engine.py).
+        The GPUs interact through the collectives: the last arrival at a
+        collective ends it for the group at least its duration later (the link
+        latency and transfer time), so it's the shortest collective of the
+        programs. None when there is none: with the IDEAL model every
+        point-to-point transfer only completes on its own GPU.
+        With the flow model the flows of all the GPUs share the links at any
+        time, and detailed collectives start their chunk transfers at the last
+        arrival, so it's 0.
+        """
+        if self.flow_model is not None:
+            return 0
+        lookahead_ns: Optional[int] = None
+        for program in {id(program): program for program in programs}.values():
+            for index in program.comm_indices:
+                operation = program.operation(index)
+                if operation.upper() not in COLLECTIVES:
+                    continue
+                if self.collective_mode == "DETAILED":
+                    return 0
+                group = self.group(program.destination(index))
+                duration_ns = self.transfer_time_ns(
+                    operation,
+                    program.sizes[index],
+                    group,
+                    self._group_bandwidths[group],
+                )
+                if lookahead_ns is None or duration_ns < lookahead_ns:
+                    lookahead_ns = duration_ns
+        return lookahead_ns
+
+    def phases(
+        self, operation: str, size_bytes: int, num_gpus: Optional[int] = None
+    ) -> List[Phase]:
+        """The phases of a communication of `size_bytes` on the topology, among
+        num_gpus ranks (all of them by default).
+        """
+        return collective_phases(
+            operation,
+            self.topology,
+            self.num_gpus if num_gpus is None else num_gpus,
+            size_bytes,
+        )
+
+    def send_chunk(
+        self,
+        timestamp: int,
+        run: CollectiveRun,
+        step: int,
+        size_bytes: int,
+        duration_ns: int,
+    ) -> None:
+        """Starts a chunk transfer of a detailed collective. It takes duration_ns,
+        or with the flow model, it's a flow to each peer and ends with the last.
+        """
+        if self.flow_model is None:
+            self.engine.post(
+                timestamp + duration_ns, CHUNK_DONE, self.object_id, (run, step)
+            )
+            return
+        group = run.group
+        peers = [
+            group[peer]
+            for peer in phase_peers(
+                self.topology, len(group), run.src_gpu - group.start, run.phase
+            )
+        ]
+        if not peers:
+            run.on_chunk_done(timestamp, step)
+            return
+        pending = [len(peers)]
+
+        def done(end_ns: int) -> None:
+            pending[0] -= 1
+            if pending[0] == 0:
+                run.on_chunk_done(end_ns, step)
+
+        for peer in peers:
+            self.flow_model.start_flow(timestamp, run.src_gpu, peer, size_bytes, done)
+
+    def on_chunk_done(
+        self, timestamp: int, target_id: int, payload: Tuple[CollectiveRun, int]
+    ) -> None:
+        run, step = payload
+        run.on_chunk_done(timestamp, step)
+
+    def finish_comm(
+        self, timestamp: int, src_gpu: int, reply: Any, cause_ns: Optional[int] = None
+    ) -> None:
+        """Schedules the end of transmission event for the source GPU.
+        The reply is the instruction index on the compact engine, the Instruction
+        object otherwise. cause_ns is the time of its cause when it's not now,
+        see SimulationEngine.post_caused().
+        """
+        if self.engine.compact_events:
+            if cause_ns is None:
+                self.engine.post(timestamp, COMM_DONE, src_gpu, reply)
+            else:
+                self.engine.post_caused(cause_ns, timestamp, COMM_DONE, src_gpu, reply)
+            return
         comm_finish_event: Event = Event(
-            timestamp=event.timestamp + transfer_time_ns,
+            timestamp=timestamp,
             event_type="COMM_DONE",
             target_id=src_gpu,
-            args={"ins": event.args["ins"]},
+            args={"ins": reply},
         )
         self.engine.schedule_event(comm_finish_event)
@@ -0,0 +1,366 @@
+"""Parallel discrete-event simulation (PDES) across processes.
+
+The GPUs are split in logical processes (LPs) of consecutive GPU ids. Each LP
+runs in its own process, with its own event queue (a PartitionEngine), its GPUs
+and a replica of the Network serving them (the network segment of the LP).
+
+The LPs are synchronized conservatively, in time windows: the coordinator takes
+the time T of the earliest pending event of all the LPs, then every LP processes
+its events before T + lookahead. The lookahead is the smallest delay between an
+event of a GPU and its effect on another GPU (Network.lookahead_ns()), so an
+event sent to another LP during a window is never in that window: the messages
+are exchanged at the end of the window, delivered before the next one, and no
+LP ever receives an event in its past.
+
+The GPUs interact through the collectives (IDEAL network model): the arrival
+of a rank at a collective is sent to the network segments of the other LPs
+(each registered under its own object id, see segment_id()), at the arrival
+time plus the lookahead. Every network segment counts all the arrivals and releases its
+own ranks when the last one arrived, at the same end time as the sequential
+run. The lookahead is the duration of the shortest collective, so the end is
+never before the last arrival is known. Without collectives the lookahead is
+unbounded and each LP runs to completion in one window; when the GPUs interact
+at any time (FLOW model, lookahead 0) the simulation falls back to the
+sequential engine.
+
+Both engines process the events of a time in the order of the times of their
+causes, then in posting order (see SimulationEngine.post_caused()). The
+sequential engine posts every event at the time of its cause, so its seq order
+is this order. An LP learns of the last arrival at a collective of another LP
+a lookahead later: the ends of the collective are caused by that arrival, and
+the PartitionEngine orders them by its time, as the sequential engine does,
+before the events posted in between. For this its seqs are the time of their
+cause followed by its posting counter (SEQ_BITS bits). The messages between LPs
+are delivered in (timestamp, seq, source LP) order. The finished instructions
+are then the same as in the sequential run, in the same order.
+
+The programs are handed to the workers by fork, without pickling or copying
+them. The trace recorder is not supported in the workers.
+"""
+
+import heapq
+import multiprocessing
+import sys
+from multiprocessing.connection import Connection
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from fleet import Fleet
+from gpu import GPU
+from main import build_simulation
+from network import Network
+from program import Program
+from scheduler import Scheduler, make_scheduler
+from simulation_engine import (
+    CompactEvent,
+    CompactSimulationEngine,
+    EventHandle,
+    SimulationEngine,
+)
+
+# (index, start time, end time) of the finished instructions of a GPU, in order
+FinishedLog = List[Tuple[int, int, int]]
+# an event sent to another LP: (timestamp, seq, source LP, event_code, target_id,
+# payload), sorting them gives the delivery order
+Message = Tuple[int, int, int, int, int, Any]
+# bits of the posting counter in the seqs of a PartitionEngine, the time of the
+# cause is above them
+SEQ_BITS: int = 40
+
+
+class ParallelResult(NamedTuple):
+    finished: Dict[int, FinishedLog]  # by GPU id
+    end_time_ns: int
+    events_processed: int
+    num_lps: int  # 1 when it ran sequentially
+    windows: int  # synchronization rounds
+
+
+def segment_id(num_gpus: int, lp: int) -> int:
+    """Object id of the network segment of an LP for the other LPs, after the
+    ids of the GPUs and of the network.
+    """
+    return num_gpus + 1 + lp
+
+
+class PartitionEngine(CompactSimulationEngine):
+    """Compact engine of one LP. The events posted to the GPUs and network
+    segments of other LPs (owners maps these ids to their LP) are not queued
+    but collected in the outbox, for the coordinator.
+    """
+
+    def __init__(
+        self, lp: int, owners: Sequence[int], scheduler: Optional[Scheduler] = None
+    ) -> None:
+        super().__init__(scheduler)
+        self.lp: int = lp
+        self.owners: Sequence[int] = owners  # LP of each GPU id
+        self.outbox: List[Message] = []
+        # end of the current window, the messages must not be before it
+        self.window_end_ns: int = 0
+
+    def post(
+        self, timestamp: int, event_code: int, target_id: int, payload: Any
+    ) -> EventHandle:
+        return self.post_caused(
+            self.current_time_ns, timestamp, event_code, target_id, payload
+        )
+
+    def post_caused(
+        self,
+        cause_ns: int,
+        timestamp: int,
+        event_code: int,
+        target_id: int,
+        payload: Any,
+    ) -> EventHandle:
+        """Queues an event after the events of its time with an earlier cause,
+        or sends it to the LP of its target.
+        """
+        seq = (cause_ns << SEQ_BITS) + self._seq
+        self._seq += 1
+        entry: CompactEvent = (timestamp, seq, event_code, target_id, payload)
+        if target_id < len(self.owners) and self.owners[target_id] != self.lp:
+            if timestamp < self.window_end_ns:
+                raise RuntimeError(
+                    f"Event at {timestamp} for object {target_id} inside the window "
+                    f"ending at {self.window_end_ns}: the lookahead is too large"
+                )
+            self.outbox.append(
+                (timestamp, seq, self.lp, event_code, target_id, payload)
+            )
+        elif self._heap:
+            heapq.heappush(self.event_queue, entry)
+        else:
+            self.event_queue.push(timestamp, entry)
+        return entry
+
+    def deliver(self, messages: List[Message]) -> None:
+        """Queues the events received from other LPs, in delivery order, with
+        the times of their causes.
+        """
+        for timestamp, seq, _, event_code, target_id, payload in messages:
+            self.post_caused(seq >> SEQ_BITS, timestamp, event_code, target_id, payload)
+
+
+def partition(num_gpus: int, num_lps: int) -> List[range]:
+    """Splits the GPU ids in num_lps blocks of consecutive ids, as even as possible."""
+    num_lps = max(1, min(num_lps, num_gpus))
+    bounds = [num_gpus * lp // num_lps for lp in range(num_lps + 1)]
+    return [range(bounds[lp], bounds[lp + 1]) for lp in range(num_lps)]
+
+
+def finished_log(gpu: GPU) -> FinishedLog:
+    """The finished instructions of a GPU with their start and end times."""
+    return [
+        (index, gpu.start_times[index], gpu.end_times[index])
+        for index in gpu.finished_instructions.indices
+    ]
+
+
+def _run_lp(
+    conn: Connection,
+    lp: int,
+    gpu_ids: range,
+    owners: List[int],
+    programs: List[Program],
+    config_dict: Dict[str, str],
+    scheduler: str,
+    collapse: bool,
+    lookahead_ns: Optional[int],
+) -> None:
+    """Worker of an LP: runs a window for each (end, messages) request of the
+    coordinator and replies (time of its next event, messages to other LPs).
+    None stops it, it then replies (finished logs, end time, events processed).
+    """
+    try:
+        # the network is in every LP, the segments are the network of their LP
+        num_gpus, num_lps = len(owners), owners[-1] + 1
+        engine = PartitionEngine(
+            lp, owners + [lp] + list(range(num_lps)), make_scheduler(scheduler)
+        )
+        _, gpus = build_simulation(
+            programs,
+            config_dict,
+            collapse=collapse,
+            gpu_ids=gpu_ids,
+            engine=engine,
+        )
+        # the arrivals at collectives go to the network segments of the other LPs
+        network = engine.objects[num_gpus]
+        engine.register_object(segment_id(num_gpus, lp), network)
+        if lookahead_ns is not None:
+            network.peer_targets = [
+                segment_id(num_gpus, other) for other in range(num_lps) if other != lp
+            ]
+            network.notify_delay_ns = lookahead_ns
+        for gpu in gpus:
+            gpu.start_gpu()
+        # nothing is before the current time: only returns the next event time
+        conn.send((engine.run_until(engine.current_time_ns), engine.outbox))
+        while True:
+            request = conn.recv()
+            if request is None:
+                break
+            end_ns, messages = request
+            engine.deliver(messages)
+            engine.outbox = []
+            engine.window_end_ns = sys.maxsize if end_ns is None else end_ns
+            conn.send((engine.run_until(end_ns), engine.outbox))
+        conn.send(
+            (
+                {gpu.gpu_id: finished_log(gpu) for gpu in gpus},
+                engine.current_time_ns,
+                engine.events_processed,
+            )
+        )
+    except Exception as error:
+        conn.send(error)
+    finally:
+        conn.close()
+
+
+def _receive(conn: Connection) -> Any:
+    reply = conn.recv()
+    if isinstance(reply, Exception):
+        raise reply
+    return reply
+
+
+def network_lookahead(
+    config_dict: Dict[str, str], programs: Sequence[Program] = ()
+) -> Optional[int]:
+    """Lookahead of the network of a system config running the programs, None
+    if unbounded.
+    """
+    num_gpus = int(config_dict["NUM_GPUS"])
+    return Network(
+        num_gpus,
+        num_gpus,
+        int(config_dict["NETWORK_BANDWIDTH"]),
+        config_dict["TOPOLOGY"],
+        SimulationEngine(),
+        int(config_dict["COMMUNICATION_CHUNK_SIZE"]),
+        int(config_dict.get("LINK_LATENCY", "0")),
+        config_dict.get("COLLECTIVE_MODE", "ANALYTIC"),
+        config_dict.get("NETWORK_MODEL", "IDEAL"),
+        Fleet(config_dict, num_gpus).bandwidth_GBps,
+    ).lookahead_ns(programs)
+
+
+def run_sequential(
+    programs: List[Program],
+    config_dict: Dict[str, str],
+    scheduler: str = "HEAP",
+    collapse: bool = False,
+) -> ParallelResult:
+    """Runs the simulation on the sequential compact engine."""
+    engine, gpus = build_simulation(
+        programs, config_dict, True, scheduler, collapse=collapse
+    )
+    for gpu in gpus:
+        gpu.start_gpu()
+    engine.run_until()
+    return ParallelResult(
+        {gpu.gpu_id: finished_log(gpu) for gpu in gpus},
+        engine.current_time_ns,
+        engine.events_processed,
+        1,
+        1,
+    )
+
+
+def run_parallel(
+    programs: List[Program],
+    config_dict: Dict[str, str],
+    num_lps: int,
+    scheduler: str = "HEAP",
+    collapse: bool = False,
+    lookahead_ns: Optional[int] = None,
+) -> ParallelResult:
+    """Runs the simulation in num_lps processes, GPU i runs programs[i].
+    The lookahead is the network's, or the given one if it's smaller (it only
+    adds windows). With a lookahead of 0, or one LP, it runs sequentially.
+    """
+    num_gpus = int(config_dict["NUM_GPUS"])
+    network_lookahead_ns = network_lookahead(config_dict, programs)
+    if lookahead_ns is None or (
+        network_lookahead_ns is not None and network_lookahead_ns < lookahead_ns
+    ):
+        lookahead_ns = network_lookahead_ns
+    blocks = partition(num_gpus, num_lps)
+    if lookahead_ns == 0 or len(blocks) == 1:
+        return run_sequential(programs, config_dict, scheduler, collapse)
+
+    owners = [lp for lp, block in enumerate(blocks) for _ in block]
+    # LP of each GPU and network segment id, the network is in every LP
+    routes = owners + [-1] + list(range(len(blocks)))
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    conns: List[Connection] = []
+    workers = []
+    for lp, block in enumerate(blocks):
+        parent_conn, child_conn = context.Pipe()
+        worker = context.Process(
+            target=_run_lp,
+            args=(
+                child_conn,
+                lp,
+                block,
+                owners,
+                programs,
+                config_dict,
+                scheduler,
+                collapse,
+                lookahead_ns,
+            ),
+            daemon=True,
+        )
+        worker.start()
+        child_conn.close()
+        conns.append(parent_conn)
+        workers.append(worker)
+
+    try:
+        next_times: List[Optional[int]] = []
+        inboxes: List[List[Message]] = [[] for _ in blocks]
+        replies = [_receive(conn) for conn in conns]
+        windows = 0
+        while True:
+            for next_ns, outbox in replies:
+                next_times.append(next_ns)
+                for message in outbox:
+                    inboxes[routes[message[4]]].append(message)
+            pending = [ns for ns in next_times if ns is not None]
+            pending += [message[0] for inbox in inboxes for message in inbox]
+            if not pending:
+                break
+            start_ns = min(pending)
+            end_ns = None if lookahead_ns is None else start_ns + lookahead_ns
+            for conn, inbox in zip(conns, inboxes):
+                conn.send((end_ns, sorted(inbox)))
+            inboxes = [[] for _ in blocks]
+            next_times = []
+            replies = [_receive(conn) for conn in conns]
+            windows += 1
+
+        finished: Dict[int, FinishedLog] = {}
+        end_time_ns = events_processed = 0
+        for conn in conns:
+            conn.send(None)
+            logs, lp_end_ns, lp_events = _receive(conn)
+            finished.update(logs)
+            end_time_ns = max(end_time_ns, lp_end_ns)
+            events_processed += lp_events
+    finally:
+        for conn in conns:
+            conn.close()
+        for worker in workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+    return ParallelResult(
+        dict(sorted(finished.items())),
+        end_time_ns,
+        events_processed,
+        len(blocks),
+        windows,
+    )
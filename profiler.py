@@ -0,0 +1,343 @@
+"""Opt-in profiling of the simulation engine: where the simulator time goes.
+
+A Profiler attached to an engine wraps the handlers its run loop dispatches to,
+so the loop itself is the engine's: it counts the events and times their
+handlers per (event type, target class, handler), e.g. (COMPUTE_DONE, GPU,
+GPU.on_compute_done). Every `sample_interval_ns` of simulated time it also
+samples the size of the event queue and the event rate. Hooks can be called
+before and after each dispatch, as hook(timestamp, event_type, target_id,
+payload) (the Event object is the payload on the SimulationEngine). With event
+batching, a batch dispatched to a batch handler is timed as one call and
+counts its events, the hooks are still called for each event.
+
+The engine only checks for a profiler when run_until() starts, so without one
+the run loop is unchanged and profiling costs nothing:
+    profiler = Profiler(sample_interval_ns=1000000).attach(engine)
+    engine.run()
+    print(profiler.report())
+"""
+
+from __future__ import annotations
+import contextlib
+import sys
+import time
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional
+from typing import Sequence, Tuple
+from simulation_engine import (
+    EVENT_TYPE_NAMES,
+    LEGACY_EVENT,
+    BatchHandler,
+    BatchHandlers,
+    CompactSimulationEngine,
+    Dispatch,
+    Event,
+    Handler,
+    SimulationEngine,
+)
+
+# called as hook(timestamp, event_type, target_id, payload)
+Hook = Callable[[int, str, int, Any], None]
+
+
+class HandlerStats(NamedTuple):
+    event_type: str
+    target_class: str
+    handler: str
+    events: int
+    total_s: float
+
+
+class Sample(NamedTuple):
+    time_ns: int  # simulated time
+    queue_size: int  # events left in the queue, with the cancelled ones
+    events_processed: int
+    wall_s: float  # profiled wall time so far
+    events_per_s: float  # since the previous sample
+
+
+def handler_name(handler: Any) -> str:
+    """Qualified name of a handler, "GPU.on_compute_done"."""
+    return getattr(handler, "__qualname__", repr(handler))
+
+
+class ProfiledTable:
+    """The dispatch table of an engine with the handlers wrapped by a profiler,
+    each row is wrapped when it's first dispatched to.
+    """
+
+    def __init__(self, profiler: Profiler, engine: CompactSimulationEngine) -> None:
+        self.profiler: Profiler = profiler
+        self.engine: CompactSimulationEngine = engine
+        # id of a row of the engine -> (row, wrapped row), rows are shared
+        self._rows: Dict[int, Tuple[Sequence[Optional[Handler]], List[Any]]] = {}
+
+    def __getitem__(self, target_id: int) -> Optional[Sequence[Optional[Handler]]]:
+        row = self.engine.dispatch_table[target_id]
+        if row is None:
+            return None
+        wrapped = self._rows.get(id(row))
+        if wrapped is None or wrapped[0] is not row:
+            wrapped = self._rows[id(row)] = (
+                row,
+                [
+                    (
+                        None
+                        if handler is None
+                        else self.profiler.wrap(self.engine, code, handler)
+                    )
+                    for code, handler in enumerate(row)
+                ],
+            )
+        return wrapped[1]
+
+
+class Profiler:
+    def __init__(self, sample_interval_ns: Optional[int] = None) -> None:
+        self.sample_interval_ns: Optional[int] = sample_interval_ns
+        self.before_dispatch: List[Hook] = []
+        self.after_dispatch: List[Hook] = []
+        # the statistics by (event type, target class, handler), in lists indexed
+        # by the position of the key, updated by the wrapped handlers
+        self._keys: Dict[Tuple[str, str, str], int] = {}
+        self._names: List[Tuple[str, str, str]] = []
+        self.counts: List[int] = []
+        self.seconds: List[float] = []
+        # (event type, target class) -> index in the lists, for Event objects
+        self._index: Dict[Tuple[str, type], int] = {}
+        # wrapped handlers of the compact engine, by the handler they wrap
+        self._wrapped: Dict[Tuple[int, Any], Handler] = {}
+        self._wrapped_batches: Dict[Tuple[int, Any], BatchHandler] = {}
+        self.samples: List[Sample] = []
+        self._next_sample_ns: int = 0 if sample_interval_ns else sys.maxsize
+        self.events_processed: int = 0
+        self.events_skipped: int = 0  # cancelled events popped
+        self.wall_s: float = 0.0
+        self._start: float = 0.0  # of the current run
+
+    def attach(self, engine: SimulationEngine) -> Profiler:
+        """Profiles the next runs of the engine."""
+        engine.profiler = self
+        return self
+
+    def detach(self, engine: SimulationEngine) -> None:
+        engine.profiler = None
+
+    @contextlib.contextmanager
+    def profiling(self, engine: SimulationEngine) -> Iterator[None]:
+        """Times a run of the engine, see SimulationEngine.run_until()."""
+        skipped = engine.events_skipped
+        self._start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.wall_s += time.perf_counter() - self._start
+            self.events_skipped += engine.events_skipped - skipped
+
+    def _stat(self, event_type: str, target_class: str, handler: str) -> int:
+        key = (event_type, target_class, handler)
+        index = self._keys.get(key)
+        if index is None:
+            index = self._keys[key] = len(self._names)
+            self._names.append(key)
+            self.counts.append(0)
+            self.seconds.append(0.0)
+        return index
+
+    def _sample(self, engine: SimulationEngine, timestamp: int) -> None:
+        wall_s = self.wall_s + time.perf_counter() - self._start
+        processed = self.events_processed
+        rate = 0.0
+        if self.samples:
+            previous = self.samples[-1]
+            if wall_s > previous.wall_s:
+                rate = (processed - previous.events_processed) / (
+                    wall_s - previous.wall_s
+                )
+        self.samples.append(
+            Sample(timestamp, len(engine.event_queue), processed, wall_s, rate)
+        )
+        interval = self.sample_interval_ns or 1
+        self._next_sample_ns = (timestamp // interval + 1) * interval
+
+    def instrument_dispatch(self, engine: SimulationEngine) -> Dispatch:
+        """engine.dispatch_event() timed per event type and target class."""
+        objects = engine.objects
+        index_of = self._index
+        clock = time.perf_counter
+        counts, seconds = self.counts, self.seconds
+        before, after = self.before_dispatch, self.after_dispatch
+        dispatch_event = engine.dispatch_event
+
+        def dispatch(event: Event) -> None:
+            timestamp = event.timestamp
+            if timestamp >= self._next_sample_ns:
+                self._sample(engine, timestamp)
+            target = objects.get(event.target_id)
+            key = (event.event_type, type(target))
+            index = index_of.get(key)
+            if index is None:
+                name = type(target).__name__
+                index = index_of[key] = self._stat(
+                    event.event_type, name, f"{name}.handle_event"
+                )
+            for hook in before:
+                hook(timestamp, event.event_type, event.target_id, event)
+            began = clock()
+            dispatch_event(event)
+            seconds[index] += clock() - began
+            counts[index] += 1
+            for hook in after:
+                hook(timestamp, event.event_type, event.target_id, event)
+            self.events_processed += 1
+
+        return dispatch
+
+    def instrument_table(self, engine: CompactSimulationEngine) -> ProfiledTable:
+        """The dispatch table of the engine, with its handlers wrapped."""
+        return ProfiledTable(self, engine)
+
+    def instrument_batch_handlers(
+        self, engine: CompactSimulationEngine
+    ) -> BatchHandlers:
+        """The batch handlers of the engine, wrapped."""
+        return {
+            key: self.wrap_batch(engine, key[0], batch_handler)
+            for key, batch_handler in engine.batch_handlers.items()
+        }
+
+    def wrap(
+        self, engine: CompactSimulationEngine, event_code: int, handler: Handler
+    ) -> Handler:
+        """The handler of an event code, timed."""
+        wrapped = self._wrapped.get((event_code, handler))
+        if wrapped is not None:
+            return wrapped
+        clock = time.perf_counter
+        counts, seconds = self.counts, self.seconds
+        before, after = self.before_dispatch, self.after_dispatch
+        event_type = EVENT_TYPE_NAMES[event_code]
+        index = -1
+
+        def profiled(timestamp: int, target_id: int, payload: Any) -> None:
+            nonlocal index
+            if index < 0:
+                name = type(engine.objects.get(target_id)).__name__
+                index = self._stat(
+                    event_type,
+                    name,
+                    # Event objects are handled by handle_event()
+                    (
+                        f"{name}.handle_event"
+                        if event_code == LEGACY_EVENT
+                        else handler_name(handler)
+                    ),
+                )
+            if timestamp >= self._next_sample_ns:
+                self._sample(engine, timestamp)
+            hook_type = event_type
+            if event_code == LEGACY_EVENT:
+                hook_type = payload.event_type
+            for hook in before:
+                hook(timestamp, hook_type, target_id, payload)
+            began = clock()
+            handler(timestamp, target_id, payload)
+            seconds[index] += clock() - began
+            counts[index] += 1
+            for hook in after:
+                hook(timestamp, hook_type, target_id, payload)
+            self.events_processed += 1
+
+        self._wrapped[event_code, handler] = profiled
+        return profiled
+
+    def wrap_batch(
+        self,
+        engine: CompactSimulationEngine,
+        event_code: int,
+        batch_handler: BatchHandler,
+    ) -> BatchHandler:
+        """The batch handler of an event code, timed as one call; the hooks are
+        called for each event before and after it.
+        """
+        wrapped = self._wrapped_batches.get((event_code, batch_handler))
+        if wrapped is not None:
+            return wrapped
+        event_type = EVENT_TYPE_NAMES[event_code]
+        index = -1
+
+        def profiled(
+            timestamp: int, target_ids: List[int], payloads: List[Any]
+        ) -> None:
+            nonlocal index
+            if index < 0:
+                index = self._stat(
+                    event_type,
+                    type(engine.objects.get(target_ids[0])).__name__,
+                    handler_name(batch_handler),
+                )
+            if timestamp >= self._next_sample_ns:
+                self._sample(engine, timestamp)
+            for hook in self.before_dispatch:
+                for target_id, payload in zip(target_ids, payloads):
+                    hook(timestamp, event_type, target_id, payload)
+            began = time.perf_counter()
+            batch_handler(timestamp, target_ids, payloads)
+            self.seconds[index] += time.perf_counter() - began
+            self.counts[index] += len(target_ids)
+            for hook in self.after_dispatch:
+                for target_id, payload in zip(target_ids, payloads):
+                    hook(timestamp, event_type, target_id, payload)
+            self.events_processed += len(target_ids)
+
+        self._wrapped_batches[event_code, batch_handler] = profiled
+        return profiled
+
+    def stats(self) -> List[HandlerStats]:
+        """The statistics of each handler, the most expensive first."""
+        rows = [
+            HandlerStats(*key, self.counts[i], self.seconds[i])
+            for i, key in enumerate(self._names)
+        ]
+        return sorted(rows, key=lambda row: -row.total_s)
+
+    def summary(self) -> Dict[str, Any]:
+        """The profile, as a JSON-serialisable dict."""
+        handler_s = sum(self.seconds)
+        return {
+            "events_processed": self.events_processed,
+            "events_skipped": self.events_skipped,
+            "wall_s": self.wall_s,
+            "events_per_s": self.events_processed / self.wall_s if self.wall_s else 0.0,
+            "handler_s": handler_s,
+            # popping, cancellation checks, sampling and the profiler itself
+            "loop_s": self.wall_s - handler_s,
+            "handlers": [row._asdict() for row in self.stats()],
+            "samples": [sample._asdict() for sample in self.samples],
+        }
+
+    def report(self, top: Optional[int] = None) -> str:
+        """A text table of the handlers, the most expensive first."""
+        summary = self.summary()
+        lines = [
+            f"{summary['events_processed']} events in {summary['wall_s']:.3f} s "
+            f"({summary['events_per_s']:,.0f} events/s), "
+            f"{summary['handler_s']:.3f} s in handlers, "
+            f"{summary['events_skipped']} cancelled events skipped",
+            f"{'event type':<20} {'target':<12} {'handler':<36} "
+            f"{'events':>10} {'total s':>9} {'mean us':>9} {'share':>6}",
+        ]
+        handler_s = summary["handler_s"] or 1.0
+        for row in self.stats()[:top]:
+            mean_us = 1e6 * row.total_s / row.events if row.events else 0.0
+            lines.append(
+                f"{row.event_type:<20} {row.target_class:<12} {row.handler:<36} "
+                f"{row.events:>10} {row.total_s:>9.3f} {mean_us:>9.2f} "
+                f"{row.total_s / handler_s:>6.1%}"
+            )
+        if self.samples:
+            peak = max(self.samples, key=lambda sample: sample.queue_size)
+            lines.append(
+                f"{len(self.samples)} samples, peak queue size {peak.queue_size} "
+                f"at {peak.time_ns} ns"
+            )
+        return "\n".join(lines)
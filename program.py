@@ -0,0 +1,520 @@
+"""Compiled form of a GPU trace.
+
+The trace is parsed once into columnar arrays (type code, size, operation code,
+source and destination codes), the strings are stored once in a string table.
+A Program is read-only after compilation and shared by all the GPUs running it,
+each GPU keeps only program counters and its own timestamp arrays.
+
+StreamingProgram reads the trace lazily instead, keeping only a window of it.
+
+A trace line may have two more columns, an instruction Id and the Ids of the
+instructions it depends on, separated by `;`:
+    COMPUTE, ALL, , 1000000, EXECUTE, fwd1, fwd0
+    COMMUNICATION, ALL, , 4096, ALL_REDUCE, ar1, fwd1;bwd1
+The dependencies are stored as predecessor lists (CSR arrays) and compiled on
+first use into a DependencyGraph: successor lists and in-degrees, from which
+the GPUs issue the instructions whose predecessors finished.
+"""
+
+import itertools
+import mmap
+from array import array
+from collections import deque
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    overload,
+)
+
+INS_COMPUTE: int = 0
+INS_COMMUNICATION: int = 1
+INS_TYPE_NAMES: List[str] = ["COMPUTE", "COMMUNICATION"]
+
+
+def iter_input_lines(file_path: str, use_mmap: bool = False) -> Iterator[str]:
+    """Yield the lines of a text input file, without comments and whitespace.
+
+    Rules:
+    - Lines starting with '#' are ignored.
+    - Empty lines are ignored.
+    - Lines with '#' elsewhere keep only the part before '#'.
+    With use_mmap, the file is memory-mapped instead of read through a buffer.
+    """
+    for line in _iter_mmap(file_path) if use_mmap else _iter_file(file_path):
+        # Remove leading/trailing whitespace
+        line = line.strip()
+        if not line:
+            continue
+
+        if line.startswith("#"):
+            continue
+
+        if "#" in line:
+            line = line.split("#", 1)[0].strip()
+
+        if line:
+            yield line
+
+
+def _iter_file(file_path: str) -> Iterator[str]:
+    with open(file_path, "r") as file:
+        yield from file
+
+
+def _iter_mmap(file_path: str) -> Iterator[str]:
+    with open(file_path, "rb") as file:
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file, it can't be mapped
+            return
+        with mapped:
+            for line in iter(mapped.readline, b""):
+                yield line.decode()
+
+
+def parse_instruction(ins: str) -> Tuple[str, str, str, int, str]:
+    """Split an instruction line into (type, source, destination, size, operation)."""
+    return parse_node(ins)[0]
+
+
+def parse_node(ins: str) -> Tuple[Tuple[str, str, str, int, str], str, List[str]]:
+    """Split an instruction line into its fields, its Id and the Ids it depends
+    on ("" and [] without the dependency columns).
+    """
+    ins_list: List[str] = [
+        s.replace(" ", "") if s.strip() else "" for s in ins.split(",")
+    ]
+    if not 5 <= len(ins_list) <= 7:
+        raise AssertionError(f"Wrong trace format at {ins_list}")
+    fields = ins_list[0], ins_list[1], ins_list[2], int(ins_list[3]), ins_list[4]
+    node_id = ins_list[5] if len(ins_list) > 5 else ""
+    depends_on = ins_list[6].split(";") if len(ins_list) > 6 else []
+    return fields, node_id, [dep for dep in depends_on if dep]
+
+
+class Program:
+    def __init__(self) -> None:
+        self.ins_types: array = array("b")  # INS_COMPUTE or INS_COMMUNICATION
+        self.sizes: array = array("q")  # for compute it's FLOPS, for comm it's Bytes
+        self.op_codes: array = array("I")  # index in strings
+        self.src_codes: array = array("I")  # index in strings
+        self.dst_codes: array = array("I")  # index in strings
+        self.strings: List[str] = []  # string table of operations and endpoints
+        self._string_codes: Dict[str, int] = {}
+        # program order of the instructions of each type, GPUs run them as FIFOs
+        self.compute_indices: array = array("i")
+        self.comm_indices: array = array("i")
+        # predecessors of instruction i: dep_names[dep_offsets[i]:dep_offsets[i + 1]]
+        self.node_ids: Dict[str, int] = {}  # Id column -> instruction index
+        self.dep_offsets: array = array("q", [0])
+        self.dep_names: List[str] = []  # resolved by dependency_graph()
+        self._graph: Optional[DependencyGraph] = None
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+    @property
+    def has_dependencies(self) -> bool:
+        """True if some instruction depends on others, the GPUs then issue the
+        instructions in dependency order rather than as two FIFOs.
+        """
+        return bool(self.dep_names)
+
+    def dependency_graph(self) -> "DependencyGraph":
+        """The compiled dependency graph, built on first use."""
+        graph = self._graph
+        if graph is None or len(graph.in_degrees) != len(self):
+            graph = self._graph = DependencyGraph(self)
+        return graph
+
+    def load_more(self, ins_type: int) -> bool:
+        """Loads more instructions of a type, returns False once all are loaded.
+        A compiled program is always complete, see StreamingProgram.
+        """
+        return False
+
+    def register_cursor(self, cursor: Any, ins_type: int) -> None:
+        """Declares a reader of the program, an object with a `pc` attribute
+        indexing the instructions of type `ins_type` (used by StreamingProgram).
+        """
+
+    def new_times(self, starts: Optional["TimeArray"] = None) -> "TimeArray":
+        """A zeroed per-instruction timestamp array for one GPU. The end times
+        are created with `starts`, the start times of the same GPU.
+        """
+        return array("q", bytes(8 * len(self)))
+
+    def new_finished_log(self) -> "IndexLog":
+        """An empty log of finished instruction indices for one GPU."""
+        return array("i")
+
+    @classmethod
+    def from_lines(cls, lines: Iterable[str]) -> "Program":
+        """Compiles the instruction lines of a trace file."""
+        program = cls()
+        for line in lines:
+            fields, node_id, depends_on = parse_node(line)
+            program.append(*fields, node_id=node_id, depends_on=depends_on)
+        return program
+
+    def append(
+        self,
+        ins_type: str,
+        source: str,
+        destination: str,
+        size: int,
+        operation: str,
+        node_id: str = "",
+        depends_on: Sequence[str] = (),
+    ) -> int:
+        """Adds an instruction and returns its index. `node_id` names it for the
+        `depends_on` lists of other instructions.
+        """
+        type_name = ins_type.upper()
+        if type_name not in INS_TYPE_NAMES:
+            raise ValueError(f"Unknown event type {ins_type}")
+        type_code = INS_TYPE_NAMES.index(type_name)
+        index = len(self.sizes)
+        self.ins_types.append(type_code)
+        self.sizes.append(size)
+        self.op_codes.append(self._intern(operation))
+        self.src_codes.append(self._intern(source))
+        self.dst_codes.append(self._intern(destination))
+        if type_code == INS_COMPUTE:
+            self.compute_indices.append(index)
+        else:
+            self.comm_indices.append(index)
+        if node_id:
+            if node_id in self.node_ids:
+                raise ValueError(f"Duplicate instruction Id {node_id}")
+            self.node_ids[node_id] = index
+        self.dep_names.extend(depends_on)
+        self.dep_offsets.append(len(self.dep_names))
+        return index
+
+    def _intern(self, s: str) -> int:
+        code = self._string_codes.get(s)
+        if code is None:
+            code = len(self.strings)
+            self.strings.append(s)
+            self._string_codes[s] = code
+        return code
+
+    def operation(self, index: int) -> str:
+        return self.strings[int(self.op_codes[index])]
+
+    def source(self, index: int) -> str:
+        return self.strings[int(self.src_codes[index])]
+
+    def destination(self, index: int) -> str:
+        return self.strings[int(self.dst_codes[index])]
+
+
+class DependencyGraph:
+    """Successor lists (CSR arrays) and in-degrees of the instructions of a
+    program, with the roots of each type in program order. Building it checks
+    that every dependency exists and that there is no cycle.
+    """
+
+    def __init__(self, program: Program) -> None:
+        num_ins = len(program)
+        node_ids = program.node_ids
+        offsets = program.dep_offsets
+        self.num_edges: int = len(program.dep_names)
+        try:
+            predecessors = array("i", map(node_ids.__getitem__, program.dep_names))
+        except KeyError as error:
+            raise ValueError(f"Dependency on an unknown Id {error.args[0]}") from None
+        self.in_degrees: array = array(
+            "i", (offsets[i + 1] - offsets[i] for i in range(num_ins))
+        )
+        # successors of instruction i: successors[succ_offsets[i]:succ_offsets[i + 1]]
+        out_degrees = [0] * num_ins
+        for predecessor in predecessors:
+            out_degrees[predecessor] += 1
+        self.succ_offsets: array = array("q", [0])
+        self.succ_offsets.extend(itertools.accumulate(out_degrees))
+        self.successors: array = array("i", bytes(4 * self.num_edges))
+        fill = self.succ_offsets.tolist()
+        successor = 0  # the instruction of each edge, in edge order
+        for edge, predecessor in enumerate(predecessors):
+            while offsets[successor + 1] <= edge:
+                successor += 1
+            self.successors[fill[predecessor]] = successor
+            fill[predecessor] += 1
+        self.roots: Tuple[array, array] = (
+            array("i", (i for i in program.compute_indices if not self.in_degrees[i])),
+            array("i", (i for i in program.comm_indices if not self.in_degrees[i])),
+        )
+        self._check_acyclic()
+
+    def _check_acyclic(self) -> None:
+        """Kahn's algorithm: every instruction is reached from the roots."""
+        in_degrees = array("i", self.in_degrees)
+        stack = list(self.roots[INS_COMPUTE]) + list(self.roots[INS_COMMUNICATION])
+        reached = 0
+        while stack:
+            index = stack.pop()
+            reached += 1
+            for edge in range(self.succ_offsets[index], self.succ_offsets[index + 1]):
+                successor = self.successors[edge]
+                in_degrees[successor] -= 1
+                if not in_degrees[successor]:
+                    stack.append(successor)
+        if reached != len(self.in_degrees):
+            raise ValueError("The instruction dependencies have a cycle")
+
+
+class WindowedArray:
+    """Array of the items [base, base + n) of a longer sequence, it's indexed
+    with the positions in the whole sequence.
+    """
+
+    def __init__(self, typecode: str) -> None:
+        self.data: array = array(typecode)
+        self.base: int = 0
+
+    def __len__(self) -> int:
+        return self.base + len(self.data)
+
+    def __getitem__(self, i: int) -> int:
+        if i < self.base:
+            raise IndexError(f"Item {i} was released from the window")
+        return int(self.data[i - self.base])
+
+    def append(self, value: int) -> None:
+        self.data.append(value)
+
+    def release(self, new_base: int) -> List[int]:
+        """Drops the items before new_base and returns them."""
+        if new_base <= self.base:
+            return []
+        released = self.data[: new_base - self.base].tolist()
+        del self.data[: new_base - self.base]
+        self.base = new_base
+        return released
+
+
+class SparseColumn(Dict[int, int]):
+    """Column of a StreamingProgram, only the loaded instructions are stored."""
+
+
+class HistoryTimes:
+    """Timestamps of the running and the last `capacity` finished instructions
+    of a GPU, indexed with the instruction index.
+
+    Entries are dropped in finish order: the end times, set when an instruction
+    finishes, drop the oldest finished instruction from themselves and from the
+    linked start times once more than `capacity` have finished. The start time
+    of a running instruction is kept however long it runs.
+    """
+
+    def __init__(self, capacity: int, starts: Optional["HistoryTimes"] = None) -> None:
+        self.data: Dict[int, int] = {}
+        self.capacity: int = capacity
+        self.starts: Optional[HistoryTimes] = starts
+        self.finished: Deque[int] = deque()  # finish order, for the end times
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, i: int) -> int:
+        return self.data.get(i, 0)
+
+    def __setitem__(self, i: int, value: int) -> None:
+        if self.starts is not None and i not in self.data:
+            self.finished.append(i)
+            if len(self.finished) > self.capacity:
+                oldest = self.finished.popleft()
+                del self.data[oldest]
+                self.starts.data.pop(oldest, None)
+        self.data[i] = value
+
+    def __iter__(self) -> Iterator[int]:
+        """Iterates over the stored timestamps, in insertion order."""
+        return iter(self.data.values())
+
+
+class LogSlice:
+    """Log of one GPU in a log shared by several (see gpu_array.py): the items
+    [slot * capacity, slot * capacity + counts[slot]) of a preallocated array.
+    """
+
+    def __init__(self, data: array, counts: array, slot: int, capacity: int) -> None:
+        self.data: array = data
+        self.counts: array = counts
+        self.slot: int = slot
+        self.offset: int = slot * capacity
+        self.capacity: int = capacity
+
+    def __len__(self) -> int:
+        return int(self.counts[self.slot])
+
+    @overload
+    def __getitem__(self, i: int) -> int: ...
+
+    @overload
+    def __getitem__(self, i: slice) -> array: ...
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[int, array]:
+        if isinstance(i, slice):
+            return self.data[self.offset : self.offset + len(self)][i]
+        if not -len(self) <= i < len(self):
+            raise IndexError("LogSlice index out of range")
+        return int(self.data[self.offset + i % len(self)])
+
+    def __delitem__(self, i: slice) -> None:
+        items = self[:]
+        del items[i]
+        self.counts[self.slot] = 0
+        self.extend(items)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.data[self.offset : self.offset + len(self)])
+
+    def append(self, value: int) -> None:
+        count = self.counts[self.slot]
+        if count == self.capacity:
+            raise IndexError("LogSlice is full")
+        self.data[self.offset + count] = value
+        self.counts[self.slot] = count + 1
+
+    def extend(self, values: Iterable[int]) -> None:
+        for value in values:
+            self.append(value)
+
+    def view(self) -> memoryview:
+        """The items, without copy."""
+        return memoryview(self.data)[self.offset : self.offset + len(self)]
+
+
+# the per-GPU arrays, or memoryview slices of arrays shared by several GPUs
+TimeArray = Union[array, HistoryTimes, memoryview]
+IndexLog = Union[array, Deque[int], LogSlice]
+
+
+class StreamingProgram(Program):
+    """Program read lazily from a trace file.
+
+    Compute and communication instructions are read by two independent readers
+    of the file, `lookahead` instructions at a time, when a GPU queue of that
+    type runs out of loaded instructions. So one type may run far ahead of the
+    other without buffering the trace in between. Instructions all GPU queues
+    have passed are released: memory depends on the spread between the slowest
+    and the fastest GPU, not on the trace length. GPUs keep the timestamps of
+    their running and last `history` finished instructions only, the full
+    timeline is in the trace recorder.
+    """
+
+    def __init__(
+        self,
+        trace_file: str,
+        lookahead: int = 4096,
+        history: int = 4096,
+        use_mmap: bool = True,
+    ) -> None:
+        super().__init__()
+        # columns indexed by instruction index, holding the loaded instructions
+        self.ins_types: Any = SparseColumn()
+        self.sizes: Any = SparseColumn()
+        self.op_codes: Any = SparseColumn()
+        self.src_codes: Any = SparseColumn()
+        self.dst_codes: Any = SparseColumn()
+        self.compute_indices: Any = WindowedArray("i")
+        self.comm_indices: Any = WindowedArray("i")
+        self.lookahead: int = lookahead
+        self.history: int = history
+        self.num_loaded: int = 0  # instructions read by the furthest reader
+        self._readers: Dict[
+            int, Iterator[Tuple[int, Tuple[str, str, str, int, str]]]
+        ] = {
+            ins_type: self._read(trace_file, use_mmap, ins_type)
+            for ins_type in (INS_COMPUTE, INS_COMMUNICATION)
+        }
+        self._complete: Dict[int, bool] = {INS_COMPUTE: False, INS_COMMUNICATION: False}
+        self._cursors: Dict[int, List[Any]] = {INS_COMPUTE: [], INS_COMMUNICATION: []}
+
+    @classmethod
+    def from_file(
+        cls, trace_file: str, lookahead: int = 4096, use_mmap: bool = True
+    ) -> "StreamingProgram":
+        """Streams the instructions of a trace file."""
+        return cls(trace_file, lookahead, use_mmap=use_mmap)
+
+    @staticmethod
+    def _read(
+        trace_file: str, use_mmap: bool, ins_type: int
+    ) -> Iterator[Tuple[int, Tuple[str, str, str, int, str]]]:
+        """Yields (instruction index, fields) of the instructions of one type."""
+        for index, line in enumerate(iter_input_lines(trace_file, use_mmap)):
+            # the type is checked first: the lines of the other type, which the
+            # other reader parses, are skipped without parsing them
+            type_field = line.split(",", 1)[0].replace(" ", "")
+            if type_field.upper() not in INS_TYPE_NAMES:
+                raise ValueError(f"Unknown event type {type_field}")
+            if INS_TYPE_NAMES.index(type_field.upper()) != ins_type:
+                continue
+            fields, _, depends_on = parse_node(line)
+            if depends_on:
+                raise ValueError("Streaming a trace with dependencies is not supported")
+            yield index, fields
+
+    def __len__(self) -> int:
+        return self.num_loaded
+
+    def register_cursor(self, cursor: Any, ins_type: int) -> None:
+        self._cursors[ins_type].append(cursor)
+
+    def load_more(self, ins_type: int) -> bool:
+        if self._complete[ins_type]:
+            return False
+        indices = self.compute_indices if ins_type == INS_COMPUTE else self.comm_indices
+        loaded = 0
+        for index, (_, source, destination, size, operation) in self._readers[ins_type]:
+            self.ins_types[index] = ins_type
+            self.sizes[index] = size
+            self.op_codes[index] = self._intern(operation)
+            self.src_codes[index] = self._intern(source)
+            self.dst_codes[index] = self._intern(destination)
+            indices.append(index)
+            self.num_loaded = max(self.num_loaded, index + 1)
+            loaded += 1
+            if loaded == self.lookahead:
+                break
+        else:
+            self._complete[ins_type] = True
+        if len(indices.data) > 2 * self.lookahead:
+            self._release(ins_type, indices)
+        return loaded > 0
+
+    def _release(self, ins_type: int, indices: WindowedArray) -> None:
+        """Drops the instructions that are behind every cursor of this type.
+        The instruction just before a cursor may still be running and is kept.
+        """
+        min_pc = len(indices)
+        for cursor in self._cursors[ins_type]:
+            min_pc = min(min_pc, max(cursor.pc - 1, 0))
+        for index in indices.release(min_pc):
+            for column in (
+                self.ins_types,
+                self.sizes,
+                self.op_codes,
+                self.src_codes,
+                self.dst_codes,
+            ):
+                del column[index]
+
+    def new_times(self, starts: Optional[TimeArray] = None) -> TimeArray:
+        assert starts is None or isinstance(starts, HistoryTimes)
+        return HistoryTimes(self.history, starts)
+
+    def new_finished_log(self) -> IndexLog:
+        return deque(maxlen=self.history)
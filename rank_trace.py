@@ -0,0 +1,188 @@
+"""Per-GPU (non-SPMD) traces.
+
+In a rank-tagged trace, the Source column of an instruction tells which GPUs
+run it: `ALL` (or empty) for every GPU, a rank `3` or a range of ranks `0-3`.
+A RankIndex stores, for every rank, the byte offsets of its lines in the trace
+file, so each GPU reads and compiles only its own slice. Lines for all GPUs
+are stored once. The index is saved next to the trace (`<trace>.idx`) and
+reused while the trace file is unchanged.
+
+A trace can also be a directory with one SPMD-format file per rank,
+`rank_0.txt`, `rank_1.txt`, ...
+"""
+
+import mmap
+import os
+import struct
+from array import array
+from typing import Dict, Iterator, List, Optional
+from program import Program, iter_input_lines
+
+INDEX_MAGIC: bytes = b"TSIMIDX1"
+# magic, trace file size, trace file mtime (ns), number of ranks
+INDEX_HEADER: struct.Struct = struct.Struct("<8sQQQ")
+
+
+def parse_ranks(source: str) -> Optional[range]:
+    """Ranks of a Source field, None for all GPUs."""
+    source = source.strip()
+    if not source or source.upper() == "ALL":
+        return None
+    first, _, last = source.partition("-")
+    try:
+        if last:
+            return range(int(first), int(last) + 1)
+        return range(int(first), int(first) + 1)
+    except ValueError:
+        raise ValueError(f"Wrong source rank {source}") from None
+
+
+class RankIndex:
+    def __init__(self, trace_size: int, trace_mtime_ns: int) -> None:
+        self.trace_size: int = trace_size
+        self.trace_mtime_ns: int = trace_mtime_ns
+        self.shared: array = array("q")  # offsets of the lines run by all GPUs
+        self.ranks: List[array] = []  # offsets of the lines of each rank
+
+    @property
+    def num_ranks(self) -> int:
+        return len(self.ranks)
+
+    @property
+    def is_spmd(self) -> bool:
+        """True if every line is run by all GPUs."""
+        return not any(self.ranks)
+
+    @classmethod
+    def build(cls, trace_file: str) -> "RankIndex":
+        """Scans the trace file once and records the offset of every line."""
+        stat = os.stat(trace_file)
+        index = cls(stat.st_size, stat.st_mtime_ns)
+        offset = 0
+        with open(trace_file, "rb") as file:
+            for raw in file:
+                line = raw.split(b"#", 1)[0].strip()
+                if line:
+                    fields = line.split(b",")
+                    if len(fields) < 2:
+                        raise AssertionError(f"Wrong trace format at {raw!r}")
+                    ranks = parse_ranks(fields[1].decode())
+                    if ranks is None:
+                        index.shared.append(offset)
+                    else:
+                        if ranks.stop > len(index.ranks):
+                            index.ranks.extend(
+                                array("q") for _ in range(ranks.stop - len(index.ranks))
+                            )
+                        for rank in ranks:
+                            index.ranks[rank].append(offset)
+                offset += len(raw)
+        return index
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as file:
+            file.write(
+                INDEX_HEADER.pack(
+                    INDEX_MAGIC, self.trace_size, self.trace_mtime_ns, self.num_ranks
+                )
+            )
+            counts = array("q", [len(self.shared)] + [len(r) for r in self.ranks])
+            file.write(counts)
+            file.write(self.shared)
+            for offsets in self.ranks:
+                file.write(offsets)
+
+    @classmethod
+    def load(cls, path: str) -> "RankIndex":
+        with open(path, "rb") as file:
+            data = file.read()
+        magic, trace_size, trace_mtime_ns, num_ranks = INDEX_HEADER.unpack_from(data)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path} is not a rank index")
+        index = cls(trace_size, trace_mtime_ns)
+        counts = array("q")
+        position = INDEX_HEADER.size
+        counts.frombytes(data[position : position + 8 * (num_ranks + 1)])
+        position += 8 * (num_ranks + 1)
+        columns: List[array] = []
+        for count in counts:
+            offsets = array("q")
+            offsets.frombytes(data[position : position + 8 * count])
+            position += 8 * count
+            columns.append(offsets)
+        index.shared = columns[0]
+        index.ranks = columns[1:]
+        return index
+
+    @classmethod
+    def for_trace(cls, trace_file: str) -> "RankIndex":
+        """Loads the saved index of a trace, or builds and saves it."""
+        index_path = trace_file + ".idx"
+        stat = os.stat(trace_file)
+        if os.path.exists(index_path):
+            try:
+                index = cls.load(index_path)
+                if (index.trace_size, index.trace_mtime_ns) == (
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                ):
+                    return index
+            except (ValueError, struct.error):
+                pass  # rebuild a stale or broken index
+        index = cls.build(trace_file)
+        try:
+            index.save(index_path)
+        except OSError:
+            pass  # read-only location, the index is only kept in memory
+        return index
+
+    def offsets(self, rank: int) -> Iterator[int]:
+        """Offsets of the lines of a rank, in file order."""
+        shared = self.shared
+        own = self.ranks[rank] if rank < self.num_ranks else array("q")
+        i = j = 0
+        while i < len(shared) and j < len(own):
+            if shared[i] < own[j]:
+                yield shared[i]
+                i += 1
+            else:
+                yield own[j]
+                j += 1
+        yield from shared[i:]
+        yield from own[j:]
+
+    def iter_lines(self, trace_file: str, rank: int) -> Iterator[str]:
+        """Lines of the trace run by a rank, read through a memory map."""
+        with open(trace_file, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for offset in self.offsets(rank):
+                    end = mapped.find(b"\n", offset)
+                    raw = mapped[offset : end if end >= 0 else len(mapped)]
+                    yield raw.split(b"#", 1)[0].decode().strip()
+
+
+def load_rank_programs(trace_file: str, num_gpus: int) -> List[Program]:
+    """The program of every rank of a rank-tagged trace file or directory.
+    Ranks running the same lines share one Program.
+    """
+    if os.path.isdir(trace_file):
+        return [
+            Program.from_lines(
+                iter_input_lines(os.path.join(trace_file, f"rank_{rank}.txt"))
+            )
+            for rank in range(num_gpus)
+        ]
+    index = RankIndex.for_trace(trace_file)
+    if index.num_ranks > num_gpus:
+        raise ValueError(
+            f"The trace has instructions for rank {index.num_ranks - 1}, "
+            f"but there are {num_gpus} GPUs"
+        )
+    programs: List[Program] = []
+    by_slice: Dict[bytes, Program] = {}
+    for rank in range(num_gpus):
+        own = index.ranks[rank].tobytes() if rank < index.num_ranks else b""
+        if own not in by_slice:
+            by_slice[own] = Program.from_lines(index.iter_lines(trace_file, rank))
+        programs.append(by_slice[own])
+    return programs
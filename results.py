@@ -0,0 +1,301 @@
+"""Vectorised analytics of the results of a run, and their export to CSV or Parquet.
+
+Results copies the start and end times of the GPUs into NumPy arrays indexed by
+(gpu_id, instruction index), with the type, operation code and size of each
+instruction, so the metrics are computed with array operations rather than by
+iterating Instruction objects:
+- makespan: end time of the last instruction, and finish time of each GPU
+- busy time of each GPU: the length of the union of the intervals of its
+  compute (or communication) instructions, overlapping streams count once
+- overlap: time a GPU both computes and communicates, the overlap ratio is the
+  fraction of its communication time hidden behind compute, the rest is the
+  exposed communication
+- critical ranks (finishing at the makespan) and stragglers (finishing later
+  than the median GPU by more than a tolerance)
+- latency percentiles of each operation
+
+The GPUs may run different programs (MPMD), the arrays then have the length of
+the longest program and `finished` masks the padding. Requires NumPy, the
+Parquet export requires pyarrow.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from gpu import GPU
+from program import INS_COMMUNICATION, INS_COMPUTE, INS_TYPE_NAMES, LogSlice, Program
+from program import StreamingProgram
+
+CSV_COLUMNS: List[str] = [
+    "gpu",
+    "index",
+    "type",
+    "operation",
+    "size",
+    "start_ns",
+    "end_ns",
+]
+
+
+def column(values: Any) -> np.ndarray:
+    """A read-only view of an array.array (or a memoryview or LogSlice of one,
+    see gpu_array.py), without copy.
+    """
+    view = values.view() if isinstance(values, LogSlice) else memoryview(values)
+    return np.frombuffer(view, dtype=view.format)
+
+
+def union_ns(start: np.ndarray, end: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Length of the union of the intervals [start, end) of each row, where mask."""
+    start = np.where(mask, start, 0)
+    end = np.where(mask, end, 0)
+    order = np.argsort(start, axis=1, kind="stable")
+    start = np.take_along_axis(start, order, axis=1)
+    end = np.take_along_axis(end, order, axis=1)
+    # the intervals starting before an interval cover it up to their last end
+    reach = np.maximum.accumulate(end, axis=1)
+    covered = np.zeros_like(reach)
+    covered[:, 1:] = reach[:, :-1]
+    union: np.ndarray = np.maximum(end - np.maximum(start, covered), 0).sum(axis=1)
+    return union
+
+
+class Results:
+    def __init__(
+        self,
+        start_ns: np.ndarray,
+        end_ns: np.ndarray,
+        finished: np.ndarray,
+        ins_types: np.ndarray,
+        op_codes: np.ndarray,
+        sizes: np.ndarray,
+        op_names: List[str],
+    ) -> None:
+        # all (num_gpus, num_instructions), the program columns may be read-only
+        # broadcast views when all the GPUs run the same program
+        self.start_ns: np.ndarray = start_ns
+        self.end_ns: np.ndarray = end_ns
+        self.finished: np.ndarray = finished
+        self.ins_types: np.ndarray = ins_types  # -1 for padding
+        self.op_codes: np.ndarray = op_codes  # index in op_names
+        self.sizes: np.ndarray = sizes
+        self.op_names: List[str] = op_names
+        # busy times by instruction type, each one needs a sort of the times
+        self._busy: Dict[Optional[int], np.ndarray] = {}
+
+    @classmethod
+    def from_gpus(cls, gpus: Sequence[GPU]) -> "Results":
+        """The results of the GPUs of a finished (or paused) run."""
+        if any(isinstance(gpu.program, StreamingProgram) for gpu in gpus):
+            raise ValueError("A streamed program keeps only its last instructions")
+        num_gpus = len(gpus)
+        width = max((len(gpu.program) for gpu in gpus), default=0)
+        start_ns = np.zeros((num_gpus, width), dtype=np.int64)
+        end_ns = np.zeros((num_gpus, width), dtype=np.int64)
+        finished = np.zeros((num_gpus, width), dtype=bool)
+        for gpu_id, gpu in enumerate(gpus):
+            length = len(gpu.program)
+            start_ns[gpu_id, :length] = column(gpu.start_times)
+            end_ns[gpu_id, :length] = column(gpu.end_times)
+            finished[gpu_id, column(gpu.finished_instructions.indices)] = True
+
+        # the program columns, with the operations in one string table
+        op_names: List[str] = []
+        op_index: Dict[str, int] = {}
+        columns: Dict[int, Any] = {}
+        for gpu in gpus:
+            if id(gpu.program) not in columns:
+                columns[id(gpu.program)] = program_columns(
+                    gpu.program, width, op_names, op_index
+                )
+        if len(columns) == 1:
+            ins_types, op_codes, sizes = (
+                np.broadcast_to(values, (num_gpus, width))
+                for values in next(iter(columns.values()))
+            )
+        else:
+            ins_types, op_codes, sizes = (
+                np.stack([columns[id(gpu.program)][i] for gpu in gpus])
+                for i in range(3)
+            )
+        return cls(start_ns, end_ns, finished, ins_types, op_codes, sizes, op_names)
+
+    @property
+    def num_gpus(self) -> int:
+        return int(self.start_ns.shape[0])
+
+    @property
+    def durations_ns(self) -> np.ndarray:
+        """Duration of each instruction, 0 if not finished."""
+        return np.where(self.finished, self.end_ns - self.start_ns, 0)
+
+    @property
+    def makespan_ns(self) -> int:
+        return int(self.end_ns.max(initial=0, where=self.finished))
+
+    def finish_ns(self) -> np.ndarray:
+        """End time of the last instruction of each GPU."""
+        finish: np.ndarray = self.end_ns.max(axis=1, initial=0, where=self.finished)
+        return finish
+
+    def busy_ns(self, ins_type: Optional[int] = None) -> np.ndarray:
+        """Time each GPU runs instructions of a type (of any type for None)."""
+        busy = self._busy.get(ins_type)
+        if busy is None:
+            mask = self.finished
+            if ins_type is not None:
+                mask = mask & (self.ins_types == ins_type)
+            busy = self._busy[ins_type] = union_ns(self.start_ns, self.end_ns, mask)
+        return busy
+
+    def overlap_ns(self) -> np.ndarray:
+        """Time each GPU computes and communicates at once."""
+        busy = self.busy_ns()
+        overlap: np.ndarray = (
+            self.busy_ns(INS_COMPUTE) + self.busy_ns(INS_COMMUNICATION) - busy
+        )
+        return overlap
+
+    def exposed_comm_ns(self) -> np.ndarray:
+        """Communication time of each GPU not hidden behind compute."""
+        exposed: np.ndarray = self.busy_ns(INS_COMMUNICATION) - self.overlap_ns()
+        return exposed
+
+    def overlap_ratio(self) -> np.ndarray:
+        """Fraction of the communication time of each GPU hidden behind compute,
+        1 without communication.
+        """
+        comm = self.busy_ns(INS_COMMUNICATION)
+        overlap = self.overlap_ns()
+        ratio: np.ndarray = np.divide(
+            overlap, comm, out=np.ones(len(comm)), where=comm > 0, casting="unsafe"
+        )
+        return ratio
+
+    def critical_ranks(self) -> np.ndarray:
+        """The GPUs finishing at the makespan."""
+        return np.flatnonzero(self.finish_ns() == self.makespan_ns)
+
+    def stragglers(self, tolerance: float = 0.01) -> np.ndarray:
+        """The GPUs finishing later than (1 + tolerance) times the median finish
+        time, latest first.
+        """
+        finish = self.finish_ns()
+        if not len(finish):
+            return np.zeros(0, dtype=np.int64)
+        late = np.flatnonzero(finish > np.median(finish) * (1 + tolerance))
+        return late[np.argsort(-finish[late], kind="stable")]
+
+    def latency_percentiles(
+        self, percentiles: Sequence[float] = (50, 90, 99)
+    ) -> Dict[str, Dict[str, float]]:
+        """Count, mean and percentiles of the duration of each operation."""
+        durations = (self.end_ns - self.start_ns)[self.finished]
+        op_codes = self.op_codes[self.finished]
+        latencies: Dict[str, Dict[str, float]] = {}
+        for code in np.unique(op_codes):
+            values = durations[op_codes == code]
+            stats = {"count": float(len(values)), "mean": float(values.mean())}
+            for p, value in zip(percentiles, np.percentile(values, percentiles)):
+                stats[f"p{p:g}"] = float(value)
+            latencies[self.op_names[code]] = stats
+        return latencies
+
+    def summary(self, tolerance: float = 0.01) -> Dict[str, Any]:
+        """The metrics of the run, as a JSON-serialisable dict."""
+        compute = self.busy_ns(INS_COMPUTE)
+        comm = self.busy_ns(INS_COMMUNICATION)
+        overlap = self.overlap_ns()
+        exposed = comm - overlap
+        total_comm = int(comm.sum())
+        return {
+            "num_gpus": self.num_gpus,
+            "finished_instructions": int(self.finished.sum()),
+            "makespan_ns": self.makespan_ns,
+            "compute_busy_ns_mean": float(compute.mean()) if len(compute) else 0.0,
+            "comm_busy_ns_mean": float(comm.mean()) if len(comm) else 0.0,
+            "overlap_ratio": int(overlap.sum()) / total_comm if total_comm else 1.0,
+            "exposed_comm_ns_mean": float(exposed.mean()) if len(exposed) else 0.0,
+            "exposed_comm_ns_max": int(exposed.max(initial=0)),
+            "critical_ranks": self.critical_ranks().tolist(),
+            "stragglers": self.stragglers(tolerance).tolist(),
+            "latency_ns": self.latency_percentiles(),
+        }
+
+    def _rows(self) -> Dict[str, np.ndarray]:
+        """The columns of the finished instructions, ordered by GPU and index."""
+        gpu_ids, indices = np.nonzero(self.finished)
+        return {
+            "gpu": gpu_ids,
+            "index": indices,
+            "type": self.ins_types[gpu_ids, indices],
+            "operation": self.op_codes[gpu_ids, indices],
+            "size": self.sizes[gpu_ids, indices],
+            "start_ns": self.start_ns[gpu_ids, indices],
+            "end_ns": self.end_ns[gpu_ids, indices],
+        }
+
+    def to_csv(self, path: str) -> None:
+        """Writes one row per finished instruction."""
+        rows = self._rows()
+        table = np.empty((len(rows["gpu"]), len(CSV_COLUMNS)), dtype=object)
+        for i, column in enumerate(CSV_COLUMNS):
+            table[:, i] = rows[column]
+        table[:, 2] = np.array(INS_TYPE_NAMES, dtype=object)[rows["type"]]
+        table[:, 3] = np.array(self.op_names, dtype=object)[rows["operation"]]
+        np.savetxt(
+            path,
+            table,
+            fmt="%s",
+            delimiter=",",
+            header=",".join(CSV_COLUMNS),
+            comments="",
+        )
+
+    def to_parquet(self, path: str) -> None:
+        """Writes one row per finished instruction, the type and operation as
+        dictionary-encoded columns.
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as error:
+            raise ImportError("The Parquet export requires pyarrow") from error
+        rows = self._rows()
+        columns = {column: pa.array(values) for column, values in rows.items()}
+        columns["type"] = pa.DictionaryArray.from_arrays(
+            rows["type"].astype(np.int32), INS_TYPE_NAMES
+        )
+        columns["operation"] = pa.DictionaryArray.from_arrays(
+            rows["operation"].astype(np.int32), self.op_names
+        )
+        pq.write_table(pa.table(columns), path)
+
+    def export(self, path: str) -> None:
+        """Writes Parquet for a .parquet path, CSV otherwise."""
+        if path.endswith(".parquet"):
+            self.to_parquet(path)
+        else:
+            self.to_csv(path)
+
+
+def program_columns(
+    program: Program, width: int, op_names: List[str], op_index: Dict[str, int]
+) -> List[np.ndarray]:
+    """The type, operation code and size of each instruction of a program, padded
+    to width; the operations are added to op_names.
+    """
+    codes = np.array(
+        [op_index.setdefault(s, len(op_index)) for s in program.strings],
+        dtype=np.int32,
+    )
+    for name in list(op_index)[len(op_names) :]:
+        op_names.append(name)
+    length = len(program)
+    ins_types = np.full(width, -1, dtype=np.int8)
+    ins_types[:length] = column(program.ins_types)
+    op_codes = np.zeros(width, dtype=np.int32)
+    if length:
+        op_codes[:length] = codes[column(program.op_codes)]
+    sizes = np.zeros(width, dtype=np.int64)
+    sizes[:length] = column(program.sizes)
+    return [ins_types, op_codes, sizes]
@@ -0,0 +1,235 @@
+"""Event queue backends of the SimulationEngine.
+
+Every scheduler stores items that are totally ordered (Event objects compare by
+(timestamp, seq), compact events are tuples starting with (timestamp, seq)) and
+pops them in that order:
+- HeapScheduler: binary heap, O(log n), the default.
+- CalendarQueue: Brown's calendar queue, O(1) amortized for near-uniform timestamps.
+- TimeWheel: bucketed timing wheel with an overflow heap for far-future events.
+"""
+
+import heapq
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Tuple, Type
+
+
+class Scheduler(ABC):
+    """Interface of an event queue."""
+
+    @abstractmethod
+    def push(self, timestamp: int, item: Any) -> None:
+        """Adds an item scheduled at the given timestamp."""
+
+    @abstractmethod
+    def pop_next(self) -> Any:
+        """Removes and returns the smallest item."""
+
+    @abstractmethod
+    def __len__(self) -> int: ...
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    @abstractmethod
+    def compact(self, keep: Callable[[Any], bool]) -> None:
+        """Drops the items for which keep(item) is False (cancelled events)."""
+
+    @abstractmethod
+    def items(self) -> List[Any]:
+        """The items, in no particular order (used by checkpoints)."""
+
+
+class HeapScheduler(List[Any], Scheduler):
+    """Binary heap on a plain list, so it also works with the heapq functions."""
+
+    def push(self, timestamp: int, item: Any) -> None:
+        heapq.heappush(self, item)
+
+    def pop_next(self) -> Any:
+        return heapq.heappop(self)
+
+    def __len__(self) -> int:
+        return list.__len__(self)
+
+    def __bool__(self) -> bool:
+        return list.__len__(self) > 0
+
+    def compact(self, keep: Callable[[Any], bool]) -> None:
+        self[:] = [item for item in self if keep(item)]
+        heapq.heapify(self)
+
+    def items(self) -> List[Any]:
+        return list(self)
+
+
+class CalendarQueue(Scheduler):
+    """Calendar queue (R. Brown, 1988).
+
+    Time is divided in buckets of `width` ns, bucket i holds the items of the
+    "days" i, i + num_buckets, i + 2 * num_buckets, ... Dequeue scans the buckets
+    from the current one, so with a well chosen width it is O(1) amortized.
+    The queue is resized (and the width re-estimated) when it grows or shrinks
+    by a factor of two.
+    """
+
+    def __init__(self, num_buckets: int = 2, width: int = 1) -> None:
+        self._size: int = 0
+        self._last_time: int = 0
+        self._setup(max(num_buckets, 2), max(width, 1))
+
+    def _setup(self, num_buckets: int, width: int) -> None:
+        self._buckets: List[List[Tuple[int, Any]]] = [[] for _ in range(num_buckets)]
+        self._width: int = width
+        self._current: int = (self._last_time // width) % num_buckets
+        self._bucket_top: int = (self._last_time // width + 1) * width
+        self._grow_at: int = 2 * num_buckets
+        self._shrink_at: int = num_buckets // 2 - 2
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(self, timestamp: int, item: Any) -> None:
+        bucket = self._buckets[(timestamp // self._width) % len(self._buckets)]
+        heapq.heappush(bucket, (timestamp, item))
+        self._size += 1
+        if self._size > self._grow_at:
+            self._resize(2 * len(self._buckets))
+
+    def pop_next(self) -> Any:
+        if self._size == 0:
+            raise IndexError("pop from an empty CalendarQueue")
+        buckets = self._buckets
+        num_buckets = len(buckets)
+        index = self._current
+        top = self._bucket_top
+        for _ in range(num_buckets):
+            bucket = buckets[index]
+            if bucket and bucket[0][0] < top:
+                return self._take(index, top)
+            index += 1
+            top += self._width
+            if index == num_buckets:
+                index = 0
+        # nothing within one year, jump directly to the smallest item
+        index = min(
+            (i for i in range(num_buckets) if buckets[i]),
+            key=lambda i: buckets[i][0],
+        )
+        timestamp = buckets[index][0][0]
+        return self._take(index, (timestamp // self._width + 1) * self._width)
+
+    def _take(self, index: int, top: int) -> Any:
+        timestamp, item = heapq.heappop(self._buckets[index])
+        self._size -= 1
+        self._last_time = timestamp
+        self._current = index
+        self._bucket_top = top
+        if self._size < self._shrink_at:
+            self._resize(len(self._buckets) // 2)
+        return item
+
+    def compact(self, keep: Callable[[Any], bool]) -> None:
+        for bucket in self._buckets:
+            bucket[:] = [entry for entry in bucket if keep(entry[1])]
+            heapq.heapify(bucket)
+        self._size = sum(len(bucket) for bucket in self._buckets)
+
+    def items(self) -> List[Any]:
+        return [entry[1] for bucket in self._buckets for entry in bucket]
+
+    def _resize(self, num_buckets: int) -> None:
+        entries = [entry for bucket in self._buckets for entry in bucket]
+        self._setup(num_buckets, self._estimate_width(entries))
+        for entry in entries:
+            bucket = self._buckets[(entry[0] // self._width) % num_buckets]
+            heapq.heappush(bucket, entry)
+
+    @staticmethod
+    def _estimate_width(entries: List[Tuple[int, Any]]) -> int:
+        """Three times the average separation of the earliest timestamps,
+        ignoring separations larger than twice the average (Brown's heuristic).
+        """
+        times = sorted(heapq.nsmallest(25, (entry[0] for entry in entries)))
+        gaps = [b - a for a, b in zip(times, times[1:])]
+        if not gaps:
+            return 1
+        average = sum(gaps) / len(gaps)
+        kept = [gap for gap in gaps if gap <= 2 * average]
+        if not kept or sum(kept) == 0:
+            return max(1, int(average))
+        return max(1, int(3 * sum(kept) / len(kept)))
+
+
+class TimeWheel(Scheduler):
+    """Bucketed timing wheel.
+
+    The wheel covers `num_slots` consecutive buckets of `slot_width` ns starting
+    at the bucket of the current time, each slot is a small heap. Items beyond
+    the wheel go to an overflow heap and are moved in when the wheel turns.
+    Scheduling into the wheel is O(1) for dense, near-uniform timestamps.
+    """
+
+    def __init__(self, slot_width: int = 64, num_slots: int = 1024) -> None:
+        self._width: int = max(slot_width, 1)
+        self._slots: List[List[Tuple[int, Any]]] = [[] for _ in range(num_slots)]
+        self._overflow: List[Tuple[int, Any]] = []
+        self._cursor: int = 0  # bucket number of the current slot
+        self._in_wheel: int = 0
+
+    def __len__(self) -> int:
+        return self._in_wheel + len(self._overflow)
+
+    def push(self, timestamp: int, item: Any) -> None:
+        bucket = max(timestamp // self._width, self._cursor)
+        if bucket < self._cursor + len(self._slots):
+            heapq.heappush(self._slots[bucket % len(self._slots)], (timestamp, item))
+            self._in_wheel += 1
+        else:
+            heapq.heappush(self._overflow, (timestamp, item))
+
+    def pop_next(self) -> Any:
+        if self._in_wheel == 0:
+            if not self._overflow:
+                raise IndexError("pop from an empty TimeWheel")
+            self._cursor = self._overflow[0][0] // self._width
+            self._refill()
+        slots = self._slots
+        slot = slots[self._cursor % len(slots)]
+        while not slot:
+            self._cursor += 1
+            self._refill()
+            slot = slots[self._cursor % len(slots)]
+        self._in_wheel -= 1
+        return heapq.heappop(slot)[1]
+
+    def compact(self, keep: Callable[[Any], bool]) -> None:
+        for heap in self._slots + [self._overflow]:
+            heap[:] = [entry for entry in heap if keep(entry[1])]
+            heapq.heapify(heap)
+        self._in_wheel = sum(len(slot) for slot in self._slots)
+
+    def items(self) -> List[Any]:
+        return [entry[1] for heap in self._slots + [self._overflow] for entry in heap]
+
+    def _refill(self) -> None:
+        """Moves overflow items that now fall into the wheel."""
+        end = (self._cursor + len(self._slots)) * self._width
+        overflow = self._overflow
+        while overflow and overflow[0][0] < end:
+            entry = heapq.heappop(overflow)
+            heapq.heappush(
+                self._slots[(entry[0] // self._width) % len(self._slots)], entry
+            )
+            self._in_wheel += 1
+
+
+def make_scheduler(name: str) -> Scheduler:
+    """Creates a scheduler by name: HEAP, CALENDAR or WHEEL."""
+    schedulers: Dict[str, Type[Scheduler]] = {
+        "HEAP": HeapScheduler,
+        "CALENDAR": CalendarQueue,
+        "WHEEL": TimeWheel,
+    }
+    if name.upper() not in schedulers:
+        raise ValueError(f"Unknown scheduler {name}")
+    return schedulers[name.upper()]()
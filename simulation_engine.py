@@ -1,9 +1,62 @@
 from __future__ import annotations  # Enables forward references
+import functools
 import heapq
-from typing import Any, Dict, List
+import itertools
+import sys
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Set, Tuple
+from typing import Protocol, Sequence, Union
+from scheduler import HeapScheduler, Scheduler
+from trace_recorder import TraceRecorder
+
+if TYPE_CHECKING:
+    from profiler import Profiler
+
+# Integer codes of the event types, the compact engine uses them instead of strings.
+# Each module registers the event types it handles, e.g.
+#   COMPUTE_DONE = register_event_type("COMPUTE_DONE")
+EVENT_TYPE_NAMES: List[str] = []
+
+# Handler of a compact event, called as handler(timestamp, target_id, payload)
+Handler = Callable[[int, int, Any], None]
+# Handler of a batch of events of a type at the same time, called as
+# handler(timestamp, target_ids, payloads), see CompactSimulationEngine
+BatchHandler = Callable[[int, List[int], List[Any]], None]
+# Batch handlers by (event code, target id)
+BatchHandlers = Dict[Tuple[int, int], BatchHandler]
+# Dispatches an Event object to its target, see SimulationEngine.dispatch_event
+Dispatch = Callable[["Event"], None]
+# Compact event record: (timestamp, seq, event_code, target_id, payload)
+CompactEvent = Tuple[int, int, int, int, Any]
+# Returned by schedule_event() and post(), to cancel or reschedule the event:
+# the Event object, or the compact event record on the CompactSimulationEngine
+EventHandle = Union["Event", CompactEvent]
+
+
+class DispatchTable(Protocol):
+    """The handlers of each target by event code, table[target_id][event_code]:
+    the dispatch table of a CompactSimulationEngine, or its profiled copy.
+    """
+
+    def __getitem__(self, target_id: int) -> Optional[Sequence[Optional[Handler]]]: ...
+
+
+def register_event_type(name: str) -> int:
+    """Returns the integer code of an event type, registering it if it is new."""
+    if name in EVENT_TYPE_NAMES:
+        return EVENT_TYPE_NAMES.index(name)
+    EVENT_TYPE_NAMES.append(name)
+    return len(EVENT_TYPE_NAMES) - 1
+
+
+# Wraps an Event object scheduled on the compact engine, see CompactSimulationEngine
+LEGACY_EVENT: int = register_event_type("LEGACY_EVENT")
+# Events of a type at the same time, queued as one entry (event batching)
+EVENT_BATCH: int = register_event_type("EVENT_BATCH")
 
 
 class Event:
+    __slots__ = ("timestamp", "event_type", "target_id", "args", "seq")
+
     def __init__(
         self, timestamp: int, event_type: str, target_id: int, args: Dict[str, Any]
     ) -> None:
@@ -11,24 +64,152 @@ class Event:
         self.event_type: str = event_type  # Example: "COMPUTE_DONE", "COMM_START"
         self.target_id: int = target_id  # The object ID that should handle this event
         self.args: Dict[str, Any] = args  # Additional arguments in dict format
+        self.seq: int = 0  # Scheduling order, assigned by the engine
 
     def __lt__(self, other: Event) -> bool:
-        return self.timestamp < other.timestamp  # Priority queue ordering
+        # Priority queue ordering, events at the same time run in scheduling order
+        if self.timestamp != other.timestamp:
+            return self.timestamp < other.timestamp
+        return self.seq < other.seq
 
 
 class SimulationEngine:
-    def __init__(self) -> None:
-        self.event_queue: List[Event] = []
+    # GPU and Network check this flag to decide between Event objects and post()
+    compact_events: bool = False
+
+    def __init__(self, scheduler: Optional[Scheduler] = None) -> None:
+        # binary heap by default, see scheduler.py for the other backends
+        self.event_queue: Any = scheduler if scheduler is not None else HeapScheduler()
         self.objects: Dict[int, Any] = {}  # Maps object IDs to objects (GPU/Network)
         self.current_time_ns: int = 0
+        self.events_processed: int = 0
+        self._seq: int = 0  # tie breaker, so same-time events are deterministic
+        self.tracer: TraceRecorder = TraceRecorder()  # off by default
+        # seq of the cancelled events still in the queue (tombstones), they are
+        # skipped when popped, or dropped all at once by compact()
+        self._cancelled: Set[int] = set()
+        self.events_cancelled: int = 0
+        self.events_skipped: int = 0  # cancelled events popped from the queue
+        # the last event popped from the queue, the ones before it are dead
+        self._popped: Optional[EventHandle] = None
+        # compact once there are this many tombstones, and more than live events
+        self.compact_threshold: int = 1024
+        # wraps the handlers of the next runs, off by default (see profiler.py)
+        self.profiler: Optional[Profiler] = None
 
     def register_object(self, obj_id: int, obj: Any) -> None:
         """Registers an object in the system by its ID."""
         self.objects[obj_id] = obj
 
-    def schedule_event(self, event: Event) -> None:
-        """Adds an event to the priority queue."""
-        heapq.heappush(self.event_queue, event)
+    def register_objects(self, obj_ids: Sequence[int], obj: Any) -> None:
+        """Registers one object under several IDs, e.g. a GPUArray for its GPUs."""
+        self.objects.update(dict.fromkeys(obj_ids, obj))
+
+    def schedule_event(self, event: Event) -> EventHandle:
+        """Adds an event to the priority queue, returns its handle."""
+        event.seq = self._seq
+        self._seq += 1
+        self.event_queue.push(event.timestamp, event)
+        return event
+
+    def post(
+        self, timestamp: int, event_code: int, target_id: int, payload: Any
+    ) -> EventHandle:
+        """Schedules an event given by its compact fields.
+        The event is wrapped in an Event object, with the payload in args["payload"].
+        """
+        return self.schedule_event(
+            Event(
+                timestamp, EVENT_TYPE_NAMES[event_code], target_id, {"payload": payload}
+            )
+        )
+
+    def post_caused(
+        self,
+        cause_ns: int,
+        timestamp: int,
+        event_code: int,
+        target_id: int,
+        payload: Any,
+    ) -> EventHandle:
+        """post() for an event caused at cause_ns, at or before the current time.
+        The events of a time are processed in the order of the times of their
+        causes, then in posting order. An engine that processes every event at
+        the time of its cause posts in that order, so this is post(); the
+        parallel engine learns some causes later (see parallel_engine.py).
+        """
+        return self.post(timestamp, event_code, target_id, payload)
+
+    @staticmethod
+    def _handle_seq(handle: EventHandle) -> int:
+        return handle.seq if isinstance(handle, Event) else handle[1]
+
+    @staticmethod
+    def _handle_time(handle: EventHandle) -> int:
+        return handle.timestamp if isinstance(handle, Event) else handle[0]
+
+    def cancel(self, handle: EventHandle) -> None:
+        """Cancels a pending event in O(1): it stays in the queue as a tombstone.
+        Cancelling it again is a no-op; an event already popped from the queue
+        (processed, or skipped as cancelled) can't be cancelled.
+        """
+        seq = self._handle_seq(handle)
+        if seq in self._cancelled:
+            return
+        popped = self._popped
+        # events are popped in (timestamp, seq) order
+        if popped is not None and (self._handle_time(handle), seq) <= (
+            self._handle_time(popped),
+            self._handle_seq(popped),
+        ):
+            raise ValueError("Cannot cancel an event already processed")
+        self._cancelled.add(seq)
+        self.events_cancelled += 1
+        tombstones = len(self._cancelled)
+        if tombstones > self.compact_threshold and 2 * tombstones > (
+            self.queued_events()
+        ):
+            self.compact()
+
+    def reschedule(self, handle: EventHandle, new_timestamp: int) -> EventHandle:
+        """Moves a pending event to another time, returns its new handle."""
+        self.cancel(handle)
+        if isinstance(handle, Event):
+            return self.schedule_event(
+                Event(new_timestamp, handle.event_type, handle.target_id, handle.args)
+            )
+        _, _, event_code, target_id, payload = handle
+        return self.post(new_timestamp, event_code, target_id, payload)
+
+    def compact(self) -> None:
+        """Removes the cancelled events from the queue."""
+        cancelled = self._cancelled
+        handle_seq = self._handle_seq
+        self.event_queue.compact(lambda item: handle_seq(item) not in cancelled)
+        cancelled.clear()
+
+    def queued_events(self) -> int:
+        """Number of events in the queue, with the cancelled ones."""
+        return len(self.event_queue)
+
+    def pending_events(self) -> int:
+        """Number of events in the queue, without the cancelled ones."""
+        return len(self.event_queue) - len(self._cancelled)
+
+    def live_events(self) -> List[Any]:
+        """The pending events, without the cancelled ones, in no particular order."""
+        cancelled = self._cancelled
+        handle_seq = self._handle_seq
+        return [
+            item
+            for item in self.event_queue.items()
+            if handle_seq(item) not in cancelled
+        ]
+
+    def drop_events(self) -> None:
+        """Drops all the pending events."""
+        self.event_queue.compact(lambda item: False)
+        self._cancelled.clear()
 
     def dispatch_event(self, event: Event) -> None:
         """Finds the correct object and lets it handle the event."""
@@ -39,9 +220,437 @@ class SimulationEngine:
 
     def run(self) -> None:
         """Processes all scheduled events until completion."""
-        while self.event_queue:
-            event: Event = heapq.heappop(self.event_queue)
-            self.current_time = event.timestamp
-            self.dispatch_event(event)
+        self.run_until()
+        self.tracer.close()
 
         print("Simulation completed.")
+
+    def run_until(self, end_ns: Optional[int] = None) -> Optional[int]:
+        """Processes the events scheduled before end_ns (all of them by default).
+        Returns the time of the next pending event, None if the queue is empty.
+        """
+        if self.profiler is None:
+            return self._run_events(end_ns, self.dispatch_event)
+        # the same loop, dispatching through the profiler
+        with self.profiler.profiling(self):
+            return self._run_events(end_ns, self.profiler.instrument_dispatch(self))
+
+    def _run_events(self, end_ns: Optional[int], dispatch: Dispatch) -> Optional[int]:
+        end = sys.maxsize if end_ns is None else end_ns
+        cancelled = self._cancelled
+        while self.event_queue:
+            event: Event = self.event_queue.pop_next()
+            if event.timestamp >= end:
+                self.event_queue.push(event.timestamp, event)
+                return event.timestamp
+            self._popped = event
+            if cancelled and event.seq in cancelled:
+                cancelled.discard(event.seq)
+                self.events_skipped += 1
+                continue
+            self.current_time_ns = event.timestamp
+            dispatch(event)
+            self.events_processed += 1
+        return None
+
+
+class CompactSimulationEngine(SimulationEngine):
+    """Engine mode for large runs.
+
+    Events are plain tuples (timestamp, seq, event_code, target_id, payload), so
+    the heap compares them in C and no Event object or args dict is allocated.
+    Each registered object provides event_handlers(), a dict mapping event codes
+    to handlers; they are stored once in a dispatch table indexed by
+    [target_id][event_code] and called as handler(timestamp, target_id, payload).
+
+    Event objects passed to schedule_event() are still supported, they are
+    delivered to the target's handle_event().
+
+    The handle of an event is its tuple, it can be passed to cancel() and
+    reschedule() like the Event objects of the base engine.
+
+    With batching, the events of a type posted for the same time are coalesced
+    into one queue entry (timestamp, seq, EVENT_BATCH, event_code, events) as
+    long as no other event is posted for that time in between, so they keep
+    their (timestamp, seq) order: in SPMD runs the N events of the GPUs cost
+    one push and one pop. A batch is dispatched event by event, except for the
+    targets that opt in with batch_handlers(), a dict mapping event codes to
+    handlers called as handler(timestamp, target_ids, payloads): the
+    consecutive events of a batch whose targets have the same batch handler
+    (an object registered under several IDs) go to it in one call. A batch
+    handler gets these events at once, so it must not cancel them.
+    """
+
+    compact_events = True
+
+    def __init__(
+        self, scheduler: Optional[Scheduler] = None, batching: bool = False
+    ) -> None:
+        super().__init__(scheduler)
+        self.dispatch_table: List[Optional[List[Optional[Handler]]]] = []
+        # the binary heap is driven by heapq directly in the hot path
+        self._heap: bool = type(self.event_queue) is HeapScheduler
+        self.batching: bool = batching
+        self.batch_handlers: BatchHandlers = {}
+        # the last batch posted for each time, events are added to it until an
+        # event of another type is posted for that time or it is dispatched
+        self._open_batches: Dict[int, CompactEvent] = {}
+        # the events of the batch being dispatched, out of the queue
+        self._in_flight: Sequence[CompactEvent] = ()
+        # events in the queued batches past their first one: with the entries of
+        # the queue, the number of queued events
+        self._batched_events: int = 0
+
+    def register_object(self, obj_id: int, obj: Any) -> None:
+        """Registers an object and its handlers in the dispatch table."""
+        super().register_object(obj_id, obj)
+        row: List[Optional[Handler]] = [None] * len(EVENT_TYPE_NAMES)
+        if hasattr(obj, "event_handlers"):
+            for event_code, handler in obj.event_handlers().items():
+                row[event_code] = handler
+        row[LEGACY_EVENT] = self._legacy_handler(obj)
+        if hasattr(obj, "batch_handlers"):
+            for event_code, batch_handler in obj.batch_handlers().items():
+                self.batch_handlers[event_code, obj_id] = batch_handler
+        if obj_id >= len(self.dispatch_table):
+            self.dispatch_table.extend([None] * (obj_id + 1 - len(self.dispatch_table)))
+        self.dispatch_table[obj_id] = row
+
+    def register_objects(self, obj_ids: Sequence[int], obj: Any) -> None:
+        """Registers one object under several IDs, they share its row of the
+        dispatch table.
+        """
+        if not obj_ids:
+            return
+        self.register_object(obj_ids[0], obj)
+        super().register_objects(obj_ids, obj)
+        row = self.dispatch_table[obj_ids[0]]
+        last = max(obj_ids)
+        if last >= len(self.dispatch_table):
+            self.dispatch_table.extend([None] * (last + 1 - len(self.dispatch_table)))
+        table = self.dispatch_table
+        for obj_id in obj_ids:
+            table[obj_id] = row
+        if hasattr(obj, "batch_handlers"):
+            for event_code, batch_handler in obj.batch_handlers().items():
+                for obj_id in obj_ids:
+                    self.batch_handlers[event_code, obj_id] = batch_handler
+
+    @staticmethod
+    def _legacy_handler(obj: Any) -> Handler:
+        def handle(timestamp: int, target_id: int, event: Event) -> None:
+            obj.handle_event(event)
+
+        return handle
+
+    def schedule_event(self, event: Event) -> EventHandle:
+        """Adds an Event object to the queue, it's handled by handle_event()."""
+        return self.post(event.timestamp, LEGACY_EVENT, event.target_id, event)
+
+    def post(
+        self, timestamp: int, event_code: int, target_id: int, payload: Any
+    ) -> EventHandle:
+        """Adds a compact event to the priority queue, returns it as handle."""
+        if self.batching:
+            return self._post_batched(timestamp, event_code, target_id, payload)
+        entry = (timestamp, self._seq, event_code, target_id, payload)
+        self._seq += 1
+        if self._heap:
+            heapq.heappush(self.event_queue, entry)
+        else:
+            self.event_queue.push(timestamp, entry)
+        return entry
+
+    def _post_batched(
+        self, timestamp: int, event_code: int, target_id: int, payload: Any
+    ) -> CompactEvent:
+        batch = self._open_batches.get(timestamp)
+        if batch is not None and batch[3] == event_code:
+            entry = (timestamp, self._seq, event_code, target_id, payload)
+            self._seq += 1
+            batch[4].append(entry)
+            self._batched_events += 1
+            return entry
+        # the batch is before its events, they all have the next seqs
+        entry = (timestamp, self._seq + 1, event_code, target_id, payload)
+        batch = (timestamp, self._seq, EVENT_BATCH, event_code, [entry])
+        self._seq += 2
+        self._open_batches[timestamp] = batch
+        if self._heap:
+            heapq.heappush(self.event_queue, batch)
+        else:
+            self.event_queue.push(timestamp, batch)
+        return entry
+
+    def compact(self) -> None:
+        """Removes the cancelled events from the queue and its batches, and the
+        batches left empty.
+        """
+        if not self.batching:
+            super().compact()
+            return
+        cancelled = self._cancelled
+        open_batches = self._open_batches
+        batched = 0
+        for item in self.event_queue.items():
+            timestamp, _, event_code, _, events = item
+            if event_code == EVENT_BATCH:
+                events[:] = [entry for entry in events if entry[1] not in cancelled]
+                batched += max(len(events) - 1, 0)
+                if not events and open_batches.get(timestamp) is item:
+                    del open_batches[timestamp]
+        self._batched_events = batched
+        # the batch being dispatched keeps its tombstones
+        in_flight = [entry[1] for entry in self._in_flight if entry[1] in cancelled]
+        self.event_queue.compact(
+            lambda item: (
+                bool(item[4]) if item[2] == EVENT_BATCH else item[1] not in cancelled
+            )
+        )
+        cancelled.clear()
+        cancelled.update(in_flight)
+
+    def queued_events(self) -> int:
+        """Number of events in the queue, with the cancelled ones; a batch
+        counts its events.
+        """
+        return len(self.event_queue) + self._batched_events
+
+    def pending_events(self) -> int:
+        """Number of events in the queue, without the cancelled ones."""
+        if not self.batching:
+            return super().pending_events()
+        return len(self.live_events())
+
+    def live_events(self) -> List[Any]:
+        """The pending events, without the cancelled ones, in no particular
+        order; batches are split in their events.
+        """
+        cancelled = self._cancelled
+        events = []
+        for item in self.event_queue.items():
+            for entry in item[4] if item[2] == EVENT_BATCH else (item,):
+                if entry[1] not in cancelled:
+                    events.append(entry)
+        return events
+
+    def drop_events(self) -> None:
+        """Drops all the pending events."""
+        super().drop_events()
+        self._open_batches.clear()
+        self._batched_events = 0
+
+    def reschedule(self, handle: EventHandle, new_timestamp: int) -> EventHandle:
+        """Moves a pending event to another time, returns its new handle."""
+        if not isinstance(handle, Event) and handle[2] == LEGACY_EVENT:
+            # the Event object carries its timestamp, it's copied
+            self.cancel(handle)
+            event: Event = handle[4]
+            return self.schedule_event(
+                Event(new_timestamp, event.event_type, event.target_id, event.args)
+            )
+        return super().reschedule(handle, new_timestamp)
+
+    def dispatch_event(self, event: CompactEvent) -> None:  # type: ignore[override]
+        """Calls the handler of a compact event."""
+        timestamp, _, event_code, target_id, payload = event
+        self._lookup(event_code, target_id)(timestamp, target_id, payload)
+
+    def _lookup(self, event_code: int, target_id: int) -> Handler:
+        handler: Optional[Handler] = None
+        if 0 <= target_id < len(self.dispatch_table):
+            row = self.dispatch_table[target_id]
+            if row is not None and event_code < len(row):
+                handler = row[event_code]
+        if handler is None:
+            raise ValueError(
+                f"No handler found for event {EVENT_TYPE_NAMES[event_code]} "
+                f"and ID: {target_id}"
+            )
+        return handler
+
+    def run_until(self, end_ns: Optional[int] = None) -> Optional[int]:
+        """Processes the events scheduled before end_ns (all of them by default).
+        Returns the time of the next pending event, None if the queue is empty.
+        """
+        profiler = self.profiler
+        if profiler is None:
+            return self._run(end_ns, self.dispatch_table, self.batch_handlers)
+        # the same loops, dispatching to the handlers wrapped by the profiler
+        with profiler.profiling(self):
+            return self._run(
+                end_ns,
+                profiler.instrument_table(self),
+                profiler.instrument_batch_handlers(self),
+            )
+
+    def _run(
+        self,
+        end_ns: Optional[int],
+        table: DispatchTable,
+        batch_handlers: BatchHandlers,
+    ) -> Optional[int]:
+        if self.batching:
+            return self._run_batched(end_ns, table, batch_handlers)
+        end = sys.maxsize if end_ns is None else end_ns
+        queue = self.event_queue
+        pop = functools.partial(heapq.heappop, queue) if self._heap else queue.pop_next
+        cancelled = self._cancelled
+        processed = 0
+        try:
+            while queue:
+                entry: CompactEvent = pop()
+                timestamp, seq, event_code, target_id, payload = entry
+                if timestamp >= end:
+                    # not processed, back in the queue with the same seq
+                    if self._heap:
+                        heapq.heappush(queue, entry)
+                    else:
+                        queue.push(timestamp, entry)
+                    return timestamp
+                self._popped = entry
+                if cancelled and seq in cancelled:
+                    cancelled.discard(seq)
+                    self.events_skipped += 1
+                    continue
+                self.current_time_ns = timestamp
+                try:
+                    handler = table[target_id][event_code]  # type: ignore[index]
+                except (IndexError, TypeError):  # unknown target, or a None row
+                    handler = None
+                if handler is None:
+                    handler = self._lookup(event_code, target_id)
+                handler(timestamp, target_id, payload)
+                processed += 1
+        finally:
+            self.events_processed += processed
+        return None
+
+    def _run_batched(
+        self,
+        end_ns: Optional[int],
+        table: DispatchTable,
+        batch_handlers: BatchHandlers,
+    ) -> Optional[int]:
+        """run_until() with event batching: an entry is an event or a batch."""
+        end = sys.maxsize if end_ns is None else end_ns
+        queue = self.event_queue
+        pop = functools.partial(heapq.heappop, queue) if self._heap else queue.pop_next
+        cancelled = self._cancelled
+        open_batches = self._open_batches
+        processed = 0
+        try:
+            while queue:
+                entry: CompactEvent = pop()
+                timestamp, seq, event_code, target_id, payload = entry
+                if timestamp >= end:
+                    if self._heap:
+                        heapq.heappush(queue, entry)
+                    else:
+                        queue.push(timestamp, entry)
+                    return timestamp
+                self.current_time_ns = timestamp
+                if event_code == EVENT_BATCH:
+                    # closed, the events posted from now on run after it
+                    if open_batches.get(timestamp) is entry:
+                        del open_batches[timestamp]
+                    self._batched_events -= len(payload) - 1
+                    processed += self._dispatch_batch(
+                        timestamp, target_id, payload, table, batch_handlers
+                    )
+                    continue
+                # a single event, restored from a checkpoint
+                self._popped = entry
+                if cancelled and seq in cancelled:
+                    cancelled.discard(seq)
+                    self.events_skipped += 1
+                    continue
+                try:
+                    handler = table[target_id][event_code]  # type: ignore[index]
+                except (IndexError, TypeError):
+                    handler = None
+                if handler is None:
+                    handler = self._lookup(event_code, target_id)
+                handler(timestamp, target_id, payload)
+                processed += 1
+        finally:
+            self.events_processed += processed
+        return None
+
+    def _dispatch_batch(
+        self,
+        timestamp: int,
+        event_code: int,
+        events: List[CompactEvent],
+        table: DispatchTable,
+        batch_handlers: BatchHandlers,
+    ) -> int:
+        """Dispatches the events of a batch, returns how many were processed."""
+        if not batch_handlers:
+            return self._dispatch_events(timestamp, event_code, events, table)
+        processed = 0
+        # events of the batch may be cancelled by the previous ones
+        self._in_flight = events
+        try:
+            for batch_handler, group in itertools.groupby(
+                events, lambda entry: batch_handlers.get((event_code, entry[3]))
+            ):
+                run = list(group)
+                if batch_handler is None:
+                    processed += self._dispatch_events(
+                        timestamp, event_code, run, table
+                    )
+                    continue
+                self._popped = run[-1]
+                cancelled = self._cancelled
+                if cancelled:
+                    live = [entry for entry in run if entry[1] not in cancelled]
+                    cancelled.difference_update(entry[1] for entry in run)
+                    self.events_skipped += len(run) - len(live)
+                    run = live
+                if run:
+                    batch_handler(
+                        timestamp,
+                        [entry[3] for entry in run],
+                        [entry[4] for entry in run],
+                    )
+                processed += len(run)
+        finally:
+            self._in_flight = ()
+        return processed
+
+    def _dispatch_events(
+        self,
+        timestamp: int,
+        event_code: int,
+        events: List[CompactEvent],
+        table: DispatchTable,
+    ) -> int:
+        """Dispatches events of a batch one by one, returns how many were
+        processed.
+        """
+        cancelled = self._cancelled
+        processed = 0
+        in_flight = self._in_flight
+        # events of the batch may be cancelled by the previous ones
+        if not in_flight:
+            self._in_flight = events
+        try:
+            for entry in events:
+                _, seq, _, target_id, payload = entry
+                self._popped = entry
+                if cancelled and seq in cancelled:
+                    cancelled.discard(seq)
+                    self.events_skipped += 1
+                    continue
+                try:
+                    handler = table[target_id][event_code]  # type: ignore[index]
+                except (IndexError, TypeError):
+                    handler = None
+                if handler is None:
+                    handler = self._lookup(event_code, target_id)
+                handler(timestamp, target_id, payload)
+                processed += 1
+        finally:
+            self._in_flight = in_flight
+        return processed
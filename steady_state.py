@@ -0,0 +1,278 @@
+"""Steady-state detection and extrapolation of iterative training traces.
+
+A training trace repeats the same step: its program is periodic, instruction
+i + P equals instruction i for a period of P instructions (found with the KMP
+failure function), and iteration k is the block of instructions
+[k * P, (k + 1) * P).
+
+run_steady_state() simulates the iterations and compares each one, once all the
+GPUs finished it, with the previous ones. The compute and communication streams
+of a GPU run independently, so they are compared separately: the start and end
+times of the instructions of the stream relative to its first one in the
+iteration. When `confirm` consecutive iterations have the same relative times
+on every (GPU, stream), each starting a fixed time after the previous one (the
+period in ns of that stream), the state repeats and the remaining iterations
+are extrapolated instead of simulated: instruction m * P + j gets the times of
+instruction L * P + j of the last simulated iteration L, shifted by (m - L)
+periods of its stream. A trailing partial iteration is extrapolated the same
+way. The reported period is the longest one, the time per iteration.
+
+The finished instructions of the extrapolated iterations are logged in end time
+order, the pending events of the simulation are dropped and the engine time is
+set to the extrapolated end of the run. The GPUs then run nothing, and the
+network counts their remaining collectives as issued and has none waiting for
+ranks, like at the end of a simulation. Programs with dependencies are not
+supported: an instruction may wait for one of an earlier iteration.
+"""
+
+from array import array
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from collectives import COLLECTIVES
+from gpu import GPU
+from network import Network
+from program import INS_COMMUNICATION, INS_COMPUTE, Program, StreamingProgram
+from simulation_engine import SimulationEngine
+
+# (start, end) times of the instructions of one stream in an iteration,
+# relative to the start of the iteration on that stream
+StreamTimes = Tuple[Tuple[int, int], ...]
+
+
+class SteadyState(NamedTuple):
+    period_instructions: int  # P, 0 if the program doesn't repeat
+    period_ns: int  # time between two iterations, 0 if not detected
+    iterations: int  # of the program, the last one may be partial
+    simulated_iterations: int  # the others were extrapolated
+    end_time_ns: int
+
+    def __str__(self) -> str:
+        if not self.period_ns:
+            return (
+                f"No steady state detected, {self.iterations} iterations "
+                f"simulated, end time {self.end_time_ns} ns"
+            )
+        return (
+            f"Steady state: period of {self.period_instructions} instructions "
+            f"and {self.period_ns} ns, {self.simulated_iterations} of "
+            f"{self.iterations} iterations simulated, extrapolated end time "
+            f"{self.end_time_ns} ns"
+        )
+
+
+def program_period(program: Program) -> int:
+    """Smallest P such that instruction i + P equals instruction i, len(program)
+    if the program doesn't repeat.
+    """
+    keys = list(
+        zip(
+            program.ins_types,
+            program.sizes,
+            program.op_codes,
+            program.src_codes,
+            program.dst_codes,
+        )
+    )
+    if not keys:
+        return 0
+    # KMP failure function: longest proper prefix of keys[: i + 1] that is
+    # also a suffix, the period is what's left of the longest one
+    failure = [0] * len(keys)
+    length = 0
+    for i in range(1, len(keys)):
+        while length and keys[i] != keys[length]:
+            length = failure[length - 1]
+        if keys[i] == keys[length]:
+            length += 1
+        failure[i] = length
+    return len(keys) - failure[-1]
+
+
+class _IterationTracker:
+    """Follows the finished log of a GPU and counts its finished iterations.
+    Each stream finishes its instructions in order, so iterations are finished
+    in order too.
+    """
+
+    def __init__(self, gpu: GPU, period: int, streams: List[List[int]]) -> None:
+        self.gpu: GPU = gpu
+        self.period: int = period
+        self.streams: List[List[int]] = streams  # positions in the iteration
+        self.logged: int = 0  # entries of the finished log already counted
+        self.counts: Dict[int, int] = {}  # finished instructions per iteration
+        self.finished: int = 0  # iterations fully finished
+
+    def update(self) -> int:
+        log = self.gpu.finished_instructions.indices
+        period = self.period
+        counts = self.counts
+        for position in range(self.logged, len(log)):
+            iteration = log[position] // period
+            counts[iteration] = counts.get(iteration, 0) + 1
+        self.logged = len(log)
+        while counts.get(self.finished) == period:
+            del counts[self.finished]
+            self.finished += 1
+        return self.finished
+
+    def signatures(self, iteration: int) -> List[Tuple[int, StreamTimes]]:
+        """Per stream, the start of the iteration on the stream and the times
+        of its instructions from it.
+        """
+        start_times = self.gpu.start_times
+        end_times = self.gpu.end_times
+        first = iteration * self.period
+        signatures = []
+        for positions in self.streams:
+            base = start_times[first + positions[0]]
+            signatures.append(
+                (
+                    base,
+                    tuple(
+                        (start_times[first + j] - base, end_times[first + j] - base)
+                        for j in positions
+                    ),
+                )
+            )
+        return signatures
+
+
+def run_steady_state(
+    engine: SimulationEngine, gpus: Sequence[GPU], confirm: int = 3
+) -> SteadyState:
+    """Runs the started simulation to completion, extrapolating the iterations
+    once `confirm` consecutive ones repeat (at least 2).
+    """
+    simulated = [gpu for gpu in gpus if gpu.representative is gpu]
+    if any(isinstance(gpu.program, StreamingProgram) for gpu in simulated):
+        raise ValueError("The steady state needs the whole program, not streaming")
+    if any(gpu.in_degrees is not None for gpu in simulated):
+        raise ValueError("The steady state of dependencies is not supported")
+    periods = {(program_period(gpu.program), len(gpu.program)) for gpu in simulated}
+    period, length = periods.pop() if len(periods) == 1 else (0, 0)
+    if not period or period == length:
+        # different programs, or no repetition: nothing to extrapolate
+        engine.run_until()
+        return SteadyState(period, 0, 1, 1, engine.current_time_ns)
+
+    confirm = max(confirm, 2)
+    iterations = -(-length // period)
+    trackers = []
+    for gpu in simulated:
+        types = gpu.program.ins_types
+        streams = [
+            [j for j in range(period) if types[j] == ins_type]
+            for ins_type in (INS_COMPUTE, INS_COMMUNICATION)
+        ]
+        trackers.append(
+            _IterationTracker(gpu, period, [stream for stream in streams if stream])
+        )
+    # bases and signature of each (GPU, stream) for the finished iterations
+    history: List[Tuple[List[int], List[StreamTimes]]] = []
+    window = 1
+    next_ns: Optional[int] = engine.run_until(engine.current_time_ns)
+    while next_ns is not None:
+        next_ns = engine.run_until(next_ns + window)
+        finished = min(tracker.update() for tracker in trackers)
+        # full iterations only, the last one may be partial
+        finished = min(finished, length // period)
+        if len(history) == finished:
+            window *= 2
+            continue
+        while len(history) < finished:
+            signatures = [
+                signature
+                for tracker in trackers
+                for signature in tracker.signatures(len(history))
+            ]
+            history.append(
+                ([base for base, _ in signatures], [times for _, times in signatures])
+            )
+        periods_ns = _repeating(history[-confirm:], confirm)
+        if periods_ns is not None:
+            last = len(history) - 1
+            end_time_ns = _extrapolate(engine, trackers, last, periods_ns)
+            return SteadyState(
+                period, max(periods_ns), iterations, last + 1, end_time_ns
+            )
+        if len(history) >= 2:
+            # about one iteration per window
+            window = max(max(b - a for a, b in zip(history[-2][0], history[-1][0])), 1)
+    return SteadyState(period, 0, iterations, iterations, engine.current_time_ns)
+
+
+def _repeating(
+    history: List[Tuple[List[int], List[StreamTimes]]], confirm: int
+) -> Optional[List[int]]:
+    """The period in ns of each (GPU, stream) if the iterations are identical
+    and evenly spaced on all of them, None otherwise.
+    """
+    if len(history) < confirm:
+        return None
+    first_bases, signature = history[0]
+    periods_ns = [b - a for a, b in zip(first_bases, history[1][0])]
+    for k, (bases, other) in enumerate(history):
+        if other != signature:
+            return None
+        for base, first, period_ns in zip(bases, first_bases, periods_ns):
+            if base != first + k * period_ns:
+                return None
+    return periods_ns
+
+
+def _extrapolate(
+    engine: SimulationEngine,
+    trackers: List[_IterationTracker],
+    last: int,
+    periods_ns: List[int],
+) -> int:
+    """Fills the times of the iterations after `last` and ends the simulation,
+    returns the end time.
+    """
+    stream_periods = iter(periods_ns)
+    networks: Dict[int, Network] = {}
+    for tracker in trackers:
+        gpu = tracker.gpu
+        period = tracker.period
+        # period in ns of each instruction position of the iteration
+        position_ns = [0] * period
+        for positions in tracker.streams:
+            period_ns = next(stream_periods)
+            for j in positions:
+                position_ns[j] = period_ns
+        first = (last + 1) * period
+        start_times = gpu.start_times
+        end_times = gpu.end_times
+        for index in range(first, len(gpu.program)):
+            j = index % period
+            shift = (index // period - last) * position_ns[j]
+            start_times[index] = start_times[last * period + j] + shift
+            end_times[index] = end_times[last * period + j] + shift
+        log = gpu.finished_instructions.indices
+        assert not isinstance(log, deque)  # not a StreamingProgram
+        kept = array("i", (index for index in log if index < first))
+        del log[:]
+        log.extend(kept)
+        log.extend(
+            sorted(range(first, len(gpu.program)), key=lambda i: (end_times[i], i))
+        )
+        # the collectives not issued yet are issued by the extrapolation
+        network = gpu.network
+        networks[id(network)] = network
+        program = gpu.program
+        comm_queue = gpu.comm_queue
+        for index in comm_queue.indices[comm_queue.pc :]:
+            if program.operation(index).upper() in COLLECTIVES:
+                network.arrival(gpu.gpu_id, program.destination(index))
+        gpu.compute_queue.pc = len(gpu.compute_queue.indices)
+        comm_queue.pc = len(comm_queue.indices)
+        gpu.running_compute = gpu.running_comm = 0
+        engine.current_time_ns = max(
+            engine.current_time_ns, max(end_times[index] for index in log)
+        )
+    # the events of the iterations simulated ahead are dropped, with the
+    # transfers they would end
+    engine.drop_events()
+    for network in networks.values():
+        network.drop_transfers()
+    return engine.current_time_ns
@@ -0,0 +1,194 @@
+"""Parameter sweep: runs the simulation for many system configs in a process pool.
+
+The trace is compiled once, written in the binary format (see binary_trace.py)
+into a shared memory block, and each worker maps it as a read-only
+MappedProgram, so the workers neither parse nor copy it. Each point of the sweep
+overrides keys of the base system config; the summary of every run is one row
+of the results table.
+
+The sweep file is JSON, a grid (every combination of the values) or a list:
+    {"grid": {"TOPOLOGY": ["RING", "TREE"], "NETWORK_BANDWIDTH": [25, 50, 100]}}
+    {"configs": [{"NUM_GPUS": 8}, {"NUM_GPUS": 16, "TOPOLOGY": "TREE"}]}
+Usage:
+    python sweep.py sweep.json --workers 8 -o results.csv
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, List, Optional, Sequence, TextIO
+from binary_trace import MappedProgram, dump_program, is_binary_trace, load_program
+from main import build_simulation, read_input_files, read_system_config
+from program import INS_COMPUTE, Program
+
+# columns of the results table after the swept keys
+METRICS: List[str] = [
+    "makespan_ns",
+    "compute_ns",
+    "comm_ns",
+    "events",
+    "wall_time_s",
+]
+
+# state of a worker process, set by _attach()
+_shared_memory: Optional[SharedMemory] = None
+_program: Optional[Program] = None
+
+
+def expand_sweep(sweep: Dict[str, Any]) -> List[Dict[str, str]]:
+    """The points of a sweep: the combinations of a grid, or a list of configs."""
+    if "grid" in sweep:
+        keys = list(sweep["grid"])
+        return [
+            {key: str(value) for key, value in zip(keys, values)}
+            for values in itertools.product(*(sweep["grid"][key] for key in keys))
+        ]
+    if "configs" in sweep:
+        return [
+            {key: str(value) for key, value in point.items()}
+            for point in sweep["configs"]
+        ]
+    raise ValueError("The sweep needs a 'grid' or a 'configs' entry")
+
+
+def share_program(program: Program) -> SharedMemory:
+    """Copies a program, in the binary format, into a new shared memory block."""
+    data = io.BytesIO()
+    dump_program(program, data)
+    block = SharedMemory(create=True, size=max(len(data.getbuffer()), 1))
+    assert block.buf is not None
+    block.buf[: len(data.getbuffer())] = data.getbuffer()
+    return block
+
+
+def _attach(name: str) -> None:
+    """Pool initializer: maps the shared program, without copying it."""
+    global _shared_memory, _program
+    _shared_memory = SharedMemory(name=name)
+    assert _shared_memory.buf is not None
+    _program = MappedProgram(_shared_memory.buf)
+
+
+def run_point(
+    point: Dict[str, str], base_config: Dict[str, str], collapse: bool = False
+) -> Dict[str, Any]:
+    """Runs one simulation in a worker and returns its summary row. With
+    `collapse`, identical GPUs are simulated once: the times are the same, but
+    the events are those of the representatives only.
+    """
+    assert _program is not None, "the worker is not attached to the shared program"
+    config = dict(base_config, **point)
+    start = time.perf_counter()
+    # engine.run() prints "Simulation completed." for every point
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        engine, gpus = build_simulation(
+            [_program] * int(config["NUM_GPUS"]),
+            config,
+            compact_events=True,
+            collapse=collapse,
+        )
+        for gpu in gpus:
+            gpu.start_gpu()
+        engine.run()
+    wall_time_s = time.perf_counter() - start
+
+    # busy time of the compute and communication streams, averaged over GPUs
+    compute_ns = comm_ns = 0
+    for gpu in gpus:
+        for index in gpu.finished_instructions.indices:
+            duration = gpu.end_times[index] - gpu.start_times[index]
+            if _program.ins_types[index] == INS_COMPUTE:
+                compute_ns += duration
+            else:
+                comm_ns += duration
+    row: Dict[str, Any] = dict(point)
+    row.update(
+        makespan_ns=engine.current_time_ns,
+        compute_ns=compute_ns // max(len(gpus), 1),
+        comm_ns=comm_ns // max(len(gpus), 1),
+        events=engine.events_processed,
+        wall_time_s=round(wall_time_s, 6),
+    )
+    return row
+
+
+def run_sweep(
+    trace_file: str,
+    system_config_file: str,
+    points: Sequence[Dict[str, str]],
+    workers: Optional[int] = None,
+    collapse: bool = False,
+) -> List[Dict[str, Any]]:
+    """Runs every point of the sweep, returns the results in the order of the points."""
+    program: Program
+    if is_binary_trace(trace_file):
+        program = load_program(trace_file)
+    else:
+        program = Program.from_lines(read_input_files(trace_file))
+    base_config = read_system_config(system_config_file)
+    block = share_program(program)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_attach, initargs=(block.name,)
+        ) as pool:
+            return list(
+                pool.map(
+                    run_point,
+                    points,
+                    itertools.repeat(base_config),
+                    itertools.repeat(collapse),
+                    chunksize=1,
+                )
+            )
+    finally:
+        block.close()
+        block.unlink()
+
+
+def write_results(rows: List[Dict[str, Any]], out: TextIO) -> None:
+    """Writes the results table as CSV."""
+    keys: List[str] = []
+    for row in rows:
+        keys += [key for key in row if key not in keys and key not in METRICS]
+    writer = csv.DictWriter(out, fieldnames=keys + METRICS, lineterminator="\n")
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run a parameter sweep.")
+    parser.add_argument("sweep", help="JSON file with a 'grid' or 'configs' entry")
+    parser.add_argument("--trace", default="gpu_trace.txt")
+    parser.add_argument("--config", default="system_config.txt")
+    parser.add_argument("--workers", type=int, help="processes, all cores by default")
+    parser.add_argument("-o", "--output", help="CSV results, stdout by default")
+    parser.add_argument(
+        "--collapse",
+        action="store_true",
+        help="simulate identical GPUs once, the events column counts them once",
+    )
+    args = parser.parse_args(argv)
+
+    with open(args.sweep) as file:
+        points = expand_sweep(json.load(file))
+    start = time.perf_counter()
+    rows = run_sweep(args.trace, args.config, points, args.workers, args.collapse)
+    elapsed = time.perf_counter() - start
+    if args.output:
+        with open(args.output, "w") as out:
+            write_results(rows, out)
+    else:
+        write_results(rows, sys.stdout)
+    print(f"{len(rows)} runs in {elapsed:.2f} s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
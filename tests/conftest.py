@@ -2,7 +2,7 @@ import pytest
 from simulation_engine import SimulationEngine
 from network import Network
 from gpu import GPU
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Sequence, Tuple
 
 
 @pytest.fixture
@@ -79,3 +79,16 @@ def gpu_instance(
         network_instance,
         sim_engine_instance,
     )
+
+
+def finished_times(gpus: Sequence[GPU]) -> List[List[Tuple[int, int, int]]]:
+    """The (index, start, end) times of the finished instructions of each GPU,
+    in finish order.
+    """
+    return [
+        [
+            (i, gpu.start_times[i], gpu.end_times[i])
+            for i in gpu.finished_instructions.indices
+        ]
+        for gpu in gpus
+    ]
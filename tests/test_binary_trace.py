@@ -0,0 +1,92 @@
+import io
+import pytest
+from pathlib import Path
+from binary_trace import (
+    MappedProgram,
+    convert_text_trace,
+    dump_program,
+    is_binary_trace,
+    load_program,
+)
+from main import initialize_simulation
+from program import Program
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+TRACE = [
+    "COMPUTE, ALL, , 100000000, EXECUTE",
+    "COMPUTE, ALL, , 50000000, EXECUTE",
+    "COMMUNICATION, ALL, , 1048576, ALL_REDUCE",
+    "COMPUTE, ALL, , 30000000, EXECUTE",
+]
+COLUMNS = [
+    "sizes",
+    "ins_types",
+    "op_codes",
+    "src_codes",
+    "dst_codes",
+    "compute_indices",
+    "comm_indices",
+]
+
+
+def test_binary_round_trip(tmp_path: Path) -> None:
+    """Test that a converted trace loads back with the same columns and strings."""
+    text_path = tmp_path / "trace.txt"
+    text_path.write_text("# SPMD trace\n" + "\n".join(TRACE))
+    binary_path = str(tmp_path / "trace.bin")
+    program = convert_text_trace(str(text_path), binary_path)
+    assert is_binary_trace(binary_path)
+    assert not is_binary_trace(str(text_path))
+
+    loaded = load_program(binary_path)
+    assert len(loaded) == 4
+    assert loaded.strings == program.strings
+    for name in COLUMNS:
+        assert list(getattr(loaded, name)) == list(getattr(program, name))
+    assert isinstance(loaded.sizes, memoryview)  # not copied
+    assert loaded.operation(2) == "ALL_REDUCE"
+
+
+def test_many_strings() -> None:
+    """Test string codes past 16 bits, e.g. the destinations of 100k GPUs."""
+    program = Program.from_lines(
+        [f"COMMUNICATION, 0, {rank}, 1024, SEND" for rank in range(1, 70001)]
+    )
+    assert program.dst_codes[-1] >= 1 << 16
+    buffer = io.BytesIO()
+    dump_program(program, buffer)
+    loaded = MappedProgram(buffer.getvalue())
+    assert list(loaded.dst_codes) == list(program.dst_codes)
+    assert loaded.strings[loaded.dst_codes[-1]] == "70000"
+
+
+def test_binary_errors() -> None:
+    """Test that wrong or truncated buffers are rejected."""
+    buffer = io.BytesIO()
+    dump_program(Program.from_lines(TRACE), buffer)
+    data = buffer.getvalue()
+    MappedProgram(data)
+    with pytest.raises(ValueError):
+        MappedProgram(b"NOTATRACE" + data[9:])
+    with pytest.raises(ValueError):
+        MappedProgram(data[:-4])
+    with pytest.raises(ValueError):
+        MappedProgram(data[:10])
+
+
+def test_simulation_from_binary_trace(tmp_path: Path) -> None:
+    """Test that initialize_simulation runs a binary trace like the text one."""
+    binary_path = str(tmp_path / "gpu_trace.bin")
+    text_path = str(REPO_DIR / "gpu_trace.txt")
+    convert_text_trace(text_path, binary_path)
+    results = []
+    for trace_file in (text_path, binary_path):
+        engine, gpus = initialize_simulation(
+            trace_file, str(REPO_DIR / "system_config.txt"), compact_events=True
+        )
+        for gpu in gpus:
+            gpu.start_gpu()
+        engine.run()
+        results.append([list(gpu.end_times) for gpu in gpus])
+    assert results[0] == results[1]
@@ -0,0 +1,179 @@
+import os
+import pytest
+from pathlib import Path
+from typing import Dict, Sequence, Tuple
+from checkpoint import RECORD_HEADER, Checkpointer, restore, run_with_checkpoints
+from conftest import finished_times
+from gpu import GPU
+from main import build_simulation, read_input_files, read_system_config
+from program import Program
+from simulation_engine import SimulationEngine
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def detailed_simulation(
+    program: Program, compact: bool, scheduler: str = "HEAP", batch: bool = False
+) -> Tuple[SimulationEngine, Sequence[GPU]]:
+    """8 GPUs with one event per chunk, so collectives are in flight."""
+    config: Dict[str, str] = read_system_config(str(REPO_DIR / "system_config.txt"))
+    config.update(COLLECTIVE_MODE="DETAILED", COMMUNICATION_CHUNK_SIZE="65536")
+    return build_simulation(
+        [program] * 8, config, compact, scheduler, batch_events=batch
+    )
+
+
+@pytest.fixture
+def program() -> Program:
+    return Program.from_lines(read_input_files(str(REPO_DIR / "gpu_trace.txt")) * 3)
+
+
+@pytest.mark.parametrize("compact,batch", [(True, False), (False, False), (True, True)])
+@pytest.mark.parametrize("scheduler", ["HEAP", "CALENDAR", "WHEEL"])
+def test_restore_midway(
+    program: Program, compact: bool, batch: bool, scheduler: str, tmp_path: Path
+) -> None:
+    """Test that a run resumed from a checkpoint ends like the full run."""
+    engine, gpus = detailed_simulation(program, compact, scheduler, batch)
+    for gpu in gpus:
+        gpu.start_gpu()
+    engine.run()
+    expected = finished_times(gpus)
+
+    path = str(tmp_path / "run.ckpt")
+    engine, gpus = detailed_simulation(program, compact, scheduler, batch)
+    for gpu in gpus:
+        gpu.start_gpu()
+    checkpointer = Checkpointer(path, engine, gpus)
+    engine.run_until(1000)
+    checkpointer.save()
+    engine.run_until(100000)
+    checkpointer.save()
+    checkpointer.close()
+    saved_events = engine.events_processed
+
+    engine, gpus = detailed_simulation(program, compact, scheduler, batch)
+    assert restore(path, engine, gpus) == 2
+    assert engine.events_processed == saved_events
+    engine.run()
+    assert finished_times(gpus) == expected
+
+    # the last record cut short: resumes from the first checkpoint
+    os.truncate(path, os.path.getsize(path) - 10)
+    engine, gpus = detailed_simulation(program, compact, scheduler, batch)
+    assert restore(path, engine, gpus) == 1
+    assert engine.current_time_ns < 1000
+    engine.run()
+    assert finished_times(gpus) == expected
+
+
+def test_partial_tail_record(program: Program, tmp_path: Path) -> None:
+    """Test that a tail record written in part is skipped, and overwritten when
+    the file is appended to.
+    """
+    path = str(tmp_path / "run.ckpt")
+    engine, gpus = detailed_simulation(program, True)
+    for gpu in gpus:
+        gpu.start_gpu()
+    checkpointer = Checkpointer(path, engine, gpus)
+    engine.run_until(1000)
+    checkpointer.save()
+    checkpointer.close()
+    size = os.path.getsize(path)
+    # its length reached the disk, not its data
+    with open(path, "ab") as file:
+        file.write(RECORD_HEADER.pack(16) + bytes(16))
+
+    engine, gpus = detailed_simulation(program, True)
+    assert restore(path, engine, gpus) == 1
+    engine.run_until(100000)
+    checkpointer = Checkpointer(path, engine, gpus, append=True)
+    checkpointer.save()
+    checkpointer.close()
+    assert os.path.getsize(path) == size + checkpointer.bytes_written
+    engine, gpus = detailed_simulation(program, True)
+    assert restore(path, engine, gpus) == 2
+    assert engine.current_time_ns >= 1000
+
+
+def test_periodic_checkpoints(program: Program, tmp_path: Path) -> None:
+    """Test that checkpointing doesn't change the run, and appends."""
+    engine, gpus = detailed_simulation(program, True)
+    for gpu in gpus:
+        gpu.start_gpu()
+    engine.run()
+    expected = finished_times(gpus)
+
+    path = str(tmp_path / "run.ckpt")
+    engine, gpus = detailed_simulation(program, True)
+    for gpu in gpus:
+        gpu.start_gpu()
+    checkpointer = run_with_checkpoints(engine, gpus, path, 20000)
+    assert checkpointer.checkpoints == 11
+    assert os.path.getsize(path) == checkpointer.bytes_written + 8
+    assert finished_times(gpus) == expected
+
+    # resumed at 217626, it appends the checkpoint at 220000
+    engine, gpus = detailed_simulation(program, True)
+    restore(path, engine, gpus)
+    size = os.path.getsize(path)
+    checkpointer = run_with_checkpoints(
+        engine, gpus, path, 20000, append=True, sync=True
+    )
+    assert checkpointer.checkpoints == 1
+    assert os.path.getsize(path) == size + checkpointer.bytes_written
+    assert finished_times(gpus) == expected
+
+
+def test_restore_pending_collective(program: Program, tmp_path: Path) -> None:
+    """Test a checkpoint taken while ranks wait for the others at a collective."""
+    late = Program.from_lines(
+        ["COMMUNICATION, ALL, 0, 10000000, SEND"]
+        + read_input_files(str(REPO_DIR / "gpu_trace.txt"))
+    )
+    config = read_system_config(str(REPO_DIR / "system_config.txt"))
+    programs = [program] * 6 + [late] * 2
+    engine, gpus = build_simulation(programs, config, True)
+    for gpu in gpus:
+        gpu.start_gpu()
+    engine.run()
+    expected = finished_times(gpus)
+
+    path = str(tmp_path / "run.ckpt")
+    engine, gpus = build_simulation(programs, config, True)
+    for gpu in gpus:
+        gpu.start_gpu()
+    checkpointer = Checkpointer(path, engine, gpus)
+    engine.run_until(1000)
+    assert gpus[0].network.pending_collectives() == 1
+    checkpointer.save()
+    checkpointer.close()
+
+    engine, gpus = build_simulation(programs, config, True)
+    restore(path, engine, gpus)
+    assert gpus[0].network.pending_collectives() == 1
+    engine.run()
+    assert finished_times(gpus) == expected
+
+
+def test_restore_errors(program: Program, tmp_path: Path) -> None:
+    """Test that a checkpoint only restores into the same simulation."""
+    path = str(tmp_path / "run.ckpt")
+    engine, gpus = detailed_simulation(program, True)
+    Checkpointer(path, engine, gpus).close()
+    other = Program.from_lines(read_input_files(str(REPO_DIR / "gpu_trace.txt")))
+    engine, gpus = detailed_simulation(other, True)
+    with pytest.raises(ValueError):
+        restore(path, engine, gpus)
+
+    config = read_system_config(str(REPO_DIR / "system_config.txt"))
+    config["NETWORK_MODEL"] = "FLOW"
+    engine, gpus = build_simulation([program] * 8, config, True)
+    with pytest.raises(ValueError):
+        Checkpointer(path, engine, gpus)
+
+    config["NETWORK_MODEL"] = "IDEAL"
+    config["COMPUTE_STREAMS"] = "2"
+    engine, gpus = build_simulation([program] * 8, config, True)
+    with pytest.raises(ValueError):
+        Checkpointer(path, engine, gpus)
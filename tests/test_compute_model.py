@@ -0,0 +1,91 @@
+import pytest
+from pathlib import Path
+from compute_model import (
+    ComputeCache,
+    ComputeModel,
+    FlatModel,
+    ProfileModel,
+    RooflineModel,
+    make_compute_model,
+    parse_intensities,
+)
+from main import build_simulation, read_input_files, read_system_config
+from program import Program
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def test_flat_model() -> None:
+    """Test FLOPs / (TFLOPS * 1e12) s in ns, rounded up without float errors."""
+    model = FlatModel(200)
+    assert model.duration_ns("EXECUTE", 100000000) == 500
+    assert model.duration_ns("EXECUTE", 100000001) == 501
+    assert FlatModel(3).duration_ns("EXECUTE", 3 * 10**9) == 10**6
+
+
+def test_compute_model_is_abstract() -> None:
+    """Test that a cost model must define the durations."""
+    with pytest.raises(TypeError):
+        ComputeModel()  # type: ignore[abstract]
+
+
+def test_roofline_model() -> None:
+    """Test the compute bound and the memory bound of the roofline."""
+    # 200 TFLOPS and 2000 GB/s: the ridge point is at 100 FLOPs per byte
+    model = RooflineModel(200, 2000, 10, {"MATMUL": 400})
+    assert model.duration_ns("MATMUL", 100000000) == 500  # compute bound
+    # memory bound: 1e7 bytes at 2000 bytes per ns
+    assert model.duration_ns("EXECUTE", 100000000) == 5000
+    assert parse_intensities("64, MATMUL=256") == (64.0, {"MATMUL": 256.0})
+
+
+def test_profile_model(tmp_path: Path) -> None:
+    """Test the lookup and interpolation of the measured kernels."""
+    profile = tmp_path / "profile.csv"
+    profile.write_text(
+        "operation,flops,duration_ns\nMATMUL,1000000,40\nMATMUL,3000000,80\n"
+    )
+    model = ProfileModel.from_csv(str(profile), FlatModel(200))
+    assert model.duration_ns("MATMUL", 1000000) == 40
+    assert model.duration_ns("MATMUL", 2000000) == 60
+    assert model.duration_ns("MATMUL", 6000000) == 160  # scaled from the last
+    assert model.duration_ns("MATMUL", 500000) == 20
+    assert model.duration_ns("EXECUTE", 1000000) == 5  # fallback
+
+
+def test_compute_cache() -> None:
+    """Test the hits and the LRU eviction of the cache."""
+    cache = ComputeCache(maxsize=2)
+    a100, h100 = FlatModel(300, "A100"), FlatModel(900, "H100")
+    assert cache.duration_ns(a100, "EXECUTE", 9000000) == 30
+    assert cache.duration_ns(h100, "EXECUTE", 9000000) == 10
+    assert cache.duration_ns(a100, "EXECUTE", 9000000) == 30
+    assert (cache.hits, cache.misses) == (1, 2)
+    cache.duration_ns(a100, "MATMUL", 9000000)  # evicts the H100 entry
+    assert len(cache) == 2
+    cache.duration_ns(a100, "EXECUTE", 9000000)
+    cache.duration_ns(h100, "EXECUTE", 9000000)
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def test_compute_model_config() -> None:
+    """Test the compute model keys of the system config."""
+    config = read_system_config(str(REPO_DIR / "system_config.txt"))
+    program = Program.from_lines(read_input_files(str(REPO_DIR / "gpu_trace.txt")))
+    config.update(COMPUTE_MODEL="ROOFLINE", HBM_BANDWIDTH="2000")
+    config.update(ARITHMETIC_INTENSITY="10")
+    engine, gpus = build_simulation([program] * 8, config, True)
+    for gpu in gpus:
+        gpu.start_gpu()
+    engine.run()
+    # memory bound: 10 times the flat durations 500, 250 and 150
+    assert [gpu.end_times[3] for gpu in gpus] == [9000] * 8
+    assert gpus[0].compute_cache is gpus[7].compute_cache
+    assert gpus[0].compute_cache.misses == 3
+
+    with pytest.raises(ValueError):
+        make_compute_model({"COMPUTE_MODEL": "ROOFLINE"}, 200)
+    with pytest.raises(ValueError):
+        make_compute_model({"COMPUTE_MODEL": "PROFILE"}, 200)
+    with pytest.raises(ValueError):
+        make_compute_model({"COMPUTE_MODEL": "QUEUEING"}, 200)
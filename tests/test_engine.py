@@ -1,5 +1,14 @@
 import pytest
-from simulation_engine import SimulationEngine, Event
+from typing import Dict, List, Tuple
+from simulation_engine import (
+    BatchHandler,
+    CompactSimulationEngine,
+    Event,
+    Handler,
+    SimulationEngine,
+    register_event_type,
+)
+from scheduler import make_scheduler
 
 
 @pytest.fixture
@@ -39,3 +48,296 @@ def test_event_execution_order(sim_engine: SimulationEngine) -> None:
     sim_engine.schedule_event(event2)
 
     assert sim_engine.event_queue[0] == event2  # The earliest event should be first
+
+
+def test_compact_event_ordering() -> None:
+    """Test that compact events are dispatched in timestamp order, FIFO on ties."""
+    engine = CompactSimulationEngine()
+    code: int = register_event_type("TEST_EVENT")
+    handled: List[Tuple[int, int, str]] = []
+
+    class Target:
+        def event_handlers(self) -> Dict[int, Handler]:
+            return {code: lambda ts, tid, payload: handled.append((ts, tid, payload))}
+
+    engine.register_object(3, Target())
+    engine.post(20, code, 3, "late")
+    engine.post(10, code, 3, "first")
+    engine.post(10, code, 3, "second")
+    assert len(engine.event_queue) == 3
+    engine.run()
+    assert handled == [(10, 3, "first"), (10, 3, "second"), (20, 3, "late")]
+    assert engine.current_time_ns == 20
+    assert engine.events_processed == 3
+
+
+def test_compact_engine_legacy_event() -> None:
+    """Test that Event objects are still delivered to handle_event()."""
+    engine = CompactSimulationEngine()
+    handled: List[Event] = []
+
+    class Target:
+        def handle_event(self, event: Event) -> None:
+            handled.append(event)
+
+    engine.register_object(1, Target())
+    event: Event = Event(5, "EVENT_1", 1, {})
+    engine.schedule_event(event)
+    engine.run()
+    assert handled == [event]
+
+
+def test_compact_engine_unknown_target() -> None:
+    """Test that an event without handler raises an error."""
+    engine = CompactSimulationEngine()
+    engine.post(5, register_event_type("TEST_EVENT"), 42, None)
+    with pytest.raises(ValueError):
+        engine.run()
+
+
+@pytest.mark.parametrize("scheduler", ["HEAP", "CALENDAR", "WHEEL"])
+def test_cancel_and_reschedule(scheduler: str) -> None:
+    """Test that cancelled events are skipped and rescheduled ones move."""
+    engine = CompactSimulationEngine(make_scheduler(scheduler))
+    code: int = register_event_type("TEST_EVENT")
+    handled: List[Tuple[int, str]] = []
+
+    class Target:
+        def event_handlers(self) -> Dict[int, Handler]:
+            return {code: lambda ts, tid, payload: handled.append((ts, payload))}
+
+    engine.register_object(0, Target())
+    engine.post(10, code, 0, "kept")
+    cancelled = engine.post(20, code, 0, "cancelled")
+    moved = engine.post(30, code, 0, "moved")
+    engine.cancel(cancelled)
+    moved = engine.reschedule(moved, 5)
+    assert engine.pending_events() == 2
+    engine.run()
+    assert handled == [(5, "moved"), (10, "kept")]
+    assert engine.events_processed == 2
+    assert engine.events_cancelled == 2
+    with pytest.raises(ValueError):
+        engine.cancel(moved)  # already processed
+
+
+@pytest.mark.parametrize("batching", [False, True])
+def test_cancel_dead_handles(batching: bool) -> None:
+    """Test that events already popped at the current time can't be cancelled,
+    and that cancelling twice counts once.
+    """
+    engine = CompactSimulationEngine(batching=batching)
+    code: int = register_event_type("TEST_EVENT")
+    handled: List[str] = []
+
+    def on_event(ts: int, tid: int, payload: str) -> None:
+        handled.append(payload)
+        if payload == "first":
+            with pytest.raises(ValueError):
+                engine.cancel(first)  # being processed
+            engine.cancel(second)
+
+    class Target:
+        def event_handlers(self) -> Dict[int, Handler]:
+            return {code: on_event}
+
+    engine.register_object(0, Target())
+    first = engine.post(0, code, 0, "first")
+    second = engine.post(0, code, 0, "second")
+    third = engine.post(0, code, 0, "third")
+    engine.cancel(third)
+    engine.cancel(third)
+    assert engine.events_cancelled == 1
+    engine.run()
+    assert handled == ["first"]
+    for handle in (first, second, third):
+        with pytest.raises(ValueError):
+            engine.cancel(handle)
+    assert engine.pending_events() == 0
+
+    # the same on the Event-object engine
+    events = SimulationEngine()
+
+    class EventTarget:
+        def handle_event(self, event: Event) -> None:
+            pass
+
+    events.register_object(1, EventTarget())
+    handles = [events.schedule_event(Event(0, "EVENT", 1, {})) for _ in range(2)]
+    events.run()
+    with pytest.raises(ValueError):
+        events.cancel(handles[1])
+    assert events.pending_events() == 0
+
+
+def test_compaction(sim_engine: SimulationEngine) -> None:
+    """Test that the tombstones are dropped once they outnumber the live events."""
+    handled: List[Event] = []
+
+    class Target:
+        def handle_event(self, event: Event) -> None:
+            handled.append(event)
+
+    sim_engine.register_object(1, Target())
+    sim_engine.compact_threshold = 8
+    handles = [sim_engine.schedule_event(Event(i, "EVENT", 1, {})) for i in range(20)]
+    for handle in handles[:11]:
+        sim_engine.cancel(handle)
+    # compacted when the tombstones became the majority
+    assert len(sim_engine.event_queue) == 9
+    assert sim_engine.pending_events() == 9
+    rescheduled = sim_engine.reschedule(handles[11], 100)
+    assert isinstance(rescheduled, Event) and rescheduled.timestamp == 100
+    sim_engine.run()
+    assert [event.timestamp for event in handled] == list(range(12, 20)) + [100]
+
+
+@pytest.mark.parametrize("scheduler", ["HEAP", "CALENDAR", "WHEEL"])
+def test_event_batching(scheduler: str) -> None:
+    """Test that batched events run in the order of the unbatched ones."""
+    first: int = register_event_type("FIRST")
+    second: int = register_event_type("SECOND")
+    runs: List[List[Tuple[int, int, int]]] = []
+    for batching in (False, True):
+        engine = CompactSimulationEngine(make_scheduler(scheduler), batching)
+        handled: List[Tuple[int, int, int]] = []
+
+        class Target:
+            def event_handlers(self) -> Dict[int, Handler]:
+                return {
+                    first: lambda ts, tid, payload: handled.append((ts, tid, payload)),
+                    second: on_second,
+                }
+
+        def on_second(ts: int, tid: int, payload: int) -> None:
+            handled.append((ts, tid, -payload))
+            if payload == 1:  # cancels a later event of its batch
+                engine.cancel(handles[4])
+                engine.post(ts, second, tid, 9)
+
+        for target_id in range(3):
+            engine.register_object(target_id, Target())
+        handles = [
+            engine.post(10, first, 0, 0),
+            engine.post(10, first, 1, 0),
+            engine.post(10, second, 2, 1),
+            engine.post(10, second, 0, 2),
+            engine.post(10, second, 1, 3),
+            engine.post(10, first, 2, 0),
+            engine.post(5, second, 1, 4),
+        ]
+        if batching:
+            # FIRST, SECOND, FIRST at 10 and the event at 5
+            assert len(engine.event_queue) == 4
+        assert engine.pending_events() == 7
+        engine.run()
+        assert engine.events_processed == 7
+        assert engine.events_cancelled == 1
+        runs.append(handled)
+    assert runs[0] == runs[1]
+    assert runs[1][-1] == (10, 2, -9)
+
+
+def test_batch_handler() -> None:
+    """Test that a batch handler gets the live events of its targets at once."""
+    engine = CompactSimulationEngine(batching=True)
+    code: int = register_event_type("TEST_EVENT")
+    batches: List[Tuple[str, int, List[int], List[str]]] = []
+    handled: List[Tuple[int, int, str]] = []
+
+    class Target:
+        def __init__(self, name: str) -> None:
+            self.name: str = name
+
+        def event_handlers(self) -> Dict[int, Handler]:
+            return {code: lambda ts, tid, payload: None}
+
+        def batch_handlers(self) -> Dict[int, BatchHandler]:
+            return {
+                code: lambda ts, tids, payloads: batches.append(
+                    (self.name, ts, tids, payloads)
+                )
+            }
+
+    class Single:
+        def event_handlers(self) -> Dict[int, Handler]:
+            return {code: lambda ts, tid, payload: handled.append((ts, tid, payload))}
+
+    # one object for the targets 0-3, its own for 4, none for 5
+    engine.register_objects(range(4), Target("shared"))
+    engine.register_object(4, Target("own"))
+    engine.register_object(5, Single())
+    handles = [engine.post(7, code, i, str(i)) for i in range(6)]
+    engine.post(8, code, 0, "later")
+    engine.cancel(handles[1])
+    handles[2] = engine.reschedule(handles[2], 8)
+    assert [entry[3] for entry in engine.live_events()] == [0, 3, 4, 5, 0, 2]
+    assert engine.run_until(8) == 8
+    assert batches == [("shared", 7, [0, 3], ["0", "3"]), ("own", 7, [4], ["4"])]
+    assert handled == [(7, 5, "5")]
+    engine.run()
+    assert batches[2:] == [("shared", 8, [0, 2], ["later", "2"])]
+    assert engine.events_processed == 6
+    assert engine.events_skipped == 2
+
+
+def test_batch_compaction_counts_events() -> None:
+    """Test that the compaction threshold counts the events in the batches, and
+    that the batches left empty are dropped.
+    """
+    engine = CompactSimulationEngine(batching=True)
+    code: int = register_event_type("TEST_EVENT")
+    engine.compact_threshold = 2
+    handled: List[int] = []
+
+    class Target:
+        def event_handlers(self) -> Dict[int, Handler]:
+            return {code: lambda ts, tid, payload: handled.append(payload)}
+
+    engine.register_object(0, Target())
+    first = [engine.post(10, code, 0, i) for i in range(4)]
+    second = [engine.post(20, code, 0, i) for i in range(4, 10)]
+    assert len(engine.event_queue) == 2 and engine.queued_events() == 10
+    # 4 tombstones of 10 events: no compaction
+    for handle in first[:3] + second[:1]:
+        engine.cancel(handle)
+    assert engine.queued_events() == 10
+    # 6 of 10: the batch at 10 keeps one event
+    for handle in second[1:3]:
+        engine.cancel(handle)
+    assert engine.queued_events() == 4 and engine.pending_events() == 4
+    # the batch at 10 is left empty, it's dropped and new events get a new batch
+    engine.compact_threshold = 0
+    for handle in [first[3]] + second[3:5]:
+        engine.cancel(handle)
+    assert len(engine.event_queue) == 1 and engine.queued_events() == 1
+    engine.post(10, code, 0, 10)
+    engine.run()
+    assert handled == [10, 9]
+    assert engine.queued_events() == 0
+
+
+def test_batch_compaction() -> None:
+    """Test that a compaction in a batch keeps the tombstones of its events."""
+    engine = CompactSimulationEngine(batching=True)
+    code: int = register_event_type("TEST_EVENT")
+    engine.compact_threshold = 2
+    handled: List[int] = []
+
+    def on_event(ts: int, tid: int, payload: int) -> None:
+        handled.append(payload)
+        if payload == 0:
+            for handle in handles[1:4] + later:
+                engine.cancel(handle)
+
+    class Target:
+        def event_handlers(self) -> Dict[int, Handler]:
+            return {code: on_event}
+
+    engine.register_object(0, Target())
+    handles = [engine.post(10, code, 0, i) for i in range(5)]
+    later = [engine.post(20, code, 0, i) for i in range(5, 8)]
+    engine.run()
+    assert handled == [0, 4]
+    assert engine.events_cancelled == 6
+    assert engine.pending_events() == 0
@@ -0,0 +1,94 @@
+import pytest
+from pathlib import Path
+from typing import Dict, List, Sequence
+from fleet import Fleet, parse_class
+from gpu import GPU
+from main import build_simulation, read_input_files, read_system_config
+from program import Program
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def run_fleet(**keys: str) -> Sequence[GPU]:
+    """Runs the sample trace on 8 GPUs with extra system config keys."""
+    config: Dict[str, str] = read_system_config(str(REPO_DIR / "system_config.txt"))
+    config.update(keys)
+    program = Program.from_lines(read_input_files(str(REPO_DIR / "gpu_trace.txt")))
+    engine, gpus = build_simulation([program] * 8, config, True)
+    for gpu in gpus:
+        gpu.start_gpu()
+    engine.run()
+    return gpus
+
+
+def test_fleet_assignment() -> None:
+    """Test the classes, the per-rank arrays and the assignment errors."""
+    config = {
+        "COMPUTE_CAPABILITY": "200",
+        "NETWORK_BANDWIDTH": "25",
+        "GPU_CLASS_H100": "COMPUTE_CAPABILITY=989, HBM_BANDWIDTH=3350",
+        "GPU_CLASS_A100": "COMPUTE_CAPABILITY=312, NETWORK_BANDWIDTH=12.5",
+        "GPU_ASSIGNMENT": "H100=0-1, A100=6-7",
+    }
+    fleet = Fleet(config, 8)
+    assert [fleet.gpu_class(i).name for i in (0, 3, 7)] == ["H100", "default", "A100"]
+    assert list(fleet.compute_tflops) == [989, 989, 200, 200, 200, 200, 312, 312]
+    assert list(fleet.bandwidth_GBps)[5:] == [25.0, 12.5, 12.5]
+    assert fleet.hbm_GBps[0] == 3350.0 and fleet.gpu_class(7).hbm_GBps is None
+    assert fleet.compute_model(0).gpu_type == "H100"
+    assert fleet.compute_model(0) is fleet.compute_model(1)
+    assert not fleet.uniform_bandwidth
+    assert Fleet({"COMPUTE_CAPABILITY": "1", "NETWORK_BANDWIDTH": "1"}, 4)
+    assert parse_class("compute_capability=1") == {"COMPUTE_CAPABILITY": "1"}
+
+    with pytest.raises(ValueError):
+        parse_class("TOPOLOGY=RING")
+    with pytest.raises(ValueError):
+        Fleet(dict(config, GPU_ASSIGNMENT="B200=0"), 8)
+    with pytest.raises(ValueError):
+        Fleet(dict(config, GPU_ASSIGNMENT="H100=0-8"), 8)
+    with pytest.raises(ValueError):
+        Fleet(dict(config, GPU_ASSIGNMENT="H100=0-3, A100=3"), 8)
+
+
+def test_fleet_compute() -> None:
+    """Test that each class runs its compute instructions at its own rate."""
+    gpus = run_fleet(GPU_CLASS_SLOW="COMPUTE_CAPABILITY=100", GPU_ASSIGNMENT="SLOW=6-7")
+    assert [gpu.end_times[1] for gpu in gpus] == [750] * 6 + [1500] * 2
+    assert gpus[0].compute_model is not gpus[7].compute_model
+    assert gpus[0].compute_cache is gpus[7].compute_cache
+
+
+def test_fleet_collective_straggler() -> None:
+    """Test that a GPU with a slow link slows the collectives of all the GPUs."""
+    uniform = run_fleet()
+    gpus = run_fleet(GPU_CLASS_SLOW="NETWORK_BANDWIDTH=5", GPU_ASSIGNMENT="SLOW=3")
+    comm = [gpu.end_times[2] - gpu.start_times[2] for gpu in gpus]
+    assert len(set(comm)) == 1
+    assert comm[0] > uniform[0].end_times[2] - uniform[0].start_times[2]
+
+    # the same times with an event per chunk
+    detailed = run_fleet(
+        GPU_CLASS_SLOW="NETWORK_BANDWIDTH=5",
+        GPU_ASSIGNMENT="SLOW=3",
+        COLLECTIVE_MODE="DETAILED",
+    )
+    assert [gpu.end_times[2] for gpu in detailed] == [gpu.end_times[2] for gpu in gpus]
+
+
+def test_fleet_flow_capacities() -> None:
+    """Test that the ports and ring links of the flow model get the GPU bandwidths."""
+    config = read_system_config(str(REPO_DIR / "system_config.txt"))
+    config.update(
+        NETWORK_MODEL="FLOW",
+        GPU_CLASS_SLOW="NETWORK_BANDWIDTH=5",
+        GPU_ASSIGNMENT="SLOW=3",
+    )
+    program = Program.from_lines(read_input_files(str(REPO_DIR / "gpu_trace.txt")))
+    _, gpus = build_simulation([program] * 8, config, True)
+    model = gpus[0].network.flow_model
+    assert model is not None
+    assert model.capacity[3] == model.capacity[8 + 3] == 5.0
+    assert model.capacity[0] == 25.0
+    # the ring links from and to GPU 3 are bound by its bandwidth
+    assert sorted(model.capacity[16:]).count(5.0) == 4
@@ -0,0 +1,126 @@
+import pytest
+from typing import List, Tuple
+from flow_model import FlowModel
+from gpu import GPU
+from network import Network
+from simulation_engine import CompactSimulationEngine
+
+
+def make_model(
+    num_gpus: int, topology: str
+) -> Tuple[CompactSimulationEngine, FlowModel]:
+    """A flow model with 10 bytes/ns links, registered as object num_gpus."""
+    engine = CompactSimulationEngine()
+    network = Network(num_gpus, num_gpus, 10, topology, engine, network_model="FLOW")
+    engine.register_object(network.object_id, network)
+    assert network.flow_model is not None
+    return engine, network.flow_model
+
+
+def test_fair_sharing() -> None:
+    """Test that flows sharing a port split its bandwidth and speed up when one ends."""
+    engine, model = make_model(4, "FULLY_CONNECTED")
+    ends: List[Tuple[str, int]] = []
+    first = model.start_flow(0, 0, 1, 1000, lambda ts: ends.append(("first", ts)))
+    assert first.rate == 10
+    engine.current_time_ns = 50
+    second = model.start_flow(50, 0, 2, 1000, lambda ts: ends.append(("second", ts)))
+    assert first.rate == second.rate == 5
+    engine.run()
+    # first: 500 bytes at 10 then 500 at 5, second: 500 at 5 then 500 at 10
+    assert ends == [("first", 150), ("second", 200)]
+    # the completion events of both flows were moved
+    assert model.rescheduled == 2
+    assert engine.events_cancelled == 2
+    assert model.active_flows == 0
+
+
+def test_max_min_rates() -> None:
+    """Test the progressive filling: a flow gets what the bottleneck flows leave."""
+    _, model = make_model(4, "FULLY_CONNECTED")
+    flows = [
+        model.start_flow(0, src, dst, 1000, lambda ts: None)
+        for src, dst in [(0, 1), (0, 2), (0, 3), (3, 1)]
+    ]
+    assert [flow.rate for flow in flows[:3]] == [10 / 3] * 3
+    assert flows[3].rate == pytest.approx(20 / 3)
+
+
+def test_incremental_update() -> None:
+    """Test that flows on other links keep their rate and completion event."""
+    _, model = make_model(4, "FULLY_CONNECTED")
+    model.start_flow(0, 0, 1, 1000, lambda ts: None)
+    other = model.start_flow(0, 2, 3, 1000, lambda ts: None)
+    handle = other.handle
+    model.start_flow(0, 0, 1, 1000, lambda ts: None)
+    assert other.handle is handle and other.rate == 10
+    assert model.rescheduled == 1
+
+
+def test_zero_rate() -> None:
+    """Test that a flow left without bandwidth has no completion event."""
+    engine, model = make_model(4, "FULLY_CONNECTED")
+    first = model.start_flow(0, 0, 1, 1000, lambda ts: None)
+    engine.current_time_ns = 50
+    model.capacity[4 + 1] = 0.0  # ingress port of GPU 1
+    second = model.start_flow(50, 2, 1, 1000, lambda ts: None)
+    assert first.rate == second.rate == 0
+    assert first.handle is None and second.handle is None
+    assert first.remaining == 500
+    assert engine.pending_events() == 0
+
+
+def test_routes() -> None:
+    """Test the routes along the ring and the tree."""
+    _, ring = make_model(4, "RING")
+    # egress port 0, backward ring link 3 -> 0 (from 0 to 3), ingress port 3
+    assert ring.route(0, 3) == [0, 12 + 0, 4 + 3]
+    assert ring.route(0, 2) == [0, 8, 9, 6]
+    _, tree = make_model(7, "TREE")
+    # 3 -> 1 -> 0 -> 2 -> 6
+    assert tree.route(3, 6) == [3, 14 + 3, 14 + 1, 21 + 2, 21 + 6, 7 + 6]
+
+
+def run_comm(
+    instructions: List[str],
+    num_gpus: int,
+    topology: str,
+    network_model: str,
+    chunk_size_bytes: int = 4096,
+) -> List[int]:
+    engine = CompactSimulationEngine()
+    network = Network(
+        num_gpus,
+        num_gpus,
+        25,
+        topology,
+        engine,
+        chunk_size_bytes,
+        network_model=network_model,
+    )
+    engine.register_object(network.object_id, network)
+    gpus = [GPU(i, instructions, 200, 4096, network, engine) for i in range(num_gpus)]
+    for gpu in gpus:
+        engine.register_object(gpu.gpu_id, gpu)
+        gpu.start_gpu()
+    engine.run()
+    return [ins.end_time_ns for gpu in gpus for ins in gpu.finished_instructions]
+
+
+@pytest.mark.parametrize("topology", ["RING", "FULLY_CONNECTED"])
+def test_uncontended_collective(topology: str) -> None:
+    """Test that a collective without contention takes the ideal time."""
+    instructions = ["COMMUNICATION, ALL, , 1000000, ALL_REDUCE"]
+    # the flows end on whole nanoseconds, like chunks of 4000 B at 25 GB/s
+    assert run_comm(instructions, 4, topology, "FLOW", 4000) == run_comm(
+        instructions, 4, topology, "IDEAL", 4000
+    )
+
+
+def test_contended_sends() -> None:
+    """Test that sends to the same GPU share its ingress port."""
+    instructions = ["COMMUNICATION, ALL, 0, 1000000, SEND"]
+    assert run_comm(instructions, 3, "FULLY_CONNECTED", "IDEAL") == [40000] * 3
+    # GPU 0 receives from 1 and 2 (and from itself, through its own ports),
+    # the whole message is one flow
+    assert run_comm(instructions, 3, "FULLY_CONNECTED", "FLOW") == [120000] * 3
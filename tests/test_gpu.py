@@ -1,10 +1,15 @@
 import heapq
 import math
 import pytest
-from gpu import GPU, Instruction
-from simulation_engine import SimulationEngine, Event
+from pathlib import Path
+from typing import List, Sequence, Tuple
+from gpu import GPU, Instruction, ReplicaGPU
+from main import initialize_simulation
+from simulation_engine import CompactSimulationEngine, SimulationEngine, Event
 from network import Network
 
+REPO_DIR = Path(__file__).resolve().parent.parent
+
 
 def test_gpu_vars(gpu_instance: GPU) -> None:
     """Test that the GPU ID is correctly assigned."""
@@ -134,3 +139,131 @@ def test_run_next_comm_and_done(gpu_instance: GPU) -> None:
     assert ins == comm_1
     assert ins.start_time_ns == 2500
     assert ins.end_time_ns == comm_finish_event.timestamp
+
+
+def test_compact_engine_run(network_instance: Network) -> None:
+    """Test that the compact engine produces the same results as the default one."""
+    instructions = [
+        "COMPUTE, ALL, , 100000000, EXECUTE",
+        "COMMUNICATION, ALL, , 1048576, ALL_REDUCE",
+        "COMPUTE, ALL, , 30000000, EXECUTE",
+    ]
+    results = []
+    for engine in (SimulationEngine(), CompactSimulationEngine()):
+        network = Network(2, 2, 25, "ring", engine)
+        engine.register_object(network.object_id, network)
+        gpus = [GPU(i, instructions, 200, 512, network, engine) for i in range(2)]
+        for gpu in gpus:
+            engine.register_object(gpu.gpu_id, gpu)
+            gpu.start_gpu()
+        engine.run()
+        results.append(
+            [
+                (ins.ins_type, ins.start_time_ns, ins.end_time_ns)
+                for gpu in gpus
+                for ins in gpu.finished_instructions
+            ]
+        )
+    assert results[0] == results[1]
+    assert ("COMPUTE", 500, 650) in results[1]
+
+
+def test_dependency_scheduling() -> None:
+    """Test that an instruction starts when its predecessors finish, on both engines."""
+    instructions = [
+        "COMPUTE, ALL, , 100000000, EXECUTE, fwd",
+        "COMMUNICATION, ALL, , 1048576, ALL_REDUCE, ar, fwd",
+        "COMPUTE, ALL, , 30000000, EXECUTE, bwd, ar",
+        "COMPUTE, ALL, , 50000000, EXECUTE, other",
+    ]
+    results = []
+    for engine in (SimulationEngine(), CompactSimulationEngine()):
+        network = Network(2, 2, 25, "ring", engine)
+        engine.register_object(network.object_id, network)
+        gpus = [GPU(i, instructions, 200, 512, network, engine) for i in range(2)]
+        for gpu in gpus:
+            engine.register_object(gpu.gpu_id, gpu)
+            gpu.start_gpu()
+        engine.run()
+        gpu = gpus[0]
+        # the all-reduce waits for fwd, and bwd for the all-reduce, while
+        # the independent instruction runs in between
+        assert gpu.start_times[1] == gpu.end_times[0] == 500
+        assert (gpu.start_times[3], gpu.end_times[3]) == (500, 750)
+        assert gpu.start_times[2] == gpu.end_times[1] > 750
+        assert len(gpu.finished_instructions) == 4
+        assert not any(gpu.in_degrees or [])
+        results.append(finished_times(gpus))
+    assert results[0] == results[1]
+
+
+def test_compute_streams(network_instance: Network) -> None:
+    """Test that several compute streams run independent instructions together."""
+    engine = CompactSimulationEngine()
+    instructions = ["COMPUTE, ALL, , 100000000, EXECUTE"] * 3
+    gpu = GPU(0, instructions, 200, 512, network_instance, engine, compute_streams=2)
+    engine.register_object(0, gpu)
+    gpu.start_gpu()
+    engine.run()
+    assert list(gpu.start_times) == [0, 0, 500]
+    assert list(gpu.end_times) == [500, 500, 1000]
+    assert gpu.running_compute == 0
+    with pytest.raises(ValueError):
+        GPU(1, instructions, 200, 512, network_instance, engine, comm_channels=0)
+
+
+def finished_times(gpus: Sequence[GPU]) -> List[List[Tuple[str, int, int]]]:
+    return [
+        [
+            (ins.operation, ins.start_time_ns, ins.end_time_ns)
+            for ins in gpu.finished_instructions
+        ]
+        for gpu in gpus
+    ]
+
+
+def test_symmetry_collapse(tmp_path: Path) -> None:
+    """Test that identical GPUs are simulated once with the same results."""
+    trace = str(REPO_DIR / "gpu_trace.txt")
+    results = []
+    for collapse in (False, True):
+        engine, gpus = initialize_simulation(
+            trace, str(REPO_DIR / "system_config.txt"), True, collapse=collapse
+        )
+        for gpu in gpus:
+            gpu.start_gpu()
+        engine.run()
+        results.append((finished_times(gpus), engine.events_processed))
+    assert results[0][0] == results[1][0]
+    assert results[1][1] == results[0][1] // 8
+    assert [gpu.representative.gpu_id for gpu in gpus] == [0] * 8
+    assert isinstance(gpus[5], ReplicaGPU)
+
+    # the GPUs interact in the flow model, no collapse
+    config = tmp_path / "system_config.txt"
+    config.write_text(
+        (REPO_DIR / "system_config.txt").read_text() + "\nNETWORK_MODEL: FLOW\n"
+    )
+    _, gpus = initialize_simulation(trace, str(config), True, collapse=True)
+    assert not any(isinstance(gpu, ReplicaGPU) for gpu in gpus)
+
+
+def test_symmetry_collapse_per_rank(tmp_path: Path) -> None:
+    """Test that ranks running the same slice of a per-rank trace form a class."""
+    trace = tmp_path / "trace.txt"
+    trace.write_text(
+        "COMPUTE, ALL, , 1000000, EXECUTE\nCOMPUTE, 0-3, , 2000000, EXECUTE\n"
+    )
+    engine, gpus = initialize_simulation(
+        str(trace),
+        str(REPO_DIR / "system_config.txt"),
+        True,
+        per_rank=True,
+        collapse=True,
+    )
+    for gpu in gpus:
+        gpu.start_gpu()
+    engine.run()
+    assert [gpu.representative.gpu_id for gpu in gpus] == [0] * 4 + [4] * 4
+    assert engine.events_processed == 3
+    assert [len(gpu.finished_instructions) for gpu in gpus] == [2] * 4 + [1] * 4
@@ -0,0 +1,172 @@
+import pytest
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+from checkpoint import Checkpointer, restore
+from conftest import finished_times
+from gpu import GPU, ReplicaGPU
+from gpu_array import GPUArray, GPUView, GPUViews
+from main import build_simulation, read_input_files, read_system_config
+from program import LogSlice, Program
+from simulation_engine import SimulationEngine
+from steady_state import run_steady_state
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def simulate(
+    programs: List[Program], array_backed: bool, **keys: str
+) -> Tuple[SimulationEngine, Sequence[GPU]]:
+    collapse = keys.pop("collapse", "") == "1"
+    config: Dict[str, str] = read_system_config(str(REPO_DIR / "system_config.txt"))
+    config.update(keys, NUM_GPUS=str(len(programs)))
+    engine, gpus = build_simulation(
+        programs, config, True, collapse=collapse, array_backed=array_backed
+    )
+    for gpu in gpus:
+        gpu.start_gpu()
+    engine.run()
+    return engine, gpus
+
+
+@pytest.mark.parametrize(
+    "keys",
+    [
+        {},
+        {"COLLECTIVE_MODE": "DETAILED", "COMMUNICATION_CHUNK_SIZE": "65536"},
+        {"NETWORK_MODEL": "FLOW", "COMPUTE_STREAMS": "2", "COMM_CHANNELS": "2"},
+        {
+            "GPU_CLASS_A100": "COMPUTE_CAPABILITY=312",
+            "GPU_ASSIGNMENT": "A100=2-3, A100=6",
+        },
+        {"collapse": "1"},
+    ],
+)
+def test_array_backed_results(keys: Dict[str, str]) -> None:
+    """Test that array-backed GPUs run like GPU objects."""
+    step = read_input_files(str(REPO_DIR / "gpu_trace.txt"))
+    program = Program.from_lines(step * 3)
+    expected_engine, expected = simulate([program] * 8, False, **keys)
+    engine, gpus = simulate([program] * 8, True, **keys)
+
+    assert all(isinstance(gpu, GPUView) for gpu in gpus)
+    assert finished_times(gpus) == finished_times(expected)
+    assert engine.events_processed == expected_engine.events_processed
+    assert [gpu.representative.gpu_id for gpu in gpus] == [
+        gpu.representative.gpu_id for gpu in expected
+    ]
+    arrays = {id(engine.objects[gpu.representative.gpu_id]) for gpu in gpus}
+    assert len(arrays) == (2 if "GPU_ASSIGNMENT" in keys else 1)
+
+
+def test_gpu_view() -> None:
+    """Test the attributes of a view, they read and write its GPUArray."""
+    step = read_input_files(str(REPO_DIR / "gpu_trace.txt"))
+    program = Program.from_lines(step * 2)
+    engine, gpus = simulate([program] * 4, True)
+    gpu = gpus[2]
+    assert isinstance(gpu, GPUView)
+    gpu_array = gpu.gpu_array
+    assert isinstance(gpu_array, GPUArray) and len(gpu_array) == 4
+    assert gpu.gpu_id == 2 and gpu.slot == 2 and gpu.representative is gpu
+    assert gpu.program is program and gpu.network is gpu_array.network
+    assert gpu.compute_streams == 1 and gpu.in_degrees is None
+
+    assert len(gpu.start_times) == len(program)
+    assert gpu.start_times is gpu.start_times
+    assert list(gpu.end_times) == list(gpu_array.end_times[16:24])
+    assert len(gpu.finished_instructions) == len(program)
+    assert str(gpu.finished_instructions[0]) == str(gpu.instruction(0))
+    assert gpu.finished_instructions[0].end_time_ns == gpu.end_times[0]
+    assert gpu.compute_queue.pc == len(program.compute_indices)
+    assert len(gpu.comm_queue) == 0 and gpu.running_comm == 0
+
+    gpu.running_compute = 1
+    gpu.comm_queue.pc = 1
+    gpu.start_times[3] = 42
+    assert gpu_array.running_compute[2] == 1 and gpu_array.comm_pc[2] == 1
+    assert gpu_array.start_times[19] == 42
+    log = gpu.finished_instructions.indices
+    assert isinstance(log, LogSlice)
+    del log[2:]
+    log.append(7)
+    assert list(log) == list(gpu_array.finished[16:18]) + [7]
+    assert len(gpus[3].finished_instructions) == len(program)
+    with pytest.raises(KeyError):
+        gpu_array.view(8)
+
+
+def test_lazy_views() -> None:
+    """Test that the GPUViews are created when indexed, and that the slots are
+    mapped for the GPUs of the class only.
+    """
+    step = read_input_files(str(REPO_DIR / "gpu_trace.txt"))
+    first = Program.from_lines(step)
+    second = Program.from_lines(step * 2)
+    _, gpus = simulate([first, second] * 3, True)
+    assert isinstance(gpus, GPUViews) and len(gpus) == 6
+    gpu = gpus[3]
+    assert isinstance(gpu, GPUView) and gpu.gpu_id == 3 and gpus[3] is not gpu
+    gpu_array = gpu.gpu_array
+    assert gpu_array.slot_of == {1: 0, 3: 1, 5: 2}
+    assert [gpu.gpu_id for gpu in gpus[1::2]] == [1, 3, 5]
+    assert [gpu.gpu_id for gpu in gpu_array.views()] == [1, 3, 5]
+    assert gpu_array.view(5).slot == 2
+    with pytest.raises(KeyError):
+        gpu_array.view(2)
+
+
+def test_array_backed_fallbacks() -> None:
+    """Test that programs with dependencies keep GPU objects, and replicas."""
+    step = read_input_files(str(REPO_DIR / "gpu_trace.txt"))
+    plain = Program.from_lines(step)
+    dependent = Program.from_lines(
+        [
+            "COMPUTE, ALL, , 1000000, EXECUTE, a",
+            "COMPUTE, ALL, , 2000000, EXECUTE, b, a",
+        ]
+    )
+    programs = [plain] * 3 + [dependent] * 3
+    expected = simulate(programs, False, collapse="1")[1]
+    engine, gpus = simulate(programs, True, collapse="1")
+    assert [type(gpu) for gpu in gpus] == [GPUView] * 3 + [GPU] + [ReplicaGPU] * 2
+    assert finished_times(gpus) == finished_times(expected)
+    # the replicas of a GPUArray have the times of its first GPU
+    assert gpus[1].representative.gpu_id == 0
+    assert gpus[1].end_times is not gpus[0].end_times
+    assert list(gpus[1].end_times) == list(gpus[0].end_times)
+
+    # the Event-object engine has no GPUArray
+    config = read_system_config(str(REPO_DIR / "system_config.txt"))
+    _, gpus = build_simulation([plain] * 8, config, False, array_backed=True)
+    assert not any(isinstance(gpu, GPUView) for gpu in gpus)
+
+
+def test_array_backed_checkpoint_and_steady_state(tmp_path: Path) -> None:
+    """Test a restored run and the steady-state extrapolation of array GPUs."""
+    step = read_input_files(str(REPO_DIR / "gpu_trace.txt"))
+    program = Program.from_lines(step * 20)
+    config = read_system_config(str(REPO_DIR / "system_config.txt"))
+    config.update(COLLECTIVE_MODE="DETAILED", COMMUNICATION_CHUNK_SIZE="65536")
+    _, expected = simulate([program] * 8, False, **config)
+
+    path = str(tmp_path / "run.ckpt")
+    engine, gpus = build_simulation([program] * 8, config, True, array_backed=True)
+    for gpu in gpus:
+        gpu.start_gpu()
+    checkpointer = Checkpointer(path, engine, gpus)
+    engine.run_until(200000)
+    checkpointer.save()
+    checkpointer.close()
+    engine, gpus = build_simulation([program] * 8, config, True, array_backed=True)
+    assert restore(path, engine, gpus) == 1
+    engine.run()
+    assert finished_times(gpus) == finished_times(expected)
+
+    engine, gpus = build_simulation([program] * 8, config, True, array_backed=True)
+    for gpu in gpus:
+        gpu.start_gpu()
+    steady = run_steady_state(engine, gpus)
+    assert steady.simulated_iterations < steady.iterations
+    assert [sorted(times) for times in finished_times(gpus)] == [
+        sorted(times) for times in finished_times(expected)
+    ]
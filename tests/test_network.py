@@ -1,6 +1,14 @@
 import pytest
+from pathlib import Path
+from typing import List, Tuple
+from collectives import Phase, chunk_times, collective_phases, phase_time
+from gpu import GPU
+from main import build_simulation, read_input_files, read_system_config
 from network import Network
-from simulation_engine import SimulationEngine, Event
+from program import Program
+from simulation_engine import CompactSimulationEngine, SimulationEngine, Event
+
+REPO_DIR = Path(__file__).resolve().parent.parent
 
 
 def test_network_vars(network_instance: Network) -> None:
@@ -21,3 +29,209 @@ def test_communication_event(network_instance: Network) -> None:
 
     assert len(network_instance.engine.event_queue) == 1
 """
+
+
+def run_collective(
+    operation: str, topology: str, num_gpus: int, chunk: int, mode: str
+) -> Tuple[int, int]:
+    """Runs one collective on every GPU, returns (end time, events processed)."""
+    engine = CompactSimulationEngine()
+    network = Network(
+        num_gpus, num_gpus, 25, topology, engine, chunk, 3, collective_mode=mode
+    )
+    engine.register_object(network.object_id, network)
+    instructions = [f"COMMUNICATION, ALL, , 1000000, {operation}"]
+    gpus = [GPU(i, instructions, 200, chunk, network, engine) for i in range(num_gpus)]
+    for gpu in gpus:
+        engine.register_object(gpu.gpu_id, gpu)
+        gpu.start_gpu()
+    engine.run()
+    end_times = {gpu.finished_instructions[0].end_time_ns for gpu in gpus}
+    assert len(end_times) == 1
+    return end_times.pop(), engine.events_processed
+
+
+@pytest.mark.parametrize("topology", ["RING", "TREE", "FULLY_CONNECTED"])
+@pytest.mark.parametrize(
+    "operation", ["ALL_REDUCE", "ALL_GATHER", "REDUCE_SCATTER", "BROADCAST", "SEND"]
+)
+@pytest.mark.parametrize("chunk", [0, 4096, 30000])
+def test_analytic_matches_detailed(topology: str, operation: str, chunk: int) -> None:
+    """Test that the closed-form collective times equal the per-chunk simulation."""
+    analytic, analytic_events = run_collective(
+        operation, topology, 6, chunk, "ANALYTIC"
+    )
+    detailed, detailed_events = run_collective(
+        operation, topology, 6, chunk, "DETAILED"
+    )
+    assert analytic == detailed
+    assert analytic_events == 12  # COMM_START and COMM_DONE of each GPU
+    if chunk and operation != "SEND":
+        assert detailed_events > analytic_events
+
+
+def test_collective_topologies() -> None:
+    """Test that the topology and the chunking change the collective time."""
+    times = {
+        topology: run_collective("ALL_REDUCE", topology, 8, 0, "ANALYTIC")[0]
+        for topology in ("RING", "TREE", "FULLY_CONNECTED")
+    }
+    assert len(set(times.values())) == 3
+    # ring all-reduce: 2 * 7 steps of 1/8 of the buffer
+    ring = phase_time(Phase(7, 125000, 1, True), 0, 25, 3)
+    assert times["RING"] == 2 * ring == 2 * 7 * 5003
+
+    # chunks are pipelined along the broadcast chain
+    whole, _ = run_collective("BROADCAST", "RING", 8, 0, "ANALYTIC")
+    chunked, _ = run_collective("BROADCAST", "RING", 8, 10000, "ANALYTIC")
+    assert chunked < whole / 4
+
+
+def test_chunk_times_not_rounded() -> None:
+    """Test that the chunk times are added before rounding to nanoseconds."""
+    # 512 B at 25 GB/s take 20.48 ns, not 21
+    step = Phase(1, 100 * 512, 1, True)
+    assert chunk_times(step, 512, 25, 0) == (100, 20480, 20480)
+    assert phase_time(step, 512, 25, 0) == 2048
+    assert phase_time(Phase(3, 100 * 512, 1, False), 512, 25, 0) == 2089
+
+
+def test_collective_phases_errors() -> None:
+    """Test the unknown topologies and collective modes."""
+    with pytest.raises(ValueError):
+        collective_phases("ALL_REDUCE", "MESH", 8, 1024)
+    with pytest.raises(ValueError):
+        Network(8, 8, 25, "RING", SimulationEngine(), collective_mode="EXACT")
+
+
+def run_programs(
+    programs: List[List[str]],
+    mode: str = "ANALYTIC",
+    model: str = "IDEAL",
+    batching: bool = False,
+) -> Tuple[Network, List[GPU]]:
+    """Runs GPU i with programs[i] on a ring."""
+    engine = CompactSimulationEngine(batching=batching)
+    network = Network(
+        len(programs),
+        len(programs),
+        25,
+        "RING",
+        engine,
+        4096,
+        collective_mode=mode,
+        network_model=model,
+    )
+    engine.register_object(network.object_id, network)
+    gpus = [
+        GPU(i, lines, 200, 4096, network, engine) for i, lines in enumerate(programs)
+    ]
+    for gpu in gpus:
+        engine.register_object(gpu.gpu_id, gpu)
+        gpu.start_gpu()
+    engine.run()
+    return network, gpus
+
+
+@pytest.mark.parametrize("mode", ["ANALYTIC", "DETAILED"])
+@pytest.mark.parametrize("model", ["IDEAL", "FLOW"])
+def test_collective_rendezvous(mode: str, model: str) -> None:
+    """Test that a collective starts when the last rank issued it."""
+    late = [
+        "COMMUNICATION, ALL, 0, 1000000, SEND",
+        "COMMUNICATION, ALL, , 100000, ALL_REDUCE",
+    ]
+    on_time = ["COMMUNICATION, ALL, , 100000, ALL_REDUCE"]
+    network, gpus = run_programs([on_time, late, on_time, on_time], mode, model)
+    send_end = gpus[1].end_times[0]
+    assert gpus[1].start_times[1] == send_end
+    ends = {gpu.end_times[-1] for gpu in gpus}
+    assert len(ends) == 1
+    # the all-reduce takes as long as when all the ranks arrive at once
+    _, alone = run_programs([on_time] * 4, mode, model)
+    assert ends.pop() == send_end + alone[0].end_times[0]
+    assert network.pending_collectives() == 0
+
+
+def test_collective_groups() -> None:
+    """Test the collectives of groups of ranks, matched in issue order."""
+    pair = ["COMMUNICATION, ALL, 0-1, 100000, ALL_REDUCE"] * 2
+    other = ["COMMUNICATION, ALL, 2-3, 100000, ALL_REDUCE"]
+    network, gpus = run_programs([pair, pair, other, other + ["COMPUTE, ALL, , 1, X"]])
+    _, alone = run_programs([["COMMUNICATION, ALL, , 100000, ALL_REDUCE"]] * 2)
+    assert list(gpus[0].end_times) == [alone[0].end_times[0], 2 * alone[0].end_times[0]]
+    assert gpus[2].end_times[0] == alone[0].end_times[0]
+    assert network.pending_collectives() == 0
+
+    # a rank waiting for a collective the others never issue
+    network, gpus = run_programs([pair, ["COMPUTE, ALL, , 1, X"], other, other])
+    assert network.pending_collectives() == 1
+    assert len(gpus[0].finished_instructions) == 0
+    with pytest.raises(ValueError):
+        run_programs([["COMMUNICATION, ALL, 1-2, 100000, ALL_REDUCE"]] * 4)
+    with pytest.raises(ValueError):
+        run_programs([["COMMUNICATION, ALL, 2-9, 100000, ALL_REDUCE"]] * 4)
+
+
+def test_collective_weights_with_collapse() -> None:
+    """Test that a simulated GPU arrives for the ranks it represents."""
+    config = read_system_config(str(REPO_DIR / "system_config.txt"))
+    lines = read_input_files(str(REPO_DIR / "gpu_trace.txt"))
+    fast, slow = Program.from_lines(lines), Program.from_lines(lines)
+    slow.append("COMMUNICATION", "ALL", "", 1048576, "ALL_REDUCE")
+    fast.append("COMPUTE", "ALL", "", 200000000000, "EXECUTE")
+    fast.append("COMMUNICATION", "ALL", "", 1048576, "ALL_REDUCE")
+    programs = [fast] * 5 + [slow] * 3
+    results = []
+    for collapse in (False, True):
+        engine, gpus = build_simulation(programs, config, True, collapse=collapse)
+        for gpu in gpus:
+            gpu.start_gpu()
+        engine.run()
+        results.append([list(gpu.end_times) for gpu in gpus])
+        network = gpus[0].network
+        assert network.pending_collectives() == 0
+    assert results[0] == results[1]
+    assert list(network.representatives) == [0] * 5 + [5] * 3
+    # the second all-reduce waits for the compute of the fast program
+    assert results[1][7][4] == results[1][0][5]
+
+
+@pytest.mark.parametrize("mode", ["ANALYTIC", "DETAILED"])
+@pytest.mark.parametrize("model", ["IDEAL", "FLOW"])
+def test_batched_events(mode: str, model: str) -> None:
+    """Test that batching the events changes none of the results."""
+    config = read_system_config(str(REPO_DIR / "system_config.txt"))
+    config.update(COLLECTIVE_MODE=mode, NETWORK_MODEL=model, COMM_CHANNELS="2")
+    lines = read_input_files(str(REPO_DIR / "gpu_trace.txt"))
+    program = Program.from_lines(lines * 3)
+    program.append("COMMUNICATION", "ALL", "", 65536, "ALL_GATHER")
+    program.append("COMMUNICATION", "ALL", "1", 65536, "SEND")
+    results = []
+    for batch_events in (False, True):
+        engine, gpus = build_simulation(
+            [program] * 8, config, True, batch_events=batch_events
+        )
+        for gpu in gpus:
+            gpu.start_gpu()
+        engine.run()
+        results.append(
+            (
+                engine.events_processed,
+                [list(gpu.finished_instructions.indices) for gpu in gpus],
+                [list(gpu.end_times) for gpu in gpus],
+            )
+        )
+    assert results[0] == results[1]
+
+    # late ranks and groups, the arrivals are batched with the other events
+    pair = ["COMMUNICATION, ALL, 0-1, 100000, ALL_REDUCE"] * 2
+    other = ["COMMUNICATION, ALL, 2-3, 100000, ALL_REDUCE"]
+    late = ["COMMUNICATION, ALL, 0, 1000000, SEND"] + pair
+    programs = [pair, late, other, other]
+    expected = run_programs(programs, mode, model)[1]
+    network, gpus = run_programs(programs, mode, model, True)
+    assert [list(gpu.end_times) for gpu in gpus] == [
+        list(gpu.end_times) for gpu in expected
+    ]
+    assert network.pending_collectives() == 0
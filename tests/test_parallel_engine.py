@@ -0,0 +1,179 @@
+import pytest
+from pathlib import Path
+from typing import Optional
+from gpu import COMPUTE_DONE
+from main import build_simulation, read_input_files, read_system_config
+from network import COLLECTIVE_ARRIVE
+from parallel_engine import (
+    PartitionEngine,
+    network_lookahead,
+    partition,
+    run_parallel,
+    run_sequential,
+    segment_id,
+)
+from program import Program
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def test_partition() -> None:
+    """Test that the GPUs are split in blocks of consecutive ids."""
+    assert partition(8, 3) == [range(0, 2), range(2, 5), range(5, 8)]
+    assert partition(2, 4) == [range(0, 1), range(1, 2)]
+    assert partition(8, 1) == [range(0, 8)]
+
+
+@pytest.mark.parametrize("num_lps", [2, 3])
+@pytest.mark.parametrize("lookahead", [None, 500])
+@pytest.mark.parametrize("collapse", [False, True])
+@pytest.mark.parametrize("dependencies", [False, True])
+def test_parallel_matches_sequential(
+    num_lps: int, lookahead: Optional[int], collapse: bool, dependencies: bool
+) -> None:
+    """Test that the partitioned run gives the results of the sequential one."""
+    config = read_system_config(str(REPO_DIR / "system_config.txt"))
+    lines = read_input_files(str(REPO_DIR / "gpu_trace.txt"))
+    # two kinds of GPUs, the last ones run a longer compute, and join the
+    # all-reduce later with dependencies
+    programs = [Program.from_lines(lines), Program.from_lines(lines)]
+    programs[1].append("COMPUTE", "ALL", "", 900000, "MATMUL")
+    if dependencies:
+        programs = [
+            Program.from_lines(
+                [
+                    f"COMPUTE, ALL, , {flops}, EXECUTE, fwd",
+                    "COMMUNICATION, ALL, , 1048576, ALL_REDUCE, ar, fwd",
+                    "COMPUTE, ALL, , 30000000, EXECUTE, bwd, ar",
+                ]
+            )
+            for flops in (100000000, 300000000)
+        ]
+    per_gpu = [programs[gpu_id // 6] for gpu_id in range(8)]
+
+    expected = run_sequential(per_gpu, config, collapse=collapse)
+    result = run_parallel(
+        per_gpu, config, num_lps, collapse=collapse, lookahead_ns=lookahead
+    )
+    assert result.num_lps == num_lps
+    assert result.finished == expected.finished
+    assert result.end_time_ns == expected.end_time_ns
+    # plus the arrivals at the all-reduce sent to the other LPs
+    if not collapse:
+        # with collapse, every LP simulates a GPU of each class it has
+        assert result.events_processed > expected.events_processed
+    # the GPUs interact through the all-reduce
+    assert result.windows > 1
+    if dependencies:
+        # the bwd compute waits for the slowest GPUs at the all-reduce
+        assert len({log[2][1] for log in result.finished.values()}) == 1
+
+
+def test_lookahead() -> None:
+    """Test that the lookahead is the shortest collective of the programs."""
+    config = read_system_config(str(REPO_DIR / "system_config.txt"))
+    program = Program.from_lines(read_input_files(str(REPO_DIR / "gpu_trace.txt")))
+    assert network_lookahead(config, [program]) == 73402
+    assert (
+        network_lookahead(config, [Program.from_lines(["COMPUTE, ALL, , 1, X"])])
+        is None
+    )
+    config["COLLECTIVE_MODE"] = "DETAILED"
+    assert network_lookahead(config, [program]) == 0
+
+
+def test_flow_model_runs_sequentially() -> None:
+    """Test the fallback when the GPUs share the links at any time."""
+    config = read_system_config(str(REPO_DIR / "system_config.txt"))
+    config["NETWORK_MODEL"] = "FLOW"
+    program = Program.from_lines(read_input_files(str(REPO_DIR / "gpu_trace.txt")))
+    result = run_parallel([program] * 8, config, 4)
+    assert result.num_lps == 1
+    assert result.finished == run_sequential([program] * 8, config).finished
+
+
+def test_partition_engine_outbox() -> None:
+    """Test that events for other LPs are sent, and never inside the window."""
+    engine = PartitionEngine(0, [0, 0, 1, 1])
+    engine.window_end_ns = 100
+    engine.post(50, COMPUTE_DONE, 1, 3)
+    engine.post(100, COMPUTE_DONE, 2, 4)
+    assert engine.pending_events() == 1
+    assert engine.outbox == [(100, 1, 0, COMPUTE_DONE, 2, 4)]
+    with pytest.raises(RuntimeError):
+        engine.post(99, COMPUTE_DONE, 3, 5)
+
+
+def test_partition_engine_causes() -> None:
+    """Test that the events of a time are ordered by the times of their causes,
+    and that delivered events keep theirs.
+    """
+    engine = PartitionEngine(0, [0, 1])
+    engine.current_time_ns = 50
+    engine.post(100, COMPUTE_DONE, 0, "late")
+    engine.post_caused(20, 100, COMPUTE_DONE, 0, "early")
+    engine.post_caused(10, 100, COMPUTE_DONE, 1, None)
+    engine.deliver([(100, engine.outbox[0][1], 1, COMPUTE_DONE, 0, "first")])
+    assert [event[4] for event in sorted(engine.event_queue)] == [
+        "first",
+        "early",
+        "late",
+    ]
+
+
+@pytest.mark.parametrize("num_lps", [2, 3])
+def test_parallel_same_order(num_lps: int) -> None:
+    """Test that the GPUs log their instructions in the sequential order when
+    a collective released from another LP ends with a local compute.
+    """
+    config = read_system_config(str(REPO_DIR / "system_config.txt"))
+    config["NUM_GPUS"] = "4"
+    lookahead = 62916
+    # the all-reduce of the fast GPUs ends at 1062916, when the last ones are
+    # told of its release, and with x2 posted at 1001000
+    fast = Program.from_lines(
+        [
+            "COMPUTE, ALL, , 20000000, EXECUTE, fwd",
+            "COMMUNICATION, ALL, , 1048576, ALL_REDUCE, ar, fwd",
+            f"COMPUTE, ALL, , {1000900 * 200000}, EXECUTE, x1",
+            f"COMPUTE, ALL, , {(lookahead - 1000) * 200000}, EXECUTE, x2",
+        ]
+    )
+    slow = Program.from_lines(
+        [
+            f"COMPUTE, ALL, , {1000000 * 200000}, EXECUTE, fwd",
+            "COMMUNICATION, ALL, , 1048576, ALL_REDUCE, ar, fwd",
+        ]
+    )
+    programs = [fast, fast, slow, slow]
+    assert network_lookahead(config, programs) == lookahead
+
+    expected = run_sequential(programs, config)
+    result = run_parallel(programs, config, num_lps)
+    assert result.windows > 1
+    assert result.finished == expected.finished
+    assert [log[1:] for log in expected.finished[0]] == [
+        (0, 100),
+        (100, 1001000),
+        (100, 1062916),
+        (1001000, 1062916),
+    ]
+
+
+def test_arrivals_go_to_network_segments() -> None:
+    """Test that the arrivals are sent to the network segment of each other LP,
+    not through the ids of their GPUs.
+    """
+    # 4 GPUs in 2 LPs, the network (id 4) and the segments (ids 5 and 6)
+    engine = PartitionEngine(0, [0, 0, 1, 1, 0, 0, 1])
+    assert (segment_id(4, 0), segment_id(4, 1)) == (5, 6)
+    engine.post(100, COLLECTIVE_ARRIVE, segment_id(4, 1), None)
+    engine.post(100, COLLECTIVE_ARRIVE, 4, None)
+    assert engine.outbox == [(100, 0, 0, COLLECTIVE_ARRIVE, 6, None)]
+    assert engine.pending_events() == 1
+
+    config = read_system_config(str(REPO_DIR / "system_config.txt"))
+    program = Program.from_lines(read_input_files(str(REPO_DIR / "gpu_trace.txt")))
+    _, gpus = build_simulation([program] * 8, config, True)
+    assert COLLECTIVE_ARRIVE not in gpus[0].event_handlers()
+    assert COLLECTIVE_ARRIVE in gpus[0].network.event_handlers()
@@ -0,0 +1,160 @@
+import pytest
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple
+from gpu import GPU
+from main import build_simulation, read_input_files, read_system_config
+from profiler import Profiler
+from program import Program
+from scheduler import make_scheduler
+from simulation_engine import (
+    CompactSimulationEngine,
+    Event,
+    Handler,
+    SimulationEngine,
+    register_event_type,
+)
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def simulate(
+    compact_events: bool, profiler: Any = None, batch_events: bool = False
+) -> Tuple[SimulationEngine, Sequence[GPU]]:
+    config: Dict[str, str] = read_system_config(str(REPO_DIR / "system_config.txt"))
+    program = Program.from_lines(read_input_files(str(REPO_DIR / "gpu_trace.txt")) * 3)
+    engine, gpus = build_simulation(
+        [program] * 8, config, compact_events, batch_events=batch_events
+    )
+    if profiler is not None:
+        profiler.attach(engine)
+    for gpu in gpus:
+        gpu.start_gpu()
+    engine.run()
+    return engine, gpus
+
+
+@pytest.mark.parametrize("compact_events", [True, False])
+def test_profiled_run(compact_events: bool) -> None:
+    """Test that a profiled run has the same results, and counts every event."""
+    expected_engine, expected = simulate(compact_events)
+    profiler = Profiler()
+    engine, gpus = simulate(compact_events, profiler)
+
+    assert [list(gpu.end_times) for gpu in gpus] == [
+        list(gpu.end_times) for gpu in expected
+    ]
+    assert engine.events_processed == expected_engine.events_processed
+    assert profiler.events_processed == engine.events_processed
+    stats = {(row.event_type, row.handler): row for row in profiler.stats()}
+    assert sum(row.events for row in stats.values()) == engine.events_processed
+    if compact_events:
+        assert stats["COMPUTE_DONE", "GPU.on_compute_done"].events == 8 * 9
+        assert stats["COMM_START", "Network.on_comm_start"].target_class == "Network"
+    else:
+        assert stats["COMPUTE_DONE", "GPU.handle_event"].events == 8 * 9
+    assert all(row.total_s >= 0 for row in stats.values())
+    assert "GPU.on_compute_done" in profiler.report() or not compact_events
+
+    # detached, the engine runs its own loop again
+    profiler.detach(engine)
+    assert engine.profiler is None
+
+
+@pytest.mark.parametrize("scheduler", ["HEAP", "CALENDAR"])
+def test_profiler_hooks_and_samples(scheduler: str) -> None:
+    """Test the hooks, the samples, the skipped events and run_until."""
+    engine = CompactSimulationEngine(make_scheduler(scheduler))
+    code: int = register_event_type("TEST_EVENT")
+    handled: List[int] = []
+    calls: List[Tuple[str, int, str, int]] = []
+
+    class Target:
+        def event_handlers(self) -> Dict[int, Handler]:
+            return {code: lambda ts, tid, payload: handled.append(ts)}
+
+    engine.register_object(0, Target())
+    handles = [engine.post(ts, code, 0, None) for ts in range(0, 1000, 10)]
+    engine.cancel(handles[50])
+    engine.schedule_event(Event(995, "OTHER", 0, {}))
+    profiler = Profiler(sample_interval_ns=100).attach(engine)
+    profiler.before_dispatch.append(
+        lambda ts, event_type, tid, payload: calls.append(
+            ("before", ts, event_type, tid)
+        )
+    )
+    profiler.after_dispatch.append(
+        lambda ts, event_type, tid, payload: calls.append(
+            ("after", ts, event_type, tid)
+        )
+    )
+
+    assert engine.run_until(500) == 500
+    assert handled == list(range(0, 500, 10))
+    assert calls[:2] == [("before", 0, "TEST_EVENT", 0), ("after", 0, "TEST_EVENT", 0)]
+    with pytest.raises(AttributeError):  # Target has no handle_event()
+        engine.run_until()
+    assert handled == list(range(0, 1000, 10))[:50] + list(range(510, 1000, 10))
+    assert calls[-1] == ("before", 995, "OTHER", 0)
+    assert profiler.events_skipped == 1
+    assert profiler.events_processed == engine.events_processed == 99
+
+    # the event at 500 is cancelled, the sample is taken at the next one
+    times = [sample.time_ns for sample in profiler.samples]
+    assert times == [0, 100, 200, 300, 400, 510, 600, 700, 800, 900]
+    assert profiler.samples[0].queue_size == 100  # without the event at 0
+    assert profiler.samples[-1].events_processed == 89
+    summary = profiler.summary()
+    assert summary["handlers"][0]["handler"].endswith("<lambda>")
+    assert len(summary["samples"]) == 10
+
+
+def test_profiled_batches() -> None:
+    """Test a profiled run with event batching, and its batch handler."""
+    expected_engine, expected = simulate(True)
+    profiler = Profiler()
+    calls: List[str] = []
+    profiler.before_dispatch.append(lambda ts, event_type, tid, payload: None)
+    profiler.after_dispatch.append(
+        lambda ts, event_type, tid, payload: calls.append(event_type)
+    )
+    engine, gpus = simulate(True, profiler, batch_events=True)
+
+    assert [list(gpu.end_times) for gpu in gpus] == [
+        list(gpu.end_times) for gpu in expected
+    ]
+    assert profiler.events_processed == engine.events_processed
+    assert engine.events_processed == expected_engine.events_processed
+    assert len(calls) == engine.events_processed
+    stats = {(row.event_type, row.handler): row for row in profiler.stats()}
+    assert stats["COMPUTE_DONE", "GPU.on_compute_done"].events == 8 * 9
+    assert stats["COMM_START", "Network.on_comm_start_batch"].events == 8 * 3
+
+
+def test_profiled_engine_loop() -> None:
+    """Test that a profiled run goes through the engine's loop: the events a
+    batch cancels are skipped, across a compaction of the queue.
+    """
+    engine = CompactSimulationEngine(batching=True)
+    code: int = register_event_type("TEST_EVENT")
+    engine.compact_threshold = 2
+    handled: List[int] = []
+
+    def on_event(ts: int, tid: int, payload: int) -> None:
+        handled.append(payload)
+        if payload == 0:
+            for handle in handles[1:4] + later:
+                engine.cancel(handle)
+
+    class Target:
+        def event_handlers(self) -> Dict[int, Handler]:
+            return {code: on_event}
+
+    engine.register_object(0, Target())
+    handles = [engine.post(10, code, 0, i) for i in range(5)]
+    later = [engine.post(20, code, 0, i) for i in range(5, 8)]
+    profiler = Profiler().attach(engine)
+    engine.run()
+    assert handled == [0, 4]
+    assert profiler.events_processed == engine.events_processed == 2
+    assert profiler.events_skipped == engine.events_skipped == 3
+    assert engine.pending_events() == 0
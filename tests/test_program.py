@@ -0,0 +1,176 @@
+import pytest
+from pathlib import Path
+from typing import List
+from gpu import GPU, Instruction
+from network import Network
+from program import (
+    INS_COMMUNICATION,
+    INS_COMPUTE,
+    Program,
+    StreamingProgram,
+    iter_input_lines,
+)
+from simulation_engine import CompactSimulationEngine
+
+TRACE = [
+    "COMPUTE, ALL, , 100000000, EXECUTE",
+    "COMPUTE, ALL, , 50000000, EXECUTE",
+    "COMMUNICATION, ALL, , 1048576, ALL_REDUCE",
+    "COMPUTE, ALL, , 30000000, EXECUTE",
+]
+
+
+def test_program_columns() -> None:
+    """Test that the trace is compiled to columns with a shared string table."""
+    program = Program.from_lines(TRACE)
+    assert len(program) == 4
+    assert list(program.ins_types) == [INS_COMPUTE] * 2 + [INS_COMMUNICATION, 0]
+    assert list(program.sizes) == [100000000, 50000000, 1048576, 30000000]
+    assert list(program.compute_indices) == [0, 1, 3]
+    assert list(program.comm_indices) == [2]
+    assert program.strings == ["EXECUTE", "ALL", "", "ALL_REDUCE"]
+    assert program.operation(2) == "ALL_REDUCE"
+    assert program.source(0) == "ALL"
+    assert program.destination(0) == ""
+
+
+def test_program_errors() -> None:
+    """Test that wrong instruction lines are rejected."""
+    with pytest.raises(ValueError):
+        Program.from_lines(["MEMCPY, ALL, , 10, COPY"])
+    with pytest.raises(AssertionError):
+        Program.from_lines(["COMPUTE, ALL, 10, EXECUTE"])
+
+
+def test_dependency_graph() -> None:
+    """Test the Id and depends-on columns and the compiled successor lists."""
+    program = Program.from_lines(
+        [
+            "COMPUTE, ALL, , 100, EXECUTE, fwd",
+            "COMMUNICATION, ALL, , 4096, ALL_REDUCE, ar, fwd",
+            "COMPUTE, ALL, , 100, EXECUTE, bwd, ar; fwd",
+            "COMPUTE, ALL, , 100, EXECUTE",
+        ]
+    )
+    assert program.has_dependencies
+    assert program.node_ids == {"fwd": 0, "ar": 1, "bwd": 2}
+    graph = program.dependency_graph()
+    assert program.dependency_graph() is graph
+    assert list(graph.in_degrees) == [0, 1, 2, 0]
+    assert list(graph.succ_offsets) == [0, 2, 3, 3, 3]
+    assert sorted(graph.successors[:2]) == [1, 2]
+    assert list(graph.roots[INS_COMPUTE]) == [0, 3]
+    assert list(graph.roots[INS_COMMUNICATION]) == []
+    assert not Program.from_lines(TRACE).has_dependencies
+
+    with pytest.raises(ValueError):
+        Program.from_lines(["COMPUTE, ALL, , 1, EXECUTE, a, b"]).dependency_graph()
+    with pytest.raises(ValueError):
+        Program.from_lines(
+            ["COMPUTE, ALL, , 1, EXECUTE, a, b", "COMPUTE, ALL, , 1, EXECUTE, b, a"]
+        ).dependency_graph()
+    with pytest.raises(ValueError):
+        Program.from_lines(
+            ["COMPUTE, ALL, , 1, EXECUTE, a", "COMPUTE, ALL, , 1, EXECUTE, a"]
+        )
+
+
+def test_gpus_share_program() -> None:
+    """Test that GPUs share the program but keep their own times."""
+    engine = CompactSimulationEngine()
+    network = Network(2, 2, 25, "ring", engine)
+    engine.register_object(network.object_id, network)
+    program = Program.from_lines(TRACE)
+    gpus = [GPU(i, program, 100 * (i + 1), 512, network, engine) for i in range(2)]
+    for gpu in gpus:
+        engine.register_object(gpu.gpu_id, gpu)
+        gpu.start_gpu()
+    engine.run()
+
+    assert gpus[0].program is gpus[1].program
+    assert list(gpus[0].end_times) == [1000, 1500, 41944, 1800]
+    assert list(gpus[1].end_times) == [500, 750, 41944, 900]
+    last: Instruction = gpus[1].finished_instructions[2]
+    assert (last.index, last.start_time_ns, last.end_time_ns) == (3, 750, 900)
+    assert last != gpus[0].instruction(3)
+    assert last == gpus[1].instruction(3)
+
+
+def test_iter_input_lines_mmap(tmp_path: Path) -> None:
+    """Test that the memory-mapped reader gives the same lines."""
+    path = tmp_path / "trace.txt"
+    path.write_text("# header\n\n" + "\n".join(TRACE) + "  # comment\n")
+    assert list(iter_input_lines(str(path))) == TRACE
+    assert list(iter_input_lines(str(path), use_mmap=True)) == TRACE
+    empty = tmp_path / "empty.txt"
+    empty.write_text("")
+    assert list(iter_input_lines(str(empty), use_mmap=True)) == []
+
+
+def test_streaming_program(tmp_path: Path) -> None:
+    """Test that a streamed trace gives the same results as a compiled one,
+    while keeping only a window of the trace in memory.
+    """
+    lines = TRACE * 500
+    path = tmp_path / "trace.txt"
+    path.write_text("\n".join(lines))
+    end_times = []
+    programs: List[Program] = [
+        Program.from_lines(lines),
+        StreamingProgram.from_file(str(path), lookahead=16),
+    ]
+    for program in programs:
+        engine = CompactSimulationEngine()
+        network = Network(2, 2, 25, "ring", engine)
+        engine.register_object(network.object_id, network)
+        gpus = [GPU(i, program, 200, 512, network, engine) for i in range(2)]
+        for gpu in gpus:
+            engine.register_object(gpu.gpu_id, gpu)
+            gpu.start_gpu()
+        if isinstance(program, StreamingProgram):
+            # only the first chunk of each type is loaded
+            assert len(program.compute_indices) == 16
+            assert len(program.comm_indices) == 16
+        engine.run()
+        end_times.append([gpu.end_times[len(lines) - 1] for gpu in gpus])
+        assert len(program) == len(lines)
+        assert engine.current_time_ns == 500 * 41944
+
+    assert end_times[0] == end_times[1]
+    streamed = programs[1]
+    assert len(streamed.sizes) <= 2 * 3 * 16
+
+
+def test_streaming_long_instruction(tmp_path: Path) -> None:
+    """Test that the times of a long compute instruction are kept while more
+    than `history` communication instructions finish.
+    """
+    lines = ["COMPUTE, ALL, , 100000000000, EXECUTE"]
+    lines += ["COMMUNICATION, ALL, , 1024, ALL_REDUCE"] * 5000
+    path = tmp_path / "trace.txt"
+    path.write_text("\n".join(lines))
+    times = []
+    programs: List[Program] = [
+        Program.from_lines(lines),
+        StreamingProgram.from_file(str(path), lookahead=16),
+    ]
+    for program in programs:
+        engine = CompactSimulationEngine()
+        network = Network(2, 2, 25, "ring", engine)
+        engine.register_object(network.object_id, network)
+        gpus = [GPU(i, program, 200, 512, network, engine) for i in range(2)]
+        for gpu in gpus:
+            engine.register_object(gpu.gpu_id, gpu)
+            gpu.start_gpu()
+        engine.run()
+        gpu = gpus[0]
+        # the compute instruction finishes last
+        assert gpu.finished_instructions.indices[-1] == 0
+        assert gpu.end_times[0] == engine.current_time_ns
+        times.append([(gpu.start_times[i], gpu.end_times[i]) for i in (0, 5000)])
+
+    assert times[0] == times[1]
+    assert times[1][0][0] == 0
+    streamed = programs[1]
+    assert isinstance(streamed, StreamingProgram)
+    assert len(gpus[0].end_times) == streamed.history
@@ -0,0 +1,95 @@
+import pytest
+from pathlib import Path
+from main import initialize_simulation
+from rank_trace import RankIndex, load_rank_programs, parse_ranks
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+# pipeline parallel: rank 0 runs the first stage, ranks 1-3 the second one
+TRACE = """# rank-tagged trace
+COMPUTE, ALL, , 1000000, EXECUTE
+COMPUTE, 0, , 2000000, EXECUTE  # first stage
+COMMUNICATION, 0, 1, 4096, SEND
+COMPUTE, 1-3, , 3000000, EXECUTE
+
+COMMUNICATION, ALL, , 1048576, ALL_REDUCE
+"""
+
+
+def test_parse_ranks() -> None:
+    """Test the Source field forms."""
+    assert parse_ranks("ALL") is None
+    assert parse_ranks(" ") is None
+    assert parse_ranks("2") == range(2, 3)
+    assert parse_ranks("1-3") == range(1, 4)
+    with pytest.raises(ValueError):
+        parse_ranks("GPU0")
+
+
+def test_rank_index(tmp_path: Path) -> None:
+    """Test that each rank reads the shared lines and its own ones, in file order."""
+    trace = tmp_path / "trace.txt"
+    trace.write_text(TRACE)
+    index = RankIndex.for_trace(str(trace))
+    assert (tmp_path / "trace.txt.idx").exists()
+    assert index.num_ranks == 4
+    assert not index.is_spmd
+    assert len(index.shared) == 2
+    assert list(index.iter_lines(str(trace), 0)) == [
+        "COMPUTE, ALL, , 1000000, EXECUTE",
+        "COMPUTE, 0, , 2000000, EXECUTE",
+        "COMMUNICATION, 0, 1, 4096, SEND",
+        "COMMUNICATION, ALL, , 1048576, ALL_REDUCE",
+    ]
+    assert len(list(index.iter_lines(str(trace), 2))) == 3
+
+    # the saved index is reused, and rebuilt when the trace changes
+    loaded = RankIndex.load(str(tmp_path / "trace.txt.idx"))
+    assert loaded.shared == index.shared and loaded.ranks == index.ranks
+    trace.write_text(TRACE + "COMPUTE, 3, , 10, EXECUTE\n")
+    assert len(RankIndex.for_trace(str(trace)).ranks[3]) == 2
+
+
+def test_rank_programs(tmp_path: Path) -> None:
+    """Test that ranks running the same slice share their program."""
+    trace = tmp_path / "trace.txt"
+    trace.write_text(TRACE)
+    programs = load_rank_programs(str(trace), 5)
+    assert len(programs[0]) == 4 and len(programs[1]) == 3
+    assert programs[1] is programs[2] is programs[3]
+    assert len(programs[4]) == 2  # shared lines only
+    with pytest.raises(ValueError):
+        load_rank_programs(str(trace), 3)
+
+
+def test_rank_trace_directory(tmp_path: Path) -> None:
+    """Test a directory with one trace file per rank."""
+    for rank in range(8):
+        lines = ["COMPUTE, ALL, , 1000000, EXECUTE"] * (rank + 1)
+        (tmp_path / f"rank_{rank}.txt").write_text("\n".join(lines))
+    engine, gpus = initialize_simulation(
+        str(tmp_path), str(REPO_DIR / "system_config.txt"), compact_events=True
+    )
+    for gpu in gpus:
+        gpu.start_gpu()
+    engine.run()
+    assert [len(gpu.finished_instructions) for gpu in gpus] == list(range(1, 9))
+
+
+def test_per_rank_simulation(tmp_path: Path) -> None:
+    """Test that each GPU runs only its slice of a rank-tagged trace."""
+    trace = tmp_path / "trace.txt"
+    trace.write_text(TRACE)
+    engine, gpus = initialize_simulation(
+        str(trace),
+        str(REPO_DIR / "system_config.txt"),
+        compact_events=True,
+        per_rank=True,
+    )
+    for gpu in gpus:
+        gpu.start_gpu()
+    engine.run()
+    assert len(gpus[0].finished_instructions) == 4
+    assert all(len(gpu.finished_instructions) == 3 for gpu in gpus[1:4])
+    assert all(len(gpu.finished_instructions) == 2 for gpu in gpus[4:])
+    assert gpus[0].program.operation(2) == "SEND"
@@ -0,0 +1,144 @@
+import csv
+import pytest
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+from gpu import GPU
+from main import build_simulation, read_input_files, read_system_config
+from program import INS_COMMUNICATION, INS_COMPUTE, Program, StreamingProgram
+
+np = pytest.importorskip("numpy")
+from results import Results  # noqa: E402
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def run(
+    programs: List[Program], array_backed: bool = False, **keys: str
+) -> Sequence[GPU]:
+    config: Dict[str, str] = read_system_config(str(REPO_DIR / "system_config.txt"))
+    config.update(keys, NUM_GPUS=str(len(programs)))
+    engine, gpus = build_simulation(programs, config, True, array_backed=array_backed)
+    for gpu in gpus:
+        gpu.start_gpu()
+    engine.run()
+    return gpus
+
+
+def union(intervals: List[Tuple[int, int]]) -> int:
+    """Length of the union of intervals, by merging them."""
+    total, reach = 0, 0
+    for start, end in sorted(intervals):
+        total += max(0, end - max(start, reach))
+        reach = max(reach, end)
+    return total
+
+
+def busy(gpu: GPU, ins_types: Tuple[int, ...]) -> int:
+    return union(
+        [
+            (gpu.start_times[i], gpu.end_times[i])
+            for i in gpu.finished_instructions.indices
+            if gpu.program.ins_types[i] in ins_types
+        ]
+    )
+
+
+def test_results_metrics() -> None:
+    """Test the vectorised metrics against a loop over the instructions."""
+    step = read_input_files(str(REPO_DIR / "gpu_trace.txt"))
+    program = Program.from_lines(step * 5)
+    gpus = run([program] * 8, COMPUTE_STREAMS="2", COMM_CHANNELS="2")
+    results = Results.from_gpus(gpus)
+
+    assert results.makespan_ns == max(max(gpu.end_times) for gpu in gpus)
+    assert results.finished.sum() == 8 * len(program)
+    for gpu_id, gpu in enumerate(gpus):
+        compute = busy(gpu, (INS_COMPUTE,))
+        comm = busy(gpu, (INS_COMMUNICATION,))
+        overlap = compute + comm - busy(gpu, (INS_COMPUTE, INS_COMMUNICATION))
+        assert results.busy_ns(INS_COMPUTE)[gpu_id] == compute
+        assert results.busy_ns(INS_COMMUNICATION)[gpu_id] == comm
+        assert results.overlap_ns()[gpu_id] == overlap > 0
+        assert results.exposed_comm_ns()[gpu_id] == comm - overlap
+        assert results.overlap_ratio()[gpu_id] == pytest.approx(overlap / comm)
+    # the streams overlap, the busy time is less than the sum of the durations
+    assert results.busy_ns(INS_COMPUTE)[0] < sum(
+        gpus[0].end_times[i] - gpus[0].start_times[i] for i in program.compute_indices
+    )
+    assert list(results.critical_ranks()) == list(range(8))
+    assert len(results.stragglers()) == 0
+
+    latency = results.latency_percentiles((50, 100))
+    assert set(latency) == {"EXECUTE", "ALL_REDUCE"}
+    durations = [gpus[0].end_times[i] - gpus[0].start_times[i] for i in range(4)]
+    assert latency["ALL_REDUCE"]["count"] == 8 * 5
+    assert latency["ALL_REDUCE"]["p50"] == durations[2]
+    assert latency["EXECUTE"]["p100"] == max(durations[:2] + durations[3:])
+    summary = results.summary()
+    assert summary["makespan_ns"] == results.makespan_ns
+    assert summary["latency_ns"] == results.latency_percentiles()
+
+
+def test_results_mpmd_stragglers() -> None:
+    """Test programs of different lengths and a straggler."""
+    step = read_input_files(str(REPO_DIR / "gpu_trace.txt"))
+    compute = [line for line in step if line.startswith("COMPUTE")]
+    short = Program.from_lines(compute)
+    long = Program.from_lines(compute * 3)
+    gpus = run([short, short, short, long])
+    results = Results.from_gpus(gpus)
+
+    assert results.start_ns.shape == (4, len(long))
+    assert list(results.finished.sum(axis=1)) == [3, 3, 3, 9]
+    assert list(results.finish_ns()) == [gpu.end_times[-1] for gpu in gpus]
+    assert list(results.critical_ranks()) == [3]
+    assert list(results.stragglers()) == [3]
+    # no communication, nothing to hide
+    assert list(results.overlap_ratio()) == [1.0] * 4
+    assert list(results.latency_percentiles()) == ["EXECUTE"]
+
+
+def test_results_array_backed() -> None:
+    """Test the results of array-backed GPUs, read from their arrays."""
+    step = read_input_files(str(REPO_DIR / "gpu_trace.txt"))
+    program = Program.from_lines(step * 3)
+    expected = Results.from_gpus(run([program] * 4))
+    results = Results.from_gpus(run([program] * 4, array_backed=True))
+    assert (results.end_ns == expected.end_ns).all()
+    assert (results.finished == expected.finished).all()
+    assert results.summary() == expected.summary()
+
+
+def test_results_streaming() -> None:
+    """Test that a streamed program, which forgets its instructions, is refused."""
+    program = StreamingProgram(str(REPO_DIR / "gpu_trace.txt"), 2)
+    gpus = run([program] * 2)
+    with pytest.raises(ValueError):
+        Results.from_gpus(gpus)
+
+
+def test_results_export(tmp_path: Path) -> None:
+    """Test the CSV export and, with pyarrow, the Parquet one."""
+    program = Program.from_lines(read_input_files(str(REPO_DIR / "gpu_trace.txt")))
+    gpus = run([program] * 2)
+    results = Results.from_gpus(gpus)
+
+    results.export(str(tmp_path / "results.csv"))
+    with open(tmp_path / "results.csv") as file:
+        rows = list(csv.DictReader(file))
+    assert len(rows) == 8
+    assert rows[2] == {
+        "gpu": "0",
+        "index": "2",
+        "type": "COMMUNICATION",
+        "operation": "ALL_REDUCE",
+        "size": "1048576",
+        "start_ns": str(gpus[0].start_times[2]),
+        "end_ns": str(gpus[0].end_times[2]),
+    }
+
+    pq = pytest.importorskip("pyarrow.parquet")
+    results.export(str(tmp_path / "results.parquet"))
+    table = pq.read_table(str(tmp_path / "results.parquet")).to_pydict()
+    assert table["operation"][2] == "ALL_REDUCE"
+    assert table["end_ns"] == [int(row["end_ns"]) for row in rows]
@@ -0,0 +1,96 @@
+import random
+import pytest
+from typing import List, Tuple
+from scheduler import CalendarQueue, HeapScheduler, Scheduler, TimeWheel
+from simulation_engine import CompactSimulationEngine, Event, SimulationEngine
+from network import Network
+from gpu import GPU
+
+
+@pytest.fixture(params=[HeapScheduler, CalendarQueue, TimeWheel])
+def scheduler(request: pytest.FixtureRequest) -> Scheduler:
+    """Provides an empty scheduler of each backend."""
+    sched: Scheduler = request.param()
+    return sched
+
+
+def test_scheduler_order(scheduler: Scheduler) -> None:
+    """Test that items pop in (timestamp, seq) order, also when pushing while popping."""
+    rng = random.Random(7)
+    now = 0
+    seq = 0
+    popped: List[Tuple[int, int]] = []
+    for _ in range(2000):
+        if len(scheduler) and rng.random() < 0.45:
+            item: Tuple[int, int] = scheduler.pop_next()
+            assert item[0] >= now
+            now = item[0]
+            popped.append(item)
+        else:
+            # dense near-uniform timestamps with many ties, and a few far ones
+            delay = rng.choice([0, 0, 1, 5, 50, 100, 100000])
+            scheduler.push(now + delay, (now + delay, seq))
+            seq += 1
+    while scheduler:
+        popped.append(scheduler.pop_next())
+    assert len(popped) == seq
+    assert popped == sorted(popped)
+
+
+def test_scheduler_empty(scheduler: Scheduler) -> None:
+    """Test that an empty scheduler is falsy and pop raises."""
+    assert not scheduler
+    with pytest.raises(IndexError):
+        scheduler.pop_next()
+
+
+def test_event_tie_break() -> None:
+    """Test that events at the same time run in the order they were scheduled."""
+    engine = SimulationEngine()
+    events = [Event(10, f"EVENT_{i}", 1, {}) for i in range(16)]
+    for event in events:
+        engine.schedule_event(event)
+    assert [engine.event_queue.pop_next() for _ in events] == events
+
+
+@pytest.mark.parametrize("scheduler_cls", [HeapScheduler, CalendarQueue, TimeWheel])
+def test_engine_schedulers_same_results(scheduler_cls: type) -> None:
+    """Test that every backend gives the same trace of the same simulation."""
+    instructions = [
+        "COMPUTE, ALL, , 100000000, EXECUTE",
+        "COMMUNICATION, ALL, , 1048576, ALL_REDUCE",
+        "COMPUTE, ALL, , 50000000, EXECUTE",
+        "COMMUNICATION, ALL, , 4096, ALL_REDUCE",
+    ]
+    engine = CompactSimulationEngine(scheduler_cls())
+    network = Network(4, 4, 25, "ring", engine)
+    engine.register_object(network.object_id, network)
+    gpus = [GPU(i, instructions, 200, 512, network, engine) for i in range(4)]
+    for gpu in gpus:
+        engine.register_object(gpu.gpu_id, gpu)
+        gpu.start_gpu()
+    engine.run()
+    finished = [
+        (gpu.gpu_id, ins.operation, ins.start_time_ns, ins.end_time_ns)
+        for gpu in gpus
+        for ins in gpu.finished_instructions
+    ]
+    assert finished[:4] == [
+        (0, "EXECUTE", 0, 500),
+        (0, "EXECUTE", 500, 750),
+        # ring all-reduce of 4 GPUs: 6 steps of a quarter of the buffer
+        (0, "ALL_REDUCE", 0, 62916),
+        (0, "ALL_REDUCE", 62916, 63162),
+    ]
+    assert len(finished) == 16
+
+
+def test_scheduler_is_abstract() -> None:
+    """Test that a backend must implement the whole interface."""
+
+    class Partial(Scheduler):
+        def push(self, timestamp: int, item: object) -> None:
+            pass
+
+    with pytest.raises(TypeError):
+        Partial()  # type: ignore[abstract]
@@ -0,0 +1,89 @@
+import pytest
+from pathlib import Path
+from typing import Dict
+from conftest import finished_times
+from main import build_simulation, read_input_files, read_system_config
+from program import Program
+from steady_state import program_period, run_steady_state
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def test_program_period() -> None:
+    """Test the period of repeated traces, with and without a partial tail."""
+    step = read_input_files(str(REPO_DIR / "gpu_trace.txt"))
+    assert program_period(Program.from_lines(step * 5)) == 4
+    assert program_period(Program.from_lines(step * 5 + step[:3])) == 4
+    assert program_period(Program.from_lines(step)) == 4
+    assert program_period(Program.from_lines(step[:2] + step)) == 6
+    assert program_period(Program()) == 0
+
+
+@pytest.mark.parametrize("mode", ["ANALYTIC", "DETAILED"])
+@pytest.mark.parametrize("collapse", [False, True])
+def test_extrapolation_matches_simulation(mode: str, collapse: bool) -> None:
+    """Test that the extrapolated iterations have the simulated times."""
+    config: Dict[str, str] = read_system_config(str(REPO_DIR / "system_config.txt"))
+    config["COLLECTIVE_MODE"] = mode
+    step = read_input_files(str(REPO_DIR / "gpu_trace.txt"))
+    program = Program.from_lines(step * 40 + step[:3])
+
+    engine, gpus = build_simulation([program] * 8, config, True, collapse=collapse)
+    for gpu in gpus:
+        gpu.start_gpu()
+    engine.run()
+    expected, end_time_ns, events = (
+        [sorted(times) for times in finished_times(gpus)],
+        engine.current_time_ns,
+        engine.events_processed,
+    )
+    network_state = gpus[0].network.save_state()
+
+    engine, gpus = build_simulation([program] * 8, config, True, collapse=collapse)
+    for gpu in gpus:
+        gpu.start_gpu()
+    result = run_steady_state(engine, gpus)
+    assert result.period_instructions == 4
+    assert result.period_ns == 73402  # the all-reduce, the longest stream
+    assert result.iterations == 41
+    assert result.simulated_iterations == 3
+    assert result.end_time_ns == engine.current_time_ns == end_time_ns
+    assert [sorted(times) for times in finished_times(gpus)] == expected
+    assert engine.events_processed < events
+    assert not engine.event_queue
+    # the state at the end of a simulation
+    assert gpus[0].network.save_state() == network_state
+    assert gpus[0].network.pending_collectives() == 0
+    simulated = [gpu for gpu in gpus if gpu.representative is gpu]
+    assert all(gpu.running_compute == gpu.running_comm == 0 for gpu in simulated)
+
+
+def test_dependencies_refused() -> None:
+    """Test that programs with dependencies are not extrapolated."""
+    config = read_system_config(str(REPO_DIR / "system_config.txt"))
+    program = Program.from_lines(
+        [
+            line
+            for k in range(10)
+            for line in (
+                f"COMPUTE, ALL, , 1000000, EXECUTE, fwd{k}",
+                f"COMMUNICATION, ALL, , 1048576, ALL_REDUCE, ar{k}, fwd{k}",
+            )
+        ]
+    )
+    engine, gpus = build_simulation([program] * 8, config, True)
+    with pytest.raises(ValueError):
+        run_steady_state(engine, gpus)
+
+
+def test_no_steady_state() -> None:
+    """Test that a trace without repetition is simulated normally."""
+    config = read_system_config(str(REPO_DIR / "system_config.txt"))
+    program = Program.from_lines(read_input_files(str(REPO_DIR / "gpu_trace.txt")))
+    engine, gpus = build_simulation([program] * 8, config, True)
+    for gpu in gpus:
+        gpu.start_gpu()
+    result = run_steady_state(engine, gpus)
+    assert result.period_ns == 0
+    assert result.end_time_ns == 73402
+    assert "No steady state" in str(result)
@@ -0,0 +1,57 @@
+import io
+import pytest
+from pathlib import Path
+from main import build_simulation, read_input_files, read_system_config
+from program import Program
+from sweep import expand_sweep, run_sweep, write_results
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def test_expand_sweep() -> None:
+    """Test the grid and list forms of a sweep."""
+    grid = expand_sweep({"grid": {"TOPOLOGY": ["RING", "TREE"], "NUM_GPUS": [4, 8]}})
+    assert grid == [
+        {"TOPOLOGY": "RING", "NUM_GPUS": "4"},
+        {"TOPOLOGY": "RING", "NUM_GPUS": "8"},
+        {"TOPOLOGY": "TREE", "NUM_GPUS": "4"},
+        {"TOPOLOGY": "TREE", "NUM_GPUS": "8"},
+    ]
+    assert expand_sweep({"configs": [{"NUM_GPUS": 2}]}) == [{"NUM_GPUS": "2"}]
+    with pytest.raises(ValueError):
+        expand_sweep({"points": []})
+
+
+def test_run_sweep() -> None:
+    """Test that the pool gives the results of serial runs, in order."""
+    trace = str(REPO_DIR / "gpu_trace.txt")
+    config = str(REPO_DIR / "system_config.txt")
+    points = expand_sweep(
+        {"grid": {"TOPOLOGY": ["RING", "TREE"], "NETWORK_BANDWIDTH": [25, 100]}}
+    )
+    rows = run_sweep(trace, config, points, workers=2)
+    assert [row["TOPOLOGY"] for row in rows] == ["RING", "RING", "TREE", "TREE"]
+
+    program = Program.from_lines(read_input_files(trace))
+    for point, row in zip(points, rows):
+        engine, gpus = build_simulation(
+            [program] * 8, dict(read_system_config(config), **point), True
+        )
+        for gpu in gpus:
+            gpu.start_gpu()
+        engine.run()
+        assert row["makespan_ns"] == engine.current_time_ns
+        assert row["events"] == engine.events_processed
+
+    # the collapse simulates one of the 8 identical GPUs, with the same times
+    collapsed = run_sweep(trace, config, points, workers=2, collapse=True)
+    for row, collapsed_row in zip(rows, collapsed):
+        assert collapsed_row["makespan_ns"] == row["makespan_ns"]
+        assert collapsed_row["compute_ns"] == row["compute_ns"]
+        assert collapsed_row["events"] < row["events"]
+
+    out = io.StringIO()
+    write_results(rows, out)
+    lines = out.getvalue().splitlines()
+    assert lines[0].startswith("TOPOLOGY,NETWORK_BANDWIDTH,makespan_ns,")
+    assert len(lines) == 5
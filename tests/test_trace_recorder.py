@@ -0,0 +1,129 @@
+import io
+import json
+import pytest
+from pathlib import Path
+from gpu import GPU
+from network import Network
+from simulation_engine import CompactSimulationEngine
+from trace_export import export_chrome, export_text
+from trace_recorder import TraceKind, TraceLevel, TraceRecorder, read_trace
+
+
+def test_recorder_off_by_default(gpu_instance: GPU) -> None:
+    """Test that the engine does not record anything by default."""
+    tracer: TraceRecorder = gpu_instance.engine.tracer
+    assert tracer.level == TraceLevel.OFF
+    gpu_instance.engine.register_object(0, gpu_instance)
+    gpu_instance.start_gpu()
+    assert tracer.num_buffered == 0
+
+
+def test_recorder_needs_a_file() -> None:
+    """Test that enabling the recorder without a trace file is an error."""
+    with pytest.raises(ValueError):
+        TraceRecorder(TraceLevel.EVENTS)
+
+
+def test_recorder_flushes_in_bulk(tmp_path: Path) -> None:
+    """Test that the buffer is written when it's full and on close."""
+    path = str(tmp_path / "trace.bin")
+    tracer = TraceRecorder(TraceLevel.EVENTS, path, capacity=4)
+    for i in range(10):
+        tracer.record(i % 3, TraceKind.COMPUTE_START, 100 * i, i)
+    assert tracer.num_records == 8  # two full buffers
+    assert tracer.num_buffered == 2
+    tracer.close()
+    records = list(read_trace(path))
+    assert records == [(i % 3, TraceKind.COMPUTE_START, 100 * i, i) for i in range(10)]
+
+
+def test_recorder_flush_reaches_the_file(tmp_path: Path) -> None:
+    """Test that flushed records can be read before close(), and that records
+    after a close() are appended.
+    """
+    path = str(tmp_path / "trace.bin")
+    tracer = TraceRecorder(TraceLevel.EVENTS, path)
+    tracer.record(0, TraceKind.COMPUTE_START, 0, 0)
+    tracer.flush()
+    assert list(read_trace(path)) == [(0, TraceKind.COMPUTE_START, 0, 0)]
+    tracer.close()
+    tracer.record(0, TraceKind.COMPUTE_END, 10, 0)
+    tracer.close()
+    assert list(read_trace(path)) == [
+        (0, TraceKind.COMPUTE_START, 0, 0),
+        (0, TraceKind.COMPUTE_END, 10, 0),
+    ]
+
+
+def test_simulation_trace_export(tmp_path: Path) -> None:
+    """Test the records of a run and both export formats."""
+    path = str(tmp_path / "trace.bin")
+    engine = CompactSimulationEngine()
+    engine.tracer = TraceRecorder(TraceLevel.EVENTS, path)
+    network = Network(1, 1, 25, "ring", engine)
+    engine.register_object(network.object_id, network)
+    instructions = [
+        "COMPUTE, ALL, , 100000000, EXECUTE",
+        "COMMUNICATION, 0, 1, 1048576, SEND",
+    ]
+    gpu = GPU(0, instructions, 200, 512, network, engine)
+    engine.register_object(0, gpu)
+    gpu.start_gpu()
+    # run() closes the trace file
+    engine.run()
+
+    assert list(read_trace(path)) == [
+        (0, TraceKind.COMPUTE_START, 0, 0),
+        (0, TraceKind.COMM_START, 0, 1),
+        (0, TraceKind.COMPUTE_END, 500, 0),
+        (0, TraceKind.COMM_END, 41944, 1),
+    ]
+
+    text = io.StringIO()
+    export_text(path, text)
+    assert text.getvalue().splitlines()[2] == "GPU 0 finished computing at 500"
+
+    chrome = io.StringIO()
+    export_chrome(path, chrome)
+    events = json.loads(chrome.getvalue())["traceEvents"]
+    phases = [
+        (e["name"], e["ph"], e["tid"], e["ts"], e["dur"])
+        for e in events
+        if e["ph"] != "M"
+    ]
+    assert phases == [
+        ("compute", "X", 0, 0, 0.5),
+        ("communication", "X", 1, 0, 41.944),
+    ]
+
+
+def test_chrome_threads_per_stream(tmp_path: Path) -> None:
+    """Test that overlapping instructions of a type are on different threads."""
+    path = str(tmp_path / "trace.bin")
+    tracer = TraceRecorder(TraceLevel.EVENTS, path)
+    for kind, ts, index in [
+        (TraceKind.COMPUTE_START, 0, 0),
+        (TraceKind.COMPUTE_START, 0, 1),
+        (TraceKind.COMPUTE_END, 300, 1),
+        (TraceKind.COMPUTE_START, 300, 2),
+        (TraceKind.COMPUTE_END, 500, 0),
+        (TraceKind.COMM_START, 500, 3),
+        (TraceKind.COMPUTE_END, 600, 2),
+    ]:
+        tracer.record(0, kind, ts, index)
+    tracer.close()
+
+    chrome = io.StringIO()
+    export_chrome(path, chrome)
+    events = json.loads(chrome.getvalue())["traceEvents"]
+    threads = [e["args"]["name"] for e in events if e["name"] == "thread_name"]
+    assert threads == ["compute", "compute 1", "communication"]
+    spans = [
+        (e["ph"], e["tid"], e["ts"], e.get("dur")) for e in events if e["ph"] != "M"
+    ]
+    assert spans == [
+        ("X", 2, 0, 0.3),
+        ("X", 0, 0, 0.5),
+        ("X", 2, 0.3, 0.3),
+        ("B", 1, 0.5, None),
+    ]
@@ -0,0 +1,136 @@
+"""Renders a binary trace file (see trace_recorder.py) as text or Chrome trace JSON.
+
+The JSON output can be opened in chrome://tracing or https://ui.perfetto.dev
+Usage:
+    python trace_export.py trace.bin --format text
+    python trace_export.py trace.bin --format chrome -o trace.json
+"""
+
+import argparse
+import json
+import sys
+from typing import Dict, Set, TextIO, Tuple
+from trace_recorder import TraceKind, read_trace
+
+TEXT_FORMATS: Dict[int, str] = {
+    TraceKind.COMPUTE_START: "GPU {gpu} started computing at {ts}",
+    TraceKind.COMPUTE_END: "GPU {gpu} finished computing at {ts}",
+    TraceKind.COMM_START: "GPU {gpu} started comm at {ts}",
+    TraceKind.COMM_END: "GPU {gpu} finished comm at {ts}",
+    TraceKind.NETWORK_SEND: "Network: GPU {gpu} starts sending instruction {index} at {ts}",
+}
+
+
+def export_text(trace_path: str, out: TextIO) -> None:
+    """Writes one line per record."""
+    for gpu, kind, ts, index in read_trace(trace_path):
+        out.write(TEXT_FORMATS[kind].format(gpu=gpu, ts=ts, index=index) + "\n")
+
+
+def export_chrome(trace_path: str, out: TextIO) -> None:
+    """Writes the Chrome trace event format, one process per GPU with a thread
+    per compute stream and communication channel. An instruction is a complete
+    ("X") event on the lowest thread of its type free when it started, the ones
+    not finished at the end of the trace are begin ("B") events. Timestamps are
+    in microseconds.
+    """
+    out.write('{"displayTimeUnit": "ns", "traceEvents": [\n')
+    first = True
+    seen_gpus: Set[int] = set()
+    # the threads of each GPU: 2 * lane for compute, 2 * lane + 1 for comm
+    busy: Dict[int, Set[int]] = {}
+    named: Set[Tuple[int, int]] = set()
+    # (GPU, instruction) running: its thread and start time
+    running: Dict[Tuple[int, int], Tuple[int, int]] = {}
+
+    def write(event: Dict[str, object]) -> None:
+        nonlocal first
+        out.write(("" if first else ",\n") + json.dumps(event))
+        first = False
+
+    def thread(gpu: int, comm: int) -> int:
+        tid = comm
+        while tid in busy[gpu]:
+            tid += 2
+        busy[gpu].add(tid)
+        if (gpu, tid) not in named:
+            named.add((gpu, tid))
+            name = "communication" if comm else "compute"
+            write(
+                _metadata(
+                    "thread_name", gpu, tid, f"{name} {tid // 2}" if tid > 1 else name
+                )
+            )
+        return tid
+
+    for gpu, kind, ts, index in read_trace(trace_path):
+        if gpu not in seen_gpus:
+            seen_gpus.add(gpu)
+            busy[gpu] = set()
+            write(_metadata("process_name", gpu, 0, f"GPU {gpu}"))
+        if kind in (TraceKind.COMPUTE_START, TraceKind.COMM_START):
+            comm = int(kind == TraceKind.COMM_START)
+            running[gpu, index] = (thread(gpu, comm), ts)
+        elif kind in (TraceKind.COMPUTE_END, TraceKind.COMM_END):
+            comm = int(kind == TraceKind.COMM_END)
+            tid, start = running.pop((gpu, index), (comm, ts))
+            busy[gpu].discard(tid)
+            write(
+                {
+                    "name": "communication" if comm else "compute",
+                    "ph": "X",
+                    "pid": gpu,
+                    "tid": tid,
+                    "ts": start / 1000,
+                    "dur": (ts - start) / 1000,
+                    "args": {"ins": index},
+                }
+            )
+        else:
+            tid = running.get((gpu, index), (1, ts))[0]
+            write(
+                {
+                    "name": "network send",
+                    "ph": "i",
+                    "s": "t",
+                    "pid": gpu,
+                    "tid": tid,
+                    "ts": ts / 1000,
+                    "args": {"ins": index},
+                }
+            )
+    for (gpu, index), (tid, start) in running.items():
+        write(
+            {
+                "name": "communication" if tid % 2 else "compute",
+                "ph": "B",
+                "pid": gpu,
+                "tid": tid,
+                "ts": start / 1000,
+                "args": {"ins": index},
+            }
+        )
+    out.write("\n]}\n")
+
+
+def _metadata(name: str, pid: int, tid: int, value: str) -> Dict[str, object]:
+    return {"name": name, "ph": "M", "pid": pid, "tid": tid, "args": {"name": value}}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export a simulation trace file.")
+    parser.add_argument("trace", help="binary trace file written by the simulator")
+    parser.add_argument("--format", choices=["text", "chrome"], default="text")
+    parser.add_argument("-o", "--output", help="output file, stdout by default")
+    args = parser.parse_args()
+
+    export = export_text if args.format == "text" else export_chrome
+    if args.output:
+        with open(args.output, "w") as out:
+            export(args.trace, out)
+    else:
+        export(args.trace, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Buffered binary recording of simulation events.
+
+Records are fixed-size binary structs (gpu_id, kind, timestamp_ns, instruction
+index) packed into a preallocated buffer, which is written to the trace file
+in bulk when it is full and at the end of the run. Recording is off by default;
+trace_export.py renders a trace file as text or Chrome/Perfetto trace JSON.
+"""
+
+import struct
+from enum import IntEnum
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+TRACE_MAGIC: bytes = b"TSIMTRC1"
+# gpu_id, kind, timestamp_ns, instruction index
+RECORD: struct.Struct = struct.Struct("<iiqq")
+
+
+class TraceLevel(IntEnum):
+    OFF = 0
+    EVENTS = 1  # start and end of every instruction on every GPU
+    DEBUG = 2  # also network internals
+
+
+class TraceKind(IntEnum):
+    COMPUTE_START = 0
+    COMPUTE_END = 1
+    COMM_START = 2
+    COMM_END = 3
+    NETWORK_SEND = 4  # DEBUG level, the network starts transferring the data
+
+
+class TraceRecorder:
+    def __init__(
+        self,
+        level: TraceLevel = TraceLevel.OFF,
+        path: Optional[str] = None,
+        capacity: int = 1 << 16,
+    ) -> None:
+        if level > TraceLevel.OFF and path is None:
+            raise ValueError("A trace file is needed when tracing is enabled")
+        # callers check `tracer.level >= TraceLevel.X` before recording
+        self.level: int = int(level)
+        self.path: Optional[str] = path
+        self.capacity: int = capacity  # number of records in the buffer
+        self.buffer: bytearray = bytearray(capacity * RECORD.size)
+        self.num_buffered: int = 0
+        self.num_records: int = 0
+        self._file: Optional[BinaryIO] = None
+
+    def record(self, gpu_id: int, kind: int, timestamp_ns: int, index: int) -> None:
+        """Appends one record to the buffer, flushing it when full."""
+        RECORD.pack_into(
+            self.buffer,
+            self.num_buffered * RECORD.size,
+            gpu_id,
+            kind,
+            timestamp_ns,
+            index,
+        )
+        self.num_buffered += 1
+        if self.num_buffered == self.capacity:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes the buffered records to the trace file."""
+        if self.num_buffered == 0 or self.path is None:
+            return
+        if self._file is None:
+            # reopened after a close() when the run goes on
+            self._file = open(self.path, "ab" if self.num_records else "wb")
+            if not self.num_records:
+                self._file.write(TRACE_MAGIC)
+        self._file.write(memoryview(self.buffer)[: self.num_buffered * RECORD.size])
+        self._file.flush()
+        self.num_records += self.num_buffered
+        self.num_buffered = 0
+
+    def close(self) -> None:
+        """Flushes the remaining records and closes the trace file, the engine
+        closes it at the end of run().
+        """
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_trace(path: str) -> Iterator[Tuple[int, int, int, int]]:
+    """Yields the records (gpu_id, kind, timestamp_ns, index) of a trace file."""
+    with open(path, "rb") as file:
+        if file.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise ValueError(f"{path} is not a simulation trace file")
+        while True:
+            chunk = file.read(RECORD.size * 4096)
+            if not chunk:
+                break
+            if len(chunk) % RECORD.size:
+                raise ValueError(f"Truncated record in {path}")
+            yield from RECORD.iter_unpack(chunk)